@@ -0,0 +1,200 @@
+"""
+End-to-end benchmark of the posting loop against local fakes of Instagram, Google Vision,
+OpenAI and Nominatim (see benchmarks/fakes.py).
+
+The real Poster, ImageManager, Scheduler, pipeline, preprocessor, caches and resilience
+layers run over N synthetic images. Schedule waits and post delays only move a virtual
+clock; the service latencies are really slept, times --scale.
+
+Usage:
+    python -m benchmarks.bench_end_to_end                        # 50 images, 5% of the latencies
+    python -m benchmarks.bench_end_to_end --images 500 --errors 0.05 --scale 0.1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+from PIL import Image
+
+import insta_auto_poster
+from insta_auto_poster import Poster, run_poster
+from google_api.google_image_analyzer import GoogleVisionImageAnalyzer, ResilientImageAnalyzer
+from google_api.label_cache import CachedImageAnalyzer
+from openai_api.openai_chatgpt import BatchingChatClient, OpenAIChatClient, ResilientChatClient
+from utils.geocoder import Geocoder
+from utils.image_manager import ImageManager
+from utils.location_cache import LocationCache
+from utils.metrics import metrics
+from utils.scheduler import Scheduler
+from benchmarks.fakes import (FakeInstagramClient, FakeNominatimSession, FakeOpenAI, FakeVisionClient,
+                              LatencyModel, VirtualClock)
+
+# Median and p95 latency in seconds of every fake call, before --scale
+LATENCIES = {
+    "login": (1.5, 4.0),
+    "location_search": (0.6, 2.0),
+    "photo_upload": (3.0, 8.0),
+    "timeline": (0.4, 1.2),
+    "label_detection": (0.4, 1.5),
+    "batch_annotate_images": (1.2, 3.5),
+    "chat": (1.5, 5.0),
+    "chat_batch": (2.5, 7.0),
+    "nominatim": (0.3, 1.0),
+}
+
+
+def make_images(folder, count, size, gps_ratio, rng):
+    """
+    Write `count` JPEGs, `gps_ratio` of them with GPS EXIF around Tbilisi.
+
+    The files are dated an hour back, so the run doesn't wait settle_time for them.
+    """
+    settled = time.time() - 3600
+    for index in range(count):
+        image = Image.new("RGB", size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        exif = Image.Exif()
+        if rng.random() < gps_ratio:
+            gps = exif.get_ifd(0x8825)
+            gps.update({1: "N", 2: (41.0, rng.uniform(40, 45), 0.0), 3: "E", 4: (44.0, rng.uniform(45, 52), 0.0)})
+        path = os.path.join(folder, f"img_{index:05d}.jpg")
+        image.save(path, quality=90, exif=exif)
+        os.utime(path, (settled, settled))
+
+
+def build_poster(work_dir, args, rng):
+    """
+    A Poster wired to the fakes through the same client layers as create_image_analyzer()
+    and create_chat_client().
+    """
+    def latency(name):
+        median, p95 = LATENCIES[name]
+        return LatencyModel(median, p95, error_rate=args.errors, scale=args.scale,
+                            rng=random.Random(rng.random()))
+
+    resilience = {"timeout": 30 * args.scale, "retries": 2, "backoff": args.scale, "backoff_max": 5 * args.scale,
+                  "failure_threshold": 5, "reset_timeout": 60 * args.scale}
+    fakes = {
+        "instagram": FakeInstagramClient({name: latency(name) for name in
+                                          ("login", "location_search", "photo_upload", "timeline")},
+                                         rng=random.Random(rng.random())),
+        "vision": FakeVisionClient(latency("label_detection"), latency("batch_annotate_images"),
+                                   rng=random.Random(rng.random())),
+        "openai": FakeOpenAI(latency("chat"), latency("chat_batch")),
+        "nominatim": FakeNominatimSession(latency("nominatim")),
+    }
+
+    analyzer = GoogleVisionImageAnalyzer("", client=fakes["vision"], timeout=resilience["timeout"])
+    analyzer = ResilientImageAnalyzer(analyzer, **resilience)
+    analyzer = CachedImageAnalyzer(analyzer, os.path.join(work_dir, "labels.sqlite"))
+
+    chat = OpenAIChatClient(api_key="benchmark", timeout=resilience["timeout"], max_retries=0)
+    chat.client = fakes["openai"]
+    chat = ResilientChatClient(chat, **resilience)
+    if args.chat_batch > 1:
+        chat = BatchingChatClient(chat, max_batch=args.chat_batch, window=0.5 * args.scale)
+
+    geocoder = Geocoder(cache_file=os.path.join(work_dir, "geocode.json"))
+    geocoder.session = fakes["nominatim"]
+
+    poster = Poster("benchmark", "benchmark", image_analyzer=analyzer, chat_client=chat, geocoder=geocoder,
+                    location_cache=LocationCache(os.path.join(work_dir, "locations.json")),
+                    default_location="Tbilisi", client=fakes["instagram"])
+    return poster, fakes
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the posting loop.")
+    parser.add_argument("--images", type=int, default=50, help="Synthetic images to post")
+    parser.add_argument("--size", type=int, nargs=2, default=(2000, 1500), metavar=("W", "H"))
+    parser.add_argument("--gps", type=float, default=0.8, help="Share of images with GPS EXIF")
+    parser.add_argument("--scale", type=float, default=0.05, help="Factor for the slept service latencies")
+    parser.add_argument("--errors", type=float, default=0.0, help="Error rate of every fake call")
+    parser.add_argument("--chat-batch", type=int, default=4, help="Captions per ChatGPT request")
+    parser.add_argument("--slots", nargs="*", default=["09:00-12:00", "18:00-22:00"], help="HH:MM-HH:MM")
+    parser.add_argument("--limit-per-slot", type=int, default=None)
+    parser.add_argument("--limit-per-day", type=int, default=None)
+    parser.add_argument("--delay", type=int, nargs=2, default=(60, 180), metavar=("MIN", "MAX"),
+                        help="Seconds between posts (virtual)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="Show the poster's output")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory(prefix="bench_e2e_") as work_dir:
+        folder = os.path.join(work_dir, "images")
+        os.makedirs(folder)
+        make_images(folder, args.images, tuple(args.size), args.gps, rng)
+
+        insta_auto_poster.PREPROCESS_CACHE_DIR = os.path.join(work_dir, "preprocessed")
+        clock = VirtualClock(datetime(2024, 1, 1, 8, 0))
+        scheduler = Scheduler([tuple(slot.split("-")) for slot in args.slots], delay_range=tuple(args.delay),
+                              clock=clock.now, limit_per_slot=args.limit_per_slot, limit_per_day=args.limit_per_day)
+
+        metrics.reset()
+        metrics.configure(enabled=True)
+        output = None if args.verbose else io.StringIO()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+            poster, fakes = build_poster(work_dir, args, rng)
+            poster.login()
+            iman = ImageManager(folder)
+            run_poster(poster, iman, scheduler, folder, sleep=clock.sleep)
+            iman.close()
+        wall = time.perf_counter() - started
+
+        summary = metrics.summary()
+        posted = len(fakes["instagram"].uploads)
+        report = {
+            "images": args.images,
+            "posted": posted,
+            "wall_seconds": round(wall, 2),
+            "posts_per_second": round(posted / wall, 2) if wall else None,
+            "virtual_hours": round(clock.slept / 3600, 2),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "stages": {name: timer for name, timer in summary["timers"].items()
+                       if name.startswith(("poster_stage_seconds", "pipeline_stage_wait_seconds"))},
+            "requests": {name: timer for name, timer in summary["timers"].items()
+                         if name.startswith(("instagram_request_seconds", "vision_request_seconds",
+                                             "chat_request_seconds"))},
+            "fake_calls": {
+                "instagram": {name: model.stats() for name, model in fakes["instagram"].latency.items()},
+                "vision": {"single": fakes["vision"].latency.stats(), "batch": fakes["vision"].batch_latency.stats()},
+                "openai": {"single": fakes["openai"].latency.stats(), "batch": fakes["openai"].batch_latency.stats()},
+                "nominatim": fakes["nominatim"].latency.stats(),
+            },
+        }
+        metrics.configure(enabled=False)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    print(f"Posted {report['posted']}/{report['images']} images in {report['wall_seconds']}s "
+          f"({report['posts_per_second']} posts/s), {report['virtual_hours']} virtual hours, "
+          f"peak RSS {report['peak_rss_mb']} MB")
+    print(f"\n{'timer':<72} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for section in ("stages", "requests"):
+        for name, timer in sorted(report[section].items()):
+            print(f"{name:<72} {timer['count']:>6} {timer['p50'] * 1000:>9.1f} "
+                  f"{timer['p95'] * 1000:>9.1f} {timer['max'] * 1000:>9.1f}")
+    print(f"\nFake calls: {json.dumps(report['fake_calls'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
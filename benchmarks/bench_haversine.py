@@ -0,0 +1,70 @@
+"""
+Micro-benchmark of the vectorized haversine_many / nearest_k against Python loops over the
+scalar formula.
+
+Usage:
+    python -m benchmarks.bench_haversine [n_points ...]   # default: 100000 1000000
+"""
+import math
+import random
+import sys
+import time
+import numpy as np
+
+from utils.utils import haversine, haversine_many, nearest_k
+
+
+def scalar_haversine(lat1, lon1, lat2, lon2):
+    """The pure-Python formula, for the loop baseline."""
+    R = 6371
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2)
+    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def timed(function, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    lat, lon = 41.7151, 44.8271
+    print(f"{'points':>10} {'operation':<34} {'ms':>10} {'ns/point':>10}")
+    for size in sizes:
+        lats = rng.uniform(-80, 80, size)
+        lons = rng.uniform(-180, 180, size)
+        lat_list, lon_list = lats.tolist(), lons.tolist()
+
+        rows = {
+            "python loop (scalar formula)": lambda: [scalar_haversine(lat, lon, a, b) for a, b in zip(lat_list, lon_list)],
+            "haversine_many": lambda: haversine_many(lat, lon, lats, lons),
+            "python min() nearest": lambda: min(range(size), key=lambda i: scalar_haversine(lat, lon, lat_list[i], lon_list[i])),
+            "nearest_k (k=1)": lambda: nearest_k(lat, lon, lats, lons, k=1),
+            "nearest_k (k=10)": lambda: nearest_k(lat, lon, lats, lons, k=10),
+        }
+        results = {}
+        for name, function in rows.items():
+            elapsed, results[name] = timed(function)
+            print(f"{size:>10} {name:<34} {elapsed * 1000:>10.2f} {elapsed * 1e9 / size:>10.1f}")
+
+        max_error = np.max(np.abs(np.array(results["python loop (scalar formula)"]) - results["haversine_many"]))
+        assert max_error < 1e-6, max_error
+        assert results["python min() nearest"] == results["nearest_k (k=1)"][0][0]
+
+    samples = [(random.uniform(-80, 80), random.uniform(-180, 180)) for _ in range(10000)]
+    elapsed, _ = timed(lambda: [haversine(lat, lon, a, b) for a, b in samples])
+    print(f"\nscalar haversine:                 {elapsed * 1e6 / len(samples):.2f} us/call")
+    elapsed, _ = timed(lambda: [float(haversine_many(lat, lon, a, b)) for a, b in samples])
+    print(f"haversine_many on one pair:       {elapsed * 1e6 / len(samples):.2f} us/call")
+    assert all(abs(haversine(lat, lon, a, b) - scalar_haversine(lat, lon, a, b)) < 1e-6 for a, b in samples)
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [100000, 1000000])
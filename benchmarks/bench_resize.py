@@ -0,0 +1,152 @@
+"""
+Benchmark of utils.resize_to_square against the previous full-decode implementation.
+
+Every implementation runs in a fresh process, so the peak RSS is not shared between them.
+
+Usage:
+    python -m benchmarks.bench_resize                 # synthetic 12 MP and 48 MP JPEGs
+    python -m benchmarks.bench_resize photo1.jpg ...  # your own images
+"""
+import argparse
+import multiprocessing
+import os
+import queue as queue_module
+import resource
+import tempfile
+import time
+import piexif
+from PIL import Image
+
+from utils.utils import resize_to_square
+
+
+def legacy_resize_to_square(image_path, size=1080):
+    """The implementation before the draft-mode fast path: full decode, rotate, crop, resize."""
+    img = Image.open(image_path).convert("RGB")
+
+    exif_dict = piexif.load(img.info['exif']) if 'exif' in img.info else {}
+    orientation_tag = piexif.ImageIFD.Orientation
+    if orientation_tag in exif_dict.get('0th', {}):
+        orientation = exif_dict['0th'][orientation_tag]
+        if orientation == 3:
+            img = img.rotate(180, expand=True)
+        elif orientation == 6:
+            img = img.rotate(270, expand=True)
+        elif orientation == 8:
+            img = img.rotate(90, expand=True)
+
+    width, height = img.size
+    if width != height:
+        smaller_side = min(width, height)
+        left = (width - smaller_side) / 2
+        top = (height - smaller_side) / 2
+        right = (width + smaller_side) / 2
+        bottom = (height + smaller_side) / 2
+        img = img.crop((left, top, right, bottom))
+
+    return img.resize((size, size), Image.BICUBIC)
+
+
+IMPLEMENTATIONS = {
+    "legacy": legacy_resize_to_square,
+    "fast": resize_to_square,
+}
+
+
+def make_sample(path, width, height):
+    """Write a camera-like JPEG (smooth content, EXIF orientation 6)."""
+    img = Image.effect_mandelbrot((width, height), (-2.2, -1.2, 1.0, 1.2), 64).convert("RGB")
+    exif = piexif.dump({"0th": {piexif.ImageIFD.Orientation: 6}})
+    img.save(path, quality=92, exif=exif)
+
+
+def _run(name, image_path, repeat, queue):
+    function = IMPLEMENTATIONS[name]
+    function(image_path)  # Warm up imports and codecs
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(image_path)
+    elapsed = (time.perf_counter() - start) / repeat
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+    queue.put((elapsed, peak_rss, result.tobytes()))
+
+
+def run_child(target, args, timeout):
+    """
+    Run target(*args) in a fresh process and wait for it; raise if it fails or hangs.
+    """
+    process = multiprocessing.get_context("spawn").Process(target=target, args=args)
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        raise TimeoutError(f"{target.__name__} did not finish within {timeout} seconds")
+    if process.exitcode != 0:
+        raise RuntimeError(f"{target.__name__} failed with exit code {process.exitcode}")
+
+
+def measure(name, image_path, repeat, timeout=600):
+    queue = multiprocessing.get_context("spawn").Queue()
+    process = multiprocessing.get_context("spawn").Process(target=_run, args=(name, image_path, repeat, queue))
+    process.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except queue_module.Empty:
+            # A child that died (e.g. on an unreadable image) never sends a result
+            if not process.is_alive():
+                raise RuntimeError(f"{name} on {image_path} failed with exit code {process.exitcode}")
+            if time.monotonic() > deadline:
+                process.terminate()
+                process.join()
+                raise TimeoutError(f"{name} on {image_path} did not finish within {timeout} seconds")
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"{name} on {image_path} failed with exit code {process.exitcode}")
+    return result
+
+
+def mean_abs_diff(pixels1, pixels2):
+    return sum(abs(a - b) for a, b in zip(pixels1[::97], pixels2[::97])) / len(pixels1[::97])
+
+
+def report(paths, repeat=3, timeout=600):
+    print(f"{'image':<28} {'impl':<8} {'ms/image':>10} {'peak RSS MB':>12} {'mean |diff|':>12}")
+    for path in paths:
+        results = {name: measure(name, path, repeat, timeout) for name in IMPLEMENTATIONS}
+        reference = results["legacy"][2]
+        for name, (elapsed, peak_rss, pixels) in results.items():
+            print(f"{os.path.basename(path):<28} {name:<8} {elapsed * 1000:>10.1f} {peak_rss / 1024:>12.1f} "
+                  f"{mean_abs_diff(reference, pixels):>12.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark resize_to_square against the full-decode version.")
+    parser.add_argument("paths", nargs="*", help="Images to resize, defaults to synthetic 12 MP and 48 MP JPEGs")
+    parser.add_argument("--repeat", type=int, default=3, help="Resizes per image and implementation")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds before a run is given up")
+    args = parser.parse_args(argv)
+
+    missing = [path for path in args.paths if not os.path.isfile(path)]
+    if missing:
+        parser.error(f"no such file: {', '.join(missing)}")
+    if args.paths:
+        report(args.paths, args.repeat, args.timeout)
+        return 0
+
+    with tempfile.TemporaryDirectory() as folder:
+        samples = []
+        for label, (width, height) in {"12mp": (4000, 3000), "48mp": (8000, 6000)}.items():
+            path = os.path.join(folder, f"sample_{label}.jpg")
+            # In a child process: RSS high-water marks survive fork/exec, the parent must stay small
+            run_child(make_sample, (path, width, height), args.timeout)
+            samples.append(path)
+        report(samples, args.repeat, args.timeout)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
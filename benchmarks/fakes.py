@@ -0,0 +1,214 @@
+"""
+Local stand-ins for Instagram, Google Vision, OpenAI and Nominatim, plus the virtual clock.
+
+Every fake call draws a latency from a LatencyModel and may fail with its error rate, so
+the real Poster / pipeline / resilience code can be benchmarked offline. Latencies are
+really slept (times `scale`) to exercise the concurrency; the schedule waits only move the
+VirtualClock.
+"""
+import json
+import math
+import random
+import threading
+from types import SimpleNamespace
+
+import requests
+from instagrapi.types import Location as InstagramLocation
+
+from utils.scheduler import VirtualClock  # Re-exported for the benchmarks
+
+
+class FakeServiceError(Exception):
+    """Error raised by a fake service."""
+
+
+class LatencyModel:
+    """
+    Log-normal latency with a given median and p95, plus a random error rate.
+    """
+
+    def __init__(self, median, p95=None, error_rate=0.0, scale=1.0, rng=None):
+        """
+        Parameters:
+            median (float): Median latency in seconds.
+            p95 (float, optional): 95th percentile in seconds, defaults to 3 x median.
+            error_rate (float): Probability that a call fails.
+            scale (float): Factor applied to the slept latency (e.g. 0.05 to run 20x faster).
+            rng (random.Random, optional): Random source, for reproducible runs.
+        """
+        self.median = median
+        self.sigma = math.log((p95 or 3 * median) / median) / 1.645 if median > 0 else 0.0
+        self.error_rate = error_rate
+        self.scale = scale
+        self.rng = rng or random.Random()
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._sleeper = threading.Event()
+
+    def sample(self):
+        with self._lock:
+            if self.median <= 0:
+                return 0.0
+            return self.median * math.exp(self.rng.gauss(0, self.sigma))
+
+    def call(self, name):
+        """
+        Wait for one call's latency, then fail with the error rate.
+        """
+        latency = self.sample()
+        with self._lock:
+            self.calls += 1
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if latency and self.scale:
+            self._sleeper.wait(latency * self.scale)
+        if fail:
+            raise FakeServiceError(f"{name}: simulated failure")
+
+    def stats(self):
+        return {"calls": self.calls, "errors": self.errors}
+
+
+class FakeInstagramClient:
+    """
+    Stand-in for instagrapi.Client: login, sessions, location_search and photo_upload.
+    """
+
+    def __init__(self, latency=None, rng=None):
+        """
+        Parameters:
+            latency (dict): LatencyModel per call ("login", "location_search", "photo_upload", "timeline").
+            rng (random.Random, optional): Random source for the venues.
+        """
+        latency = latency or {}
+        self.latency = {name: latency.get(name) or LatencyModel(0) for name in
+                        ("login", "location_search", "photo_upload", "timeline")}
+        self.rng = rng or random.Random()
+        self.settings = {}
+        self.uploads = []
+        self._lock = threading.Lock()
+
+    def login(self, username, password):
+        self.latency["login"].call("login")
+        self.settings = {"uuids": {"phone_id": "fake"}, "authorization_data": {"ds_user_id": username}}
+        return True
+
+    def load_settings(self, path):
+        with open(path, "r", encoding="utf-8") as file:
+            self.settings = json.load(file)
+
+    def dump_settings(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.settings, file)
+
+    def get_settings(self):
+        return dict(self.settings)
+
+    def set_settings(self, settings):
+        self.settings = dict(settings)
+
+    def set_uuids(self, uuids):
+        self.settings["uuids"] = uuids
+
+    def get_timeline_feed(self):
+        self.latency["timeline"].call("get_timeline_feed")
+        if not self.settings.get("authorization_data"):
+            raise FakeServiceError("login_required")
+        return {}
+
+    def location_search(self, lat, lng):
+        self.latency["location_search"].call("location_search")
+        venues = []
+        for index in range(10):
+            venues.append(InstagramLocation(
+                name=f"Venue {lat:.3f},{lng:.3f} #{index}",
+                external_id=int(abs(lat * 1e5)) * 100 + index,
+                external_id_source="facebook_places",
+                lat=lat + self.rng.uniform(-0.01, 0.01),
+                lng=lng + self.rng.uniform(-0.01, 0.01),
+            ))
+        return venues
+
+    def photo_upload(self, path, caption="", location=None):
+        self.latency["photo_upload"].call("photo_upload")
+        with open(path, "rb") as file:
+            size = len(file.read())
+        with self._lock:
+            self.uploads.append({"caption": caption, "location": getattr(location, "name", None), "bytes": size})
+        return SimpleNamespace(media_type=1, pk=len(self.uploads))
+
+
+class FakeVisionClient:
+    """
+    Stand-in for google.cloud.vision.ImageAnnotatorClient (label_detection, batch_annotate_images).
+    """
+
+    LABELS = ("Sky", "Cloud", "Tree", "Building", "Water", "Mountain", "Street", "Food", "Plant", "Travel")
+
+    def __init__(self, latency=None, batch_latency=None, rng=None):
+        self.latency = latency or LatencyModel(0)
+        self.batch_latency = batch_latency or self.latency
+        self.rng = rng or random.Random()
+
+    def _response(self):
+        labels = self.rng.sample(self.LABELS, 5)
+        return SimpleNamespace(error=SimpleNamespace(message=""),
+                               label_annotations=[SimpleNamespace(description=label) for label in labels])
+
+    def label_detection(self, image, timeout=None):
+        self.latency.call("label_detection")
+        return self._response()
+
+    def batch_annotate_images(self, requests, timeout=None):
+        self.batch_latency.call("batch_annotate_images")
+        return SimpleNamespace(responses=[self._response() for _ in requests])
+
+
+class FakeOpenAI:
+    """
+    Stand-in for the openai.OpenAI client: chat.completions.create, with batch prompts answered as JSON.
+    """
+
+    def __init__(self, latency=None, batch_latency=None):
+        self.latency = latency or LatencyModel(0)
+        self.batch_latency = batch_latency or self.latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _create(self, model, messages, max_tokens=100, temperature=0.7, n=1, **kwargs):
+        prompt = messages[-1]["content"]
+        batch = prompt.startswith("Answer each of the ")
+        (self.batch_latency if batch else self.latency).call("chat.completions.create")
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+
+        if batch:
+            count = int(prompt.split()[4])
+            content = json.dumps({"answers": [f"Fake caption {counter}.{index}" for index in range(count)]})
+        else:
+            content = f"\"Fake caption {counter}\""
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(content) // 4)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+class FakeNominatimSession:
+    """
+    Stand-in for the requests.Session used by the Geocoder.
+    """
+
+    def __init__(self, latency=None, places=None):
+        self.latency = latency or LatencyModel(0)
+        self.places = places or {"tbilisi": (41.7151, 44.8271)}
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        try:
+            self.latency.call("nominatim")
+        except FakeServiceError as e:
+            raise requests.ConnectionError(str(e))
+        place = self.places.get(str((params or {}).get("q", "")).casefold())
+        results = [{"lat": str(place[0]), "lon": str(place[1])}] if place else []
+        return SimpleNamespace(status_code=200, reason="OK", json=lambda: results)
@@ -1,9 +1,21 @@
 INSTAGRAM_USERNAME="alex_khristoforov"
 INSTAGRAM_PASSWORD=""
+INSTAGRAM_SESSION_DIR = "sessions"   # Saved Instagram sessions (<username>.json), reused instead of a full login
+SESSION_CHECK_INTERVAL = 1800        # Seconds during which a validated session is trusted without a new check
 
 INSTAGRAM_IMAGE_FOLDER="D://2.dev//1.src//InstaPoster//images"
 INSTAGRAM_DEFAULT_LOCATION="Tbilisi"
 INSTAGRAM_DEFAULT_LOCATION_RANGE=20
+INSTAGRAM_WATCH_FOLDER = False   # Keep running and post images added to the folder later
+WATCH_RECURSIVE = True           # Also post images from subfolders
+WATCH_POLL_INTERVAL = 60         # Seconds between folder rescans when watchdog is not installed
+WATCH_IDLE_SLEEP = 5             # Seconds between checks for new images when the queue is empty
+
+GEOCODE_CACHE_FILE = "geocode_cache.json"   # Persistent place name -> coordinates cache
+GEOCODE_CACHE_TTL = 90 * 24 * 3600          # Seconds before a cached place is looked up again
+GEOCODE_GAZETTEER_FILE = None               # Optional offline GeoNames file (e.g. cities15000.txt) or name,lat,lon CSV
+LOCATION_CACHE_FILE = "location_cache.jsonl"   # Instagram venues seen in earlier location searches
+LOCATION_CACHE_RADIUS_KM = 1.0                 # Use a cached venue within this distance instead of searching
 
 INSTAGRAM_POST_DELAY_RANGE = (150, 350)   # Random delay range between posts in seconds
 INSTAGRAM_POST_TIME_SLOTS = [  # Schedule configuration: list of (start_time, end_time) in "HH:MM" format
@@ -15,10 +27,53 @@ INSTAGRAM_POST_TIME_SLOTS = [  # Schedule configuration: list of (start_time, en
         ("01:15",  "02:00"),
         ("02:30",  "02:55")
     ]
-INSTAGRAM_POST_LIMIT_PER_SLOT = 15
+INSTAGRAM_POST_LIMIT_PER_SLOT = 15   # Max posts within one time slot
+INSTAGRAM_POST_LIMIT_PER_DAY = None  # Max posts per calendar day (None for no limit)
+
+PIPELINE_PREFETCH = 4   # Posts prepared ahead (location, tags, caption) while waiting for the next upload
+PIPELINE_STAGE_LIMITS = {   # Max concurrent calls per preparation stage
+    "load": 2,
+    "encode": 2,
+    "location": 1,
+    "vision": 2,
+    "caption": 4,   # Keep >= CHAT_BATCH_SIZE so captions can be batched
+}
+
+PREPROCESS_CACHE_DIR = "preprocessed"   # Upload-ready 1080x1080 JPEGs, named by the content hash of the original
+PREPROCESS_WORKERS = None               # Worker processes for preprocessing (None = number of cores)
+PREPROCESS_BATCH_SIZE = 32              # Queued images preprocessed together
+JOB_MAX_ATTEMPTS = 3                    # Failed preparations of a post before its job is failed for the operator
+
+IMAGE_DEDUP_PERCEPTUAL_HASH = False   # Also skip visually similar (re-exported, recompressed) images
+
+# Accounts for multi_account_runner.py; missing keys fall back to the single-account settings above
+INSTAGRAM_ACCOUNTS = [
+    {
+        "username": INSTAGRAM_USERNAME,
+        "password": INSTAGRAM_PASSWORD,
+        "image_folder": INSTAGRAM_IMAGE_FOLDER,
+        # "default_location": "Tbilisi",
+        # "time_slots": [("08:00", "10:00")],
+        # "delay_range": (150, 350),
+        # "limit_per_slot": 15,
+        # "limit_per_day": None,
+        # "ledger_name": "log.jsonl",   # Use different names if accounts share a folder
+        # "watch_folder": False,
+    },
+]
+ACCOUNT_MAX_RESTARTS = 5            # Restarts of a failed account before it is given up
+ACCOUNT_RESTART_BACKOFF = (60, 3600)   # Min and max seconds between restarts (doubling)
+
+METRICS_ENABLED = False       # Stage timers and counters (see utils/metrics.py); near-zero cost when off
+METRICS_PORT = None           # Serve Prometheus text on http://<host>:<port>/metrics, e.g. 9108
+METRICS_JSONL_FILE = None     # Append every observation as a JSON line, e.g. "metrics.jsonl"
+METRICS_LOG = False           # Also print every observation as a JSON log line
 
 USE_AI=True
 GOOGLE_CREDENTIALS_PASS = ".json"
+VISION_LABEL_CACHE = "vision_labels.sqlite"   # Shared label cache keyed by image content (None to disable)
+VISION_LABEL_CACHE_TTL = 30 * 24 * 3600       # Seconds before cached labels expire
+VISION_LABEL_CACHE_MAX_ENTRIES = 100000       # Least recently used labels are evicted above this
 OPENAI_API_KEY=""
 OPENAI_API_SETTINGS = {
     "model": "gpt-4",
@@ -27,3 +82,29 @@ OPENAI_API_SETTINGS = {
     "temperature": 0.9,     # Adjust creativity (0.0-1.0)
     "n": 1                  # Number of responses
 }
+CHAT_BATCH_SIZE = 4        # Captions of concurrently prepared posts requested in one call (1 disables batching)
+CHAT_BATCH_WINDOW = 0.5    # Seconds to wait for more captions before sending a partial batch
+CAPTION_CACHE = "captions.sqlite"   # Shared answer cache keyed by the normalized prompt and model settings (None to disable)
+CAPTION_CACHE_VARIANTS = 3          # Different captions collected per prompt before cached ones are reused
+CAPTION_CACHE_MAX_ENTRIES = 50000   # Least recently used prompts are evicted above this
+
+# Timeouts, retries and circuit breakers of the AI clients (None disables the layer).
+# When a service keeps failing the post goes out without tags / caption instead of blocking the slot.
+VISION_RESILIENCE = {
+    "timeout": 20,              # Seconds per request
+    "deadline": 60,             # Seconds for a call including retries
+    "retries": 2,               # Extra attempts, with jittered exponential backoff
+    "backoff": 1.0,             # Base backoff in seconds
+    "hedge_after": None,        # Seconds before a second, hedged request is sent (None disables hedging)
+    "failure_threshold": 5,     # Failed calls in a row that open the circuit
+    "reset_timeout": 300,       # Seconds before a trial call after the circuit opened
+}
+CHAT_RESILIENCE = {
+    "timeout": 30,
+    "deadline": 90,
+    "retries": 2,
+    "backoff": 1.0,
+    "hedge_after": None,        # Opt-in: a hedged request is paid twice, and batches often take over 10 s
+    "failure_threshold": 5,
+    "reset_timeout": 300,
+}
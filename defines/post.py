@@ -1,6 +1,7 @@
-from PIL.ExifTags import TAGS, GPSTAGS
 from PIL import Image
 from utils.utils import resize_to_square
+from utils.exif import TAG_GPS_IFD, gps_to_lat_lng, read_exif
+from utils.fingerprint import file_sha256
 import os
 import io
 
@@ -10,72 +11,127 @@ def extract_location_from_metadata(image):
     Returns None if no GPS metadata is available.
     """
     try:
-        exif_data = image._getexif()
-        if not exif_data:
-            return None
-
-        gps_info = {}
-        for tag, value in exif_data.items():
-            decoded_tag = TAGS.get(tag, tag)
-            if decoded_tag == "GPSInfo":
-                for t in value:
-                    sub_decoded = GPSTAGS.get(t, t)
-                    gps_info[sub_decoded] = value[t]
-                break
-
-        if "GPSLatitude" in gps_info and "GPSLongitude" in gps_info:
-            lat = convert_to_degrees(gps_info["GPSLatitude"])
-            if gps_info.get("GPSLatitudeRef") == "S":
-                lat = -lat
-
-            lon = convert_to_degrees(gps_info["GPSLongitude"])
-            if gps_info.get("GPSLongitudeRef") == "W":
-                lon = -lon
-
+        gps_info = image.getexif().get_ifd(TAG_GPS_IFD)
+        coordinates = gps_to_lat_lng(gps_info) if gps_info else None
+        if coordinates:
             # Return as a dictionary compatible with instagrapi
-            return {"lat": lat, "lng": lon}
+            return {"lat": coordinates[0], "lng": coordinates[1]}
 
     except Exception as e:
         print(f"Error extracting metadata: {e}")
 
     return None
 
-def convert_to_degrees(value):
-    """
-    Converts GPS coordinates stored as degrees, minutes, and seconds
-    to decimal degrees.
-    """
-    d, m, s = value
-    return d + (m / 60.0) + (s / 3600.0)
-
 class Post:
     """
     Represents a single Instagram post.
+
+    A post made from a path is a small record: path, file size, mtime, content hash and GPS
+    coordinates, taken from the metadata index or read from the EXIF header only. The pixels
+    are decoded on first access of `image` and dropped again once the post is encoded, so a
+    backlog of prepared posts holds JPEG bytes at most, not decoded images or open files.
     """
 
-    def __init__(self, image_data, location=None, description=""):
+    __slots__ = ("_image_path", "_size", "_mtime", "_sha256", "_gps", "_orientation", "_image", "_square",
+                 "_prebaked", "_encoded", "_location", "_labels", "_description")
+
+    def __init__(self, image_data, location=None, description="", sha256=None, metadata=None):
+        """
+        Parameters:
+            image_data (str, PIL.Image or BytesIO): Image path, decoded image or encoded bytes.
+            location (dict, optional): {"lat", "lng"} instead of the EXIF GPS.
+            description (str): Caption.
+            sha256 (str, optional): Content hash of the file, if already known.
+            metadata (dict, optional): Entry of the MetadataIndex for the path, saves reading the header.
+        """
+        self._image_path = None
+        self._size = None
+        self._mtime = None
+        self._sha256 = sha256
+        self._orientation = None
+        self._image = None
         if isinstance(image_data, str):
-            self._image = Image.open(image_data)
+            if metadata is None:
+                stat = os.stat(image_data)
+                metadata = dict(read_exif(image_data), size=stat.st_size, mtime=stat.st_mtime)
             self._image_path = image_data
+            self._size = metadata["size"]
+            self._mtime = metadata["mtime"]
+            self._orientation = metadata["orientation"] or 1
         elif isinstance(image_data, Image.Image):
             self._image = image_data
-            self._image_path = None
         elif isinstance(image_data, io.BytesIO):
             self._image = Image.open(image_data)
-            self._image_path = None
         else:
             raise ValueError("image_data must be a path, image object, or BytesIO object")
 
+        if location:
+            self._gps = (location["lat"], location["lng"])
+        elif self._image_path:
+            self._gps = metadata["gps"]
+        else:
+            raw_location = extract_location_from_metadata(self._image)
+            self._gps = (raw_location["lat"], raw_location["lng"]) if raw_location else None
+
         self._description = description
-        self._raw_location = location or extract_location_from_metadata(self._image)
         self._location = None  # Placeholder for an instagrapi-compatible location object
+        self._labels = None  # Picture tags from the image analyzer
+        self._encoded = None  # JPEG bytes shared by the analyzer and the uploader
+        self._square = False  # Pixels are cropped and resized to 1080x1080 when decoded
+        self._prebaked = False  # The file is already an upload-ready JPEG
 
 
+    @classmethod
+    def from_prebaked(cls, baked_path, location=None, sha256=None):
+        """
+        Create a post from an upload-ready square JPEG; its bytes are uploaded as they are.
+        """
+        post = cls(baked_path, location=location, sha256=sha256)
+        post._prebaked = True
+        return post
+
     def resize_to_square(self):
-         self._image = resize_to_square(self._image, 1080)
+        if self._image_path:
+            self._image = None  # Decoded straight to the square on first access
+        else:
+            self._image = resize_to_square(self._image, 1080)
+        self._square = True
+        self._encoded = None
+        self._prebaked = False
+
+    def encode(self):
+        """
+        Encode the image to JPEG once; the analyzer and the uploader share the same bytes.
+        """
+        if self._encoded is None and self._prebaked:
+            with open(self._image_path, "rb") as image_file:
+                self._encoded = image_file.read()
+        elif self._encoded is None:
+            buffer = io.BytesIO()
+            self.image.save(buffer, format="JPEG")
+            self._encoded = buffer.getvalue()
+            if self._image_path:
+                self._image = None  # Decoded again from the file if it is ever needed
+        return self._encoded
+
+    def release_encoded(self):
+        """
+        Drop the encoded JPEG after the upload.
+        """
+        self._encoded = None
 
     @property
     def image(self):
+        """
+        The decoded image, loaded from the file on first access.
+        """
+        if self._image is None and self._image_path:
+            with Image.open(self._image_path) as img:
+                if self._square:
+                    self._image = resize_to_square(img, 1080, orientation=self._orientation)
+                else:
+                    img.load()
+                    self._image = img
         return self._image
 
     @property
@@ -88,6 +144,39 @@ class Post:
             return os.path.basename(self._image_path)
         return "Untitled"
 
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def mtime(self):
+        return self._mtime
+
+    @property
+    def sha256(self):
+        """
+        SHA-256 of the file, computed on first access unless it was passed in.
+        """
+        if self._sha256 is None and self._image_path:
+            self._sha256 = file_sha256(self._image_path)
+        return self._sha256
+
+    @property
+    def gps(self):
+        """
+        (lat, lng) from the EXIF header or the given location, or None.
+        """
+        return self._gps
+
+    @property
+    def raw_location(self):
+        """
+        GPS coordinates as an instagrapi-compatible dict, or None.
+        """
+        if self._gps is None:
+            return None
+        return {"lat": self._gps[0], "lng": self._gps[1]}
+
     @property
     def location(self):
         return self._location
@@ -96,6 +185,14 @@ class Post:
     def location(self, location):
        self._location=location
 
+    @property
+    def labels(self):
+        return self._labels
+
+    @labels.setter
+    def labels(self, labels):
+        self._labels = labels
+
     @property
     def description(self):
         return self._description
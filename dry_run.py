@@ -0,0 +1,297 @@
+import argparse
+import contextlib
+import io
+import shutil
+import tempfile
+from types import SimpleNamespace
+from PIL import Image
+from insta_auto_poster import *
+from utils.fingerprint import FingerprintCache
+
+
+class DryRunClient:
+    """
+    Stand-in for the instagrapi Client: logs in and "uploads" without sending any request.
+    """
+
+    def __init__(self, clock):
+        """
+        Parameters:
+            clock (VirtualClock): Simulation clock, to time-stamp the uploads.
+        """
+        self.clock = clock
+        self.uploads = []
+
+    def login(self, username, password):
+        return True
+
+    def logout(self):
+        return True
+
+    def get_timeline_feed(self):
+        return {}
+
+    def load_settings(self, path):
+        pass
+
+    def dump_settings(self, path):
+        pass
+
+    def get_settings(self):
+        return {}
+
+    def set_settings(self, settings):
+        pass
+
+    def set_uuids(self, uuids):
+        pass
+
+    def location_search(self, lat, lng):
+        return []
+
+    def photo_upload(self, path, caption="", location=None):
+        self.uploads.append(self.clock.now())
+        return SimpleNamespace(media_type=1)
+
+
+class OfflineGeocoder:
+    """
+    Geocoder that never calls Nominatim; posts without GPS get the "Unknown" location.
+    """
+
+    def get_coordinates(self, location_name):
+        return None, None
+
+
+class ReplayPreprocessor:
+    """
+    Stand-in for ImagePreprocessor: hands the queued paths on as they are, nothing is decoded or baked.
+    """
+
+    def preprocess(self, source_paths):
+        return list(source_paths)
+
+    def get(self, source_path):
+        return {"sha256": None, "baked": source_path, "location": None}
+
+    def metadata(self, source_path):
+        return None
+
+
+def load_placeholder(file_path):
+    """
+    Post of a single pixel in place of the image; the upload is stubbed, so the pixels don't matter.
+    """
+    return Post(Image.new("RGB", (1, 1)))
+
+
+def slot_capacity(scheduler, slots, post_times):
+    """
+    Max posts of every slot occurrence: spaced by the minimum delay, within the slot and day budgets.
+
+    The posts that were made are counted first; what is left of a day budget goes to the
+    slots of that day in order.
+
+    Parameters:
+        scheduler (Scheduler): Schedule and budgets.
+        slots (list): (start, end) datetimes from Scheduler.slots_between(), in order.
+        post_times (list): Datetimes of the posts made.
+
+    Returns:
+        list: Capacity per slot, None if nothing limits it.
+    """
+    min_delay = scheduler.delay_range[0]
+    day_left = {}
+    if scheduler.limit_per_day is not None:
+        for when in post_times:
+            day_left[when.date()] = day_left.get(when.date(), scheduler.limit_per_day) - 1
+
+    capacities = []
+    for start, end in slots:
+        # A slot crossing midnight is split, every part draws on the budget of its own day
+        parts = []
+        while start.date() < end.date():
+            midnight = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+            parts.append((start, midnight - timedelta(microseconds=1)))
+            start = midnight
+        parts.append((start, end))
+
+        capacity = 0
+        for part_start, part_end in parts:
+            posts = sum(1 for when in post_times if part_start <= when <= part_end)
+            extra = int((part_end - part_start).total_seconds() // min_delay) + 1 - posts if min_delay > 0 else None
+            if scheduler.limit_per_day is not None:
+                left = max(0, day_left.setdefault(part_start.date(), scheduler.limit_per_day))
+                extra = left if extra is None else min(max(0, extra), left)
+                day_left[part_start.date()] = left - extra
+            capacity = None if capacity is None or extra is None else capacity + posts + max(0, extra)
+        if scheduler.limit_per_slot is not None:
+            capacity = scheduler.limit_per_slot if capacity is None else min(capacity, scheduler.limit_per_slot)
+        capacities.append(capacity)
+    return capacities
+
+
+def simulate(folder_path, schedule_config, delay_range, limit_per_slot=None, limit_per_day=None, start=None,
+             ledger_name="log.jsonl", verbose=False):
+    """
+    Replay the posting loop for the backlog of a folder under a virtual clock, with stubbed uploads.
+
+    The real Scheduler, ImageManager and run_poster() run; the Instagram client, the AI
+    clients, the geocoder and the preprocessing are replaced by offline stand-ins, so no image
+    is decoded, and every wait only advances the clock. The ledger and the fingerprint cache are
+    copied and the job store and pending queue live in a temporary directory, so the real state
+    of the folder is left as it is. Only new files are read, to match them against the ledger.
+
+    Parameters:
+        folder_path (str): Image folder.
+        schedule_config (list): Time slots [(start, end), ...] in "HH:MM" format.
+        delay_range (tuple): Min and max seconds between posts.
+        limit_per_slot (int, optional): Max posts within one slot.
+        limit_per_day (int, optional): Max posts per calendar day.
+        start (datetime, optional): Start of the simulation, defaults to now.
+        ledger_name (str): Ledger of the account, see ImageManager.
+        verbose (bool): Show the output of the posting loop.
+
+    Returns:
+        dict: Timeline of the posts, capacity of every slot and totals; times in ms.
+    """
+    start = (start or datetime.now()).replace(microsecond=0)
+    clock = VirtualClock(start)
+    scheduler = Scheduler(schedule_config=schedule_config, delay_range=delay_range, clock=clock.now,
+                          limit_per_slot=limit_per_slot, limit_per_day=limit_per_day)
+
+    with tempfile.TemporaryDirectory(prefix="dry_run_") as state_dir:
+        for name in (ledger_name, ".fingerprints.jsonl"):
+            if os.path.exists(os.path.join(folder_path, name)):
+                shutil.copyfile(os.path.join(folder_path, name), os.path.join(state_dir, name))
+        # An absolute ledger name puts the ledger outside the folder
+        iman = ImageManager(folder_path, ledger_name=os.path.join(state_dir, ledger_name),
+                            fingerprints=FingerprintCache(os.path.join(state_dir, ".fingerprints.jsonl")))
+        already_posted = len(iman.ledger)
+
+        client = DryRunClient(clock)
+        poster = Poster("dry-run", "", image_analyzer=EmptyImageAnalyzer(), chat_client=EmptyChatClient(),
+                        geocoder=OfflineGeocoder(), location_cache=LocationCache(), client=client)
+
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(None if verbose else io.StringIO()):
+            poster.login()
+            try:
+                run_poster(poster, iman, scheduler, folder_path, sleep=clock.sleep, state_dir=state_dir,
+                           preprocessor=ReplayPreprocessor(), load=load_placeholder,
+                           settle_time=0)  # Never wait in real time for recently changed files
+            finally:
+                iman.close()
+        elapsed = time.perf_counter() - started
+        posted = iman.ledger.entries()[already_posted:]
+
+    def offset_ms(when):
+        return int((when - start).total_seconds() * 1000)
+
+    timeline = []
+    for entry in posted:
+        when = datetime.fromisoformat(entry["posted_at"])
+        timeline.append({"image": entry.get("image_name"), "time": when.isoformat(timespec="seconds"),
+                         "offset_ms": offset_ms(when)})
+
+    # Slots from the start until the end of the slot of the last post (or one day if nothing was posted)
+    last = datetime.fromisoformat(timeline[-1]["time"]) if timeline else start + timedelta(days=1)
+    last_slot = scheduler.current_slot(last)
+    slots = scheduler.slots_between(start, last_slot[1] if last_slot else last)
+    post_times = [datetime.fromisoformat(post["time"]) for post in timeline]
+    slot_report = []
+    for (slot_start, slot_end), capacity in zip(slots, slot_capacity(scheduler, slots, post_times)):
+        count = sum(1 for when in post_times if slot_start <= when <= slot_end)
+        slot_report.append({
+            "start": slot_start.isoformat(timespec="seconds"),
+            "end": slot_end.isoformat(timespec="seconds"),
+            "duration_ms": offset_ms(slot_end) - offset_ms(slot_start),
+            "posts": count,
+            "capacity": capacity,
+            "unused": None if capacity is None else max(0, capacity - count),
+        })
+
+    capacities = [slot["capacity"] for slot in slot_report]
+    total_capacity = None if None in capacities else sum(capacities)
+    return {
+        "start": start.isoformat(timespec="seconds"),
+        "end": clock.now().isoformat(timespec="seconds"),
+        "simulated_ms": offset_ms(clock.now()),
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "posts": timeline,
+        "slots": slot_report,
+        "capacity": total_capacity,
+        "used": len(timeline),
+        "unused": None if total_capacity is None else sum(slot["unused"] for slot in slot_report),
+    }
+
+
+def print_report(report):
+    print("Timeline:")
+    for post in report["posts"]:
+        print(f"  {post['time']}  +{post['offset_ms'] / 3600000:8.2f}h  {post['image']}")
+
+    print("\nSlots:")
+    for slot in report["slots"]:
+        capacity = "-" if slot["capacity"] is None else slot["capacity"]
+        unused = "-" if slot["unused"] is None else slot["unused"]
+        print(f"  {slot['start']} - {slot['end'][11:]}  posts {slot['posts']:>3}  capacity {capacity:>4}  unused {unused:>4}")
+
+    capacity = "unlimited" if report["capacity"] is None else report["capacity"]
+    unused = "" if report["unused"] is None else f", {report['unused']} unused"
+    print(f"\n{report['used']} posts from {report['start']} to {report['end']} "
+          f"({report['simulated_ms'] / 3600000:.2f}h simulated in {report['elapsed_ms']:.0f} ms); "
+          f"slot capacity {capacity}{unused}")
+
+
+def main(argv=None):
+    """
+    Simulate the schedule of the configuration (or of one account) without posting.
+
+    Example:
+        python dry_run.py --slots 09:00-12:00 18:00-21:00 --limit-per-slot 3
+        python dry_run.py --account my_account --start "2024-06-01 08:00"
+    """
+    parser = argparse.ArgumentParser(description="Replay the posting schedule under a virtual clock.")
+    parser.add_argument("--account", help="Take the folder and the schedule from this INSTAGRAM_ACCOUNTS entry")
+    parser.add_argument("--folder", help="Image folder")
+    parser.add_argument("--slots", nargs="+", metavar="HH:MM-HH:MM", help="Time slots")
+    parser.add_argument("--delay", type=int, nargs=2, metavar=("MIN", "MAX"), help="Seconds between posts")
+    parser.add_argument("--limit-per-slot", type=int)
+    parser.add_argument("--limit-per-day", type=int)
+    parser.add_argument("--start", type=datetime.fromisoformat, help='Start time, e.g. "2024-06-01 08:00"')
+    parser.add_argument("--seed", type=int, help="Seed of the random delays")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the posting loop")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    account = {}
+    if args.account:
+        account = next((entry for entry in INSTAGRAM_ACCOUNTS if entry["username"] == args.account), None)
+        if account is None:
+            print(f"No account {args.account} in INSTAGRAM_ACCOUNTS")
+            return 1
+
+    slots = ([tuple(slot.split("-")) for slot in args.slots] if args.slots
+             else account.get("time_slots", INSTAGRAM_POST_TIME_SLOTS))
+    # An explicit 0 is a limit, not "unset"
+    limit_per_slot = (args.limit_per_slot if args.limit_per_slot is not None
+                      else account.get("limit_per_slot", INSTAGRAM_POST_LIMIT_PER_SLOT))
+    limit_per_day = (args.limit_per_day if args.limit_per_day is not None
+                     else account.get("limit_per_day", INSTAGRAM_POST_LIMIT_PER_DAY))
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    report = simulate(args.folder or account.get("image_folder", INSTAGRAM_IMAGE_FOLDER), slots,
+                      tuple(args.delay or account.get("delay_range", INSTAGRAM_POST_DELAY_RANGE)),
+                      limit_per_slot=limit_per_slot, limit_per_day=limit_per_day,
+                      start=args.start, ledger_name=account.get("ledger_name", "log.jsonl"), verbose=args.verbose)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,6 +2,8 @@ import os
 from google.cloud import vision
 import os
 from google.cloud import vision
+from utils.metrics import metrics
+from utils.resilience import ResilientCaller
 
 
 class BaseImageAnalyzer:
@@ -11,24 +13,44 @@ class BaseImageAnalyzer:
         """Analyze an image and return labels."""
         raise NotImplementedError("This method should be overridden in a subclass.")
 
+    def analyze_batch(self, image_paths):
+        """Analyze several images and return a list of labels per image."""
+        return [self.analyze_image(image_path) for image_path in image_paths]
+
 
 
 class GoogleVisionImageAnalyzer(BaseImageAnalyzer):
     """Implementation of ImageAnalyzer using Google Vision API."""
 
-    def __init__(self, credentials_path):
+    BATCH_SIZE = 16  # Max images per batch_annotate_images request
+
+    def __init__(self, credentials_path, client=None, timeout=None):
         # Set up Google Vision API credentials
         self.credentials_path = credentials_path
+        self.timeout = timeout  # Seconds per API request (None for the client default)
+        if client is not None:
+            # Pre-built (or stub) client, e.g. for tests
+            self.client = client
+            return
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = self.credentials_path
         self.client = vision.ImageAnnotatorClient()
 
-    def analyze_image(self, image_path):
-        """Analyze an image using Google Vision API and return labels."""
+    @staticmethod
+    def _load_image(image_path):
+        """Build a vision.Image from a file path or from already encoded image bytes."""
+        if isinstance(image_path, (bytes, bytearray, memoryview)):
+            return vision.Image(content=bytes(image_path))
         with open(image_path, "rb") as image_file:
             content = image_file.read()
-            image = vision.Image(content=content)
+        return vision.Image(content=content)
 
-        response = self.client.label_detection(image=image)
+    @metrics.timed("vision_request_seconds", call="label_detection")
+    def analyze_image(self, image_path):
+        """Analyze an image using Google Vision API and return labels."""
+        image = self._load_image(image_path)
+
+        response = self.client.label_detection(image=image, **self._call_options())
+        metrics.count("vision_images_total")
 
         if response.error.message:
             raise Exception(f"Google Vision API Error: {response.error.message}")
@@ -36,6 +58,78 @@ class GoogleVisionImageAnalyzer(BaseImageAnalyzer):
         labels = [label.description for label in response.label_annotations]
         return labels
 
+    def analyze_batch(self, image_paths):
+        """
+        Analyze images with batch_annotate_images, up to BATCH_SIZE images per request.
+
+        An image the API can't label gets no labels instead of failing the whole batch.
+        """
+        results = []
+        feature = vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION)
+        for start in range(0, len(image_paths), self.BATCH_SIZE):
+            chunk = image_paths[start:start + self.BATCH_SIZE]
+            requests = [vision.AnnotateImageRequest(image=self._load_image(image_path), features=[feature])
+                        for image_path in chunk]
+            with metrics.timer("vision_request_seconds", call="batch_annotate_images"):
+                batch = self.client.batch_annotate_images(requests=requests, **self._call_options())
+            metrics.count("vision_images_total", len(chunk))
+
+            if len(batch.responses) != len(chunk):
+                raise ValueError(f"Google Vision returned {len(batch.responses)} responses for {len(chunk)} images")
+            for index, response in enumerate(batch.responses, start):
+                if response.error.message:
+                    print(f"Google Vision API Error for image {index + 1} of the batch: {response.error.message}")
+                    metrics.count("vision_image_errors_total")
+                    results.append([])
+                    continue
+                results.append([label.description for label in response.label_annotations])
+        return results
+
+    def _call_options(self):
+        return {"timeout": self.timeout} if self.timeout is not None else {}
+
+
+class ResilientImageAnalyzer(BaseImageAnalyzer):
+    """
+    Wraps an image analyzer with timeouts, retries, hedging and a circuit breaker (see ResilientCaller).
+
+    When a call still fails, or the circuit is open, the labels come from the fallback
+    analyzer (EmptyImageAnalyzer by default).
+    """
+
+    def __init__(self, analyzer, fallback=None, **settings):
+        """
+        Parameters:
+        analyzer (BaseImageAnalyzer): Analyzer to protect.
+        fallback (BaseImageAnalyzer, optional): Answers when the analyzer fails, defaults to EmptyImageAnalyzer.
+        settings: ResilientCaller settings (timeout, deadline, retries, backoff, hedge_after, ...).
+        """
+        self.analyzer = analyzer
+        self.fallback = fallback or EmptyImageAnalyzer()
+        self.caller = ResilientCaller("Google_vision", **settings)
+
+    def analyze_image(self, image_path):
+        try:
+            return self.caller.call(self.analyzer.analyze_image, image_path)
+        except Exception as e:
+            self.caller.count("fallbacks")
+            print(f"Google_vision unavailable, using fallback: {e}")
+            return self.fallback.analyze_image(image_path)
+
+    def analyze_batch(self, image_paths):
+        try:
+            return self.caller.call(self.analyzer.analyze_batch, image_paths)
+        except Exception as e:
+            self.caller.count("fallbacks", len(image_paths))
+            print(f"Google_vision unavailable, using fallback: {e}")
+            return self.fallback.analyze_batch(image_paths)
+
+    def stats(self):
+        return self.caller.stats()
+
+    def close(self):
+        self.caller.close()
+
 
 class EmptyImageAnalyzer(BaseImageAnalyzer):
     """Dummy implementation of an Image Analyzer with no functionality."""
@@ -43,16 +137,25 @@ class EmptyImageAnalyzer(BaseImageAnalyzer):
     def analyze_image(self, image_path):
         return []
 
+    def analyze_batch(self, image_paths):
+        return [[] for _ in image_paths]
+
 
 
 # Factory function to create the appropriate Image Analyzer
-def create_image_analyzer(use_google_vision, credentials_path=None):
+def create_image_analyzer(use_google_vision, credentials_path=None, cache_path=None, cache_ttl=30 * 24 * 3600,
+                          cache_max_entries=100000, resilience=None):
     """
     Factory to create either a GoogleVisionImageAnalyzer or EmptyImageAnalyzer.
 
     Parameters:
     use_google_vision (bool): Whether to use the Google Vision API.
     credentials_path (str): Path to the credentials file for Google Vision API (required if use_google_vision is True).
+    cache_path (str): Path to a SQLite label cache; the Google analyzer is wrapped in a CachedImageAnalyzer if set.
+    cache_ttl (float): Seconds after which cached labels expire.
+    cache_max_entries (int): Max images kept in the label cache.
+    resilience (dict, optional): ResilientCaller settings; requests get timeouts, retries and a
+        circuit breaker that falls back to EmptyImageAnalyzer (None disables it).
 
     Returns:
     BaseImageAnalyzer: An instance of GoogleVisionImageAnalyzer or EmptyImageAnalyzer.
@@ -61,7 +164,16 @@ def create_image_analyzer(use_google_vision, credentials_path=None):
         print("Google_vision in use")
         if not credentials_path:
             raise ValueError("Credentials path is required when use_google_vision is True.")
-        return GoogleVisionImageAnalyzer(credentials_path=credentials_path)
+        if resilience:
+            analyzer = GoogleVisionImageAnalyzer(credentials_path=credentials_path, timeout=resilience.get("timeout"))
+            analyzer = ResilientImageAnalyzer(analyzer, **resilience)
+        else:
+            analyzer = GoogleVisionImageAnalyzer(credentials_path=credentials_path)
+        if cache_path:
+            from google_api.label_cache import CachedImageAnalyzer
+            print(f"Google_vision label cache: {cache_path}")
+            analyzer = CachedImageAnalyzer(analyzer, cache_path, ttl=cache_ttl, max_entries=cache_max_entries)
+        return analyzer
     else:
         print("Google_vision not in use")
         return EmptyImageAnalyzer()
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from google_api.google_image_analyzer import BaseImageAnalyzer
+from utils.metrics import metrics
+
+
+class CachedImageAnalyzer(BaseImageAnalyzer):
+    """
+    Disk-backed label cache around any BaseImageAnalyzer.
+
+    Labels are stored in SQLite keyed by the SHA-256 of the image content, so reruns over the
+    same folder and retries after a failed upload don't call the API again. The database runs
+    in WAL mode and can be shared by several poster processes.
+    """
+
+    EVICT_EVERY = 100  # Inserts between LRU eviction passes
+
+    def __init__(self, analyzer, cache_path, ttl=30 * 24 * 3600, max_entries=100000, clock=time.time):
+        """
+        Parameters:
+            analyzer (BaseImageAnalyzer): Analyzer that is called on a cache miss.
+            cache_path (str): Path to the SQLite database.
+            ttl (float): Seconds after which cached labels expire (None to keep forever).
+            max_entries (int): Max cached images, least recently used ones are evicted.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.analyzer = analyzer
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._inserts = 0
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(cache_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            "key TEXT PRIMARY KEY, labels TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS labels_accessed ON labels (accessed)")
+        self._evict()
+
+    def analyze_image(self, image_path):
+        """Return cached labels for the image content, calling the wrapped analyzer on a miss."""
+        key = self._content_key(image_path)
+        labels = self._get(key)
+        if labels is not None:
+            with self._lock:
+                self.hits += 1
+            metrics.count("cache_requests_total", cache="labels", result="hit")
+            return labels
+
+        with self._lock:
+            self.misses += 1
+        metrics.count("cache_requests_total", cache="labels", result="miss")
+        labels = self.analyzer.analyze_image(image_path)
+        self._put(key, labels)
+        return list(labels)
+
+    def analyze_batch(self, image_paths):
+        """Return cached labels, sending only the misses to the wrapped analyzer in one batch."""
+        keys = [self._content_key(image_path) for image_path in image_paths]
+        results = [self._get(key) for key in keys]
+        missing = [index for index, labels in enumerate(results) if labels is None]
+        with self._lock:
+            self.hits += len(results) - len(missing)
+            self.misses += len(missing)
+        metrics.count("cache_requests_total", len(results) - len(missing), cache="labels", result="hit")
+        metrics.count("cache_requests_total", len(missing), cache="labels", result="miss")
+
+        if missing:
+            fresh = self.analyzer.analyze_batch([image_paths[index] for index in missing])
+            if len(fresh) != len(missing):
+                raise ValueError(f"Image analyzer returned {len(fresh)} results for {len(missing)} images")
+            for index, labels in zip(missing, fresh):
+                self._put(keys[index], labels)
+                results[index] = list(labels)
+        return results
+
+    def stats(self):
+        """
+        Return hit/miss counters.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        self._db.close()
+
+    @staticmethod
+    def _content_key(image):
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return hashlib.sha256(image).hexdigest()
+
+        digest = hashlib.sha256()
+        with open(image, "rb") as image_file:
+            for chunk in iter(lambda: image_file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _get(self, key):
+        now = self.clock()
+        with self._lock:
+            row = self._db.execute("SELECT labels, created FROM labels WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and row[1] < now - self.ttl:
+                self._db.execute("DELETE FROM labels WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE labels SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def _put(self, key, labels):
+        if not labels:
+            # No labels is usually a degraded answer (see ResilientImageAnalyzer), ask again next time
+            return
+        now = self.clock()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO labels (key, labels, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(list(labels)), now, now),
+            )
+            self._inserts += 1
+            if self._inserts % self.EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        """
+        Drop expired entries and keep only the max_entries most recently used ones.
+        """
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM labels WHERE created < ?", (self.clock() - self.ttl,))
+        if self.max_entries:
+            self._db.execute(
+                "DELETE FROM labels WHERE key IN "
+                "(SELECT key FROM labels ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
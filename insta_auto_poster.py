@@ -1,37 +1,140 @@
+import json
 from collections import namedtuple
+from pathlib import Path
+import tempfile
+import functools
+import itertools
 from instagrapi import Client
+from instagrapi.types import Location as InstagramLocation
 from defines.post import *
 from utils.image_manager import *
 from utils.utils import *
 from openai_api.openai_chatgpt import *
 from google_api.google_image_analyzer import *
+from google_api.label_cache import CachedImageAnalyzer
 
 from configuration import *
 from utils.scheduler import *
+from utils.pipeline import PostPipeline
+from utils.preprocessor import ImagePreprocessor
+from utils.geocoder import Geocoder
+from utils.location_cache import LocationCache
+from utils.folder_watcher import FolderWatcher, PendingQueue
+from utils.job_queue import JobQueue
+from utils.metadata_index import MetadataIndex
+from utils.metrics import metrics
+
+def create_shared_image_analyzer():
+    """
+    Image analyzer from the configuration; safe to share between accounts.
+    """
+    return create_image_analyzer(USE_AI, GOOGLE_CREDENTIALS_PASS,
+                                 cache_path=VISION_LABEL_CACHE,
+                                 cache_ttl=VISION_LABEL_CACHE_TTL,
+                                 cache_max_entries=VISION_LABEL_CACHE_MAX_ENTRIES,
+                                 resilience=VISION_RESILIENCE)
+
+
+def create_shared_chat_client():
+    """
+    Chat client from the configuration; safe to share between accounts.
+    """
+    return create_chat_client(USE_AI, OPENAI_API_KEY, OPENAI_API_SETTINGS,
+                              batch_size=CHAT_BATCH_SIZE, batch_window=CHAT_BATCH_WINDOW,
+                              cache_path=CAPTION_CACHE, cache_variants=CAPTION_CACHE_VARIANTS,
+                              cache_max_entries=CAPTION_CACHE_MAX_ENTRIES,
+                              resilience=CHAT_RESILIENCE)
+
+
+def create_shared_geocoder():
+    return Geocoder(cache_file=GEOCODE_CACHE_FILE, ttl=GEOCODE_CACHE_TTL, gazetteer_file=GEOCODE_GAZETTEER_FILE)
+
+
+def create_shared_location_cache():
+    return LocationCache(cache_file=LOCATION_CACHE_FILE, radius_km=LOCATION_CACHE_RADIUS_KM)
+
+
+def configure_metrics():
+    """
+    Enable metrics from the configuration (see utils/metrics.py).
+    """
+    metrics.configure(enabled=METRICS_ENABLED, port=METRICS_PORT, jsonl_file=METRICS_JSONL_FILE, log=METRICS_LOG)
+
+
+def print_metrics_summary():
+    if metrics.enabled:
+        print(f"Metrics: {json.dumps(metrics.summary(), indent=2)}")
+
+
+def print_client_stats(name, client):
+    """
+    Print the stats of every layer (cache, resilience, ...) of a wrapped client.
+    """
+    while client is not None:
+        if hasattr(client, "stats"):
+            print(f"{name} {type(client).__name__}: {client.stats()}")
+        client = getattr(client, "analyzer", None) or getattr(client, "client", None)
+
+
+def close_client(client):
+    """
+    Close every layer (cache, resilience, ...) of a wrapped client, e.g. the database and worker threads.
+    """
+    while client is not None:
+        if hasattr(client, "close"):
+            client.close()
+        client = getattr(client, "analyzer", None) or getattr(client, "client", None)
+
 
 class Poster:
     """
     Handles Instagram login and posting.
+
+    The analyzer, chat client, geocoder and location cache can be passed in to share them
+    between several accounts; missing ones are created from the configuration. `client`
+    replaces the instagrapi Client, e.g. with the stand-in of the benchmarks.
     """
-    def __init__(self, username, password):
+    def __init__(self, username, password, image_analyzer=None, chat_client=None, geocoder=None,
+                 location_cache=None, default_location=INSTAGRAM_DEFAULT_LOCATION, session_file=None,
+                 client=None):
         self.username = username
         self.password = password
-        self.client = Client()
+        self.session_file = session_file
+        self.session_checked_at = 0
+        self.client = client or Client()
         self.posts = []
-        self.google_image_analyzer = None
-        self.openai_chat = None
+        self.default_location = default_location
+        self.google_image_analyzer = image_analyzer
+        self.openai_chat = chat_client
+
+        if self.google_image_analyzer is None:
+            self.google_image_analyzer = create_shared_image_analyzer()
+            print("Image analyzer loaded!")
 
-        self.google_image_analyzer = create_image_analyzer(USE_AI, GOOGLE_CREDENTIALS_PASS)
-        print("Image analyzer loaded!")
+        if self.openai_chat is None:
+            self.openai_chat = create_shared_chat_client()
+            print("Text annotator loaded!")
 
-        self.openai_chat = create_chat_client(USE_AI, OPENAI_API_KEY)
-        print("Text annotator loaded!")
+        # Both define __len__, so an empty one passed in is falsy
+        self.geocoder = geocoder if geocoder is not None else create_shared_geocoder()
+        self.location_cache = location_cache if location_cache is not None else create_shared_location_cache()
 
     def login(self):
+        """
+        Log in, reusing the saved session when it is still valid.
+        """
+        if self.session_file and self.resume_session():
+            metrics.count("instagram_logins_total", account=self.username, kind="session")
+            return 1
+
         try:
-            login_status=self.client.login(self.username, self.password)
+            metrics.count("instagram_logins_total", account=self.username, kind="password")
+            with metrics.timer("instagram_request_seconds", call="login"):
+                login_status=self.client.login(self.username, self.password)
             if login_status:
                 print("Logged in to Instagram successfully!")
+                self.session_checked_at = time.monotonic()
+                self.save_session()
                 return 1
             else:
                 print("Logged in to Instagram failed!")
@@ -41,6 +144,74 @@ class Poster:
             print(f"Error logging in: {e}")
             return 0
 
+    def resume_session(self):
+        """
+        Load the saved session settings and validate them with one cheap request.
+
+        Returns:
+            bool: True if the saved session works, False if a full login is needed.
+        """
+        if not os.path.exists(self.session_file):
+            return False
+
+        try:
+            self.client.load_settings(self.session_file)
+        except Exception as e:
+            print(f"Error loading Instagram session {self.session_file}: {e}")
+            return False
+
+        if self.session_is_valid():
+            print("Reused saved Instagram session")
+            return True
+
+        # Keep the device identity so the fresh login looks like the same phone
+        old_settings = self.client.get_settings()
+        self.client.set_settings({})
+        self.client.set_uuids(old_settings.get("uuids", {}))
+        return False
+
+    def session_is_valid(self):
+        """
+        Check the current session with a cheap authenticated request.
+        """
+        try:
+            self.client.get_timeline_feed()
+        except Exception as e:
+            print(f"Instagram session is not valid: {e}")
+            return False
+        self.session_checked_at = time.monotonic()
+        return True
+
+    def ensure_session(self, max_age=SESSION_CHECK_INTERVAL):
+        """
+        Make sure the session still works (e.g. at the start of a slot), logging in again only if needed.
+
+        Parameters:
+            max_age (float): Seconds during which the last successful check is trusted.
+
+        Returns:
+            int: 1 if logged in, 0 otherwise.
+        """
+        if time.monotonic() - self.session_checked_at < max_age or self.session_is_valid():
+            return 1
+        print("Logging in again...")
+        return self.login()
+
+    def save_session(self):
+        """
+        Persist the session settings (cookies, device) for the next start.
+        """
+        if not self.session_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.session_file)), exist_ok=True)
+            temp_file = self.session_file + ".tmp"
+            self.client.dump_settings(temp_file)
+            os.chmod(temp_file, 0o600)
+            os.replace(temp_file, self.session_file)
+        except Exception as e:
+            print(f"Error saving Instagram session: {e}")
+
     def logoff(self):
         try:
             status = self.client.logout()
@@ -60,60 +231,406 @@ class Poster:
             lat, lon = 0.01, 0.01
 
         if lat == 0.01 or lon == 0.01:
-            precise_lat, precise_lon = get_coordinates_from_name(default_city)
+            precise_lat, precise_lon = self.geocoder.get_coordinates(default_city)
+            if precise_lat is None:
+                # Never search (and cache venues) around the placeholder coordinates
+                print(f"LOCATION: No coordinates for {default_city}.")
+                return Location("Unknown", "0", None, None)
             lat, lon = randomize_coordinates(precise_lat, precise_lon, INSTAGRAM_DEFAULT_LOCATION_RANGE)
 
-        locations = self.client.location_search(lat=round(lat, 8), lng=round(lon, 8))
+        cached_location = self.location_cache.nearest(lat, lon)
+        if cached_location:
+            closest_location = InstagramLocation(**cached_location)
+            print(f"LOCATION: Cached Location: Name: {closest_location.name}, ID: {closest_location.external_id}, "
+                  f"Lat: {closest_location.lat}, Lng: {closest_location.lng}")
+            return closest_location
+
+        with metrics.timer("instagram_request_seconds", call="location_search"):
+            locations = self.client.location_search(lat=round(lat, 8), lng=round(lon, 8))
+        self.location_cache.add_many(dict(location) for location in locations or [])
         if not locations:
             print("LOCATION: No locations found.")
             return Location("Unknown", "0", lat, lon)
 
-        closest_location = min(locations, key=lambda loc: haversine(lat, lon, loc.lat, loc.lng))
+        indices, _ = nearest_k(lat, lon, [loc.lat for loc in locations], [loc.lng for loc in locations])
+        closest_location = locations[indices[0]]
         print(f"LOCATION: Closest Location: Name: {closest_location.name}, ID: {closest_location.external_id}, "
               f"Lat: {closest_location.lat}, Lng: {closest_location.lng}")
         return closest_location
 
-    def post_post(self, post):
+    @metrics.timed("poster_stage_seconds", stage="location")
+    def locate_post(self, post):
+        """
+        Resolve the Instagram location of a post (geocoding + location search).
+
+        A post restored from a job already has its location and is left as it is.
+        """
+        if post.location is None:
+            post.location = self.find_location(post.raw_location, self.default_location)
+        print("Location: ", post.location)
+        return post.location
+
+    @metrics.timed("poster_stage_seconds", stage="vision")
+    def label_post(self, post):
+        """
+        Return picture tags for a post from the image analyzer (or the ones restored from a job).
+        """
+        if post.labels is None:
+            post.labels = self.google_image_analyzer.analyze_image(post.encode())
+        print("Picture tags: ", post.labels)
+        return post.labels
+
+    @metrics.timed("poster_stage_seconds", stage="caption")
+    def caption_post(self, post, picture_tags):
+        """
+        Generate the post description from the picture tags and the location.
+
+        A post restored from a job already has its description and is left as it is.
+        """
+        if post.description:
+            return post.description
+        picture_tags = picture_tags + ["traveling", post.location.name]
+        selected_tags = random.sample(picture_tags, max(1, round(len(picture_tags) * 0.65)))
+        selected_tags.sort()  # Same tags in any order make the same prompt for the caption cache
+        print("Selected tags: ", selected_tags)
+
+        prompt = (f"Create a short (less than 20 words) Instagram post based on tags {selected_tags}. use English letters only! Dont use word Embracing and Exploring and other fancy words in the beginning. Be natural and original.")
+        description = self.openai_chat.chat(prompt)
+        post.description = remove_first_and_last_from_str(description)
+        print("Description: ", post.description)
+        return post.description
+
+    @metrics.timed("poster_stage_seconds", stage="encode")
+    def encode_post_image(self, post):
+        """
+        Encode the post image once in memory for the analyzer and the uploader.
+        """
+        return post.encode()
+
+    def prepare_post(self, post):
+        """
+        Run every stage of a post except the upload.
+        """
+        self.encode_post_image(post)
+        self.locate_post(post)
+        picture_tags = self.label_post(post)
+        self.caption_post(post, picture_tags)
+        return post
+
+    @metrics.timed("poster_stage_seconds", stage="upload")
+    def upload_post(self, post):
+        """
+        Upload a prepared post.
+
+        instagrapi only uploads from a path, so the encoded bytes are written to a temporary
+        file (on tmpfs where available) just for the duration of the upload.
+        """
+        temp_image_path = None
         try:
-            temp_image_path = f'D://2.dev//1.src//InstaPoster//images//temp_image_{post.image_name}.jpg'
-            post.image.save(temp_image_path)
-
-            post.location = self.find_location(post._raw_location, INSTAGRAM_DEFAULT_LOCATION)
-            print("Location: ", post.location)
-
-            picture_tags = self.google_image_analyzer.analyze_image(temp_image_path)
-            picture_tags.extend(["traveling", post.location.name])
-            print("Picture tags: ", picture_tags)
-
-            selected_tags = random.sample(picture_tags, max(1, round(len(picture_tags) * 0.65)))
-            print("Selected tags: ", selected_tags)
+            with tempfile.NamedTemporaryFile(suffix=".jpg", prefix="insta_post_", dir=fast_temp_dir(),
+                                             delete=False) as temp_file:
+                temp_file.write(post.encode())
+                temp_image_path = temp_file.name
 
-            prompt = (f"Create a short (less than 20 words) Instagram post based on tags {selected_tags}. use English letters only! Dont use word Embracing and Exploring and other fancy words in the beginning. Be natural and original.")
-            description = self.openai_chat.chat(prompt)
-            post.description = remove_first_and_last_from_str(description)
-            print("Description: ", post.description)
-
-            status = self.client.photo_upload(temp_image_path, caption=post.description, location=post.location)
+            with metrics.timer("instagram_request_seconds", call="photo_upload"):
+                status = self.client.photo_upload(Path(temp_image_path), caption=post.description, location=post.location)
 
             if status.media_type == 1:
                 print("Photo uploaded successfully")
+                metrics.count("posts_uploaded_total", account=self.username, status="ok")
                 return 1
             else:
                 print("Upload completed, but post might not be visible.")
+                metrics.count("posts_uploaded_total", account=self.username, status="not_visible")
                 return 0
 
         except Exception as e:
             print(f"Error while posting image: {e}")
+            metrics.count("posts_uploaded_total", account=self.username, status="error")
             return 0
 
         finally:
             try:
-                if os.path.exists(temp_image_path):
+                if temp_image_path and os.path.exists(temp_image_path):
                     os.remove(temp_image_path)
-                    print(f"Temporary image file {temp_image_path} removed successfully.")
             except Exception as cleanup_error:
                 print(f"Error during cleanup: {cleanup_error}")
+            self.cleanup_post(post)
+
+    def cleanup_post(self, post):
+        """
+        Release the encoded image of a post that is uploaded or dropped.
+        """
+        post.release_encoded()
+
+    def post_post(self, post):
+        try:
+            self.prepare_post(post)
+        except Exception as e:
+            print(f"Error while posting image: {e}")
+            self.cleanup_post(post)
+            return 0
+
+        return self.upload_post(post)
+
+
+def prelabel_images(analyzer, file_paths, preprocessor=None):
+    """
+    Label a batch of images the way they will be uploaded, so posting later hits the label cache.
+    """
+    contents = []
+    for file_path in file_paths:
+        try:
+            contents.append(load_post(file_path, preprocessor).encode())
+        except Exception as e:
+            print(f"Error while loading {file_path} for labelling: {e}")
+    if not contents:
+        return
+    try:
+        analyzer.analyze_batch(contents)
+        print(f"Pre-labelled {len(contents)} images")
+    except Exception as e:
+        print(f"Error while pre-labelling images: {e}")
+
+
+@metrics.timed("poster_stage_seconds", stage="load")
+def load_post(file_path, preprocessor=None):
+    """
+    Open an image as a square post, from the preprocessed cache when available.
+    """
+    record = preprocessor.get(file_path) if preprocessor else None
+    if record:
+        return Post.from_prebaked(record["baked"], location=record["location"], sha256=record["sha256"])
+
+    pic = Post(file_path, metadata=preprocessor.metadata(file_path) if preprocessor else None)
+    pic.resize_to_square()
+    return pic
+
+
+def location_to_dict(location):
+    """
+    Plain dict of an instagrapi Location (or the fallback namedtuple) for the job queue.
+    """
+    return location._asdict() if hasattr(location, "_asdict") else dict(location)
+
+
+def is_fallback_location(location):
+    """
+    True for the "Unknown" location that Poster.find_location() returns when nothing was found.
+    """
+    return location is None or (location.name == "Unknown" and str(location.external_id) == "0")
+
+
+def load_job_post(file_path, jobs, preprocessor=None):
+    """
+    Open a post and restore the stage results stored in its job, so they are not computed again.
+    """
+    post = load_post(file_path, preprocessor)
+    job = jobs.get(file_path)
+    if job:
+        if job["location"]:
+            post.location = InstagramLocation(**job["location"])
+        if job["labels"]:
+            post.labels = job["labels"]
+        if job["state"] == "captioned" and job["caption"]:
+            post.description = job["caption"]
+    return post
+
+
+def record_job_stage(jobs, file_path, stage, post):
+    """
+    Persist the result of a preparation stage (PostPipeline on_stage callback).
 
+    No labels, an empty caption or the "Unknown" location is usually a fallback answer during an
+    outage (see ResilientImageAnalyzer, ResilientChatClient and Poster.find_location); it is not
+    stored, so a resumed job asks again.
+    """
+    if stage == "location" and not is_fallback_location(post.location):
+        jobs.advance(file_path, None, location=location_to_dict(post.location))
+    elif stage == "vision" and post.labels:
+        jobs.advance(file_path, "labelled", labels=post.labels)
+    elif stage == "caption" and post.description:
+        jobs.advance(file_path, "captioned", caption=post.description)
+
+
+def job_images(jobs, queue, preprocessor, fed, watch=False, batch_size=32, ledger=None):
+    """
+    Yield preprocessed images to post: resumed and requeued jobs first, then the pending queue.
+
+    Images whose content is in the ledger already (e.g. a job requeued after a crash right
+    after its upload) are marked done instead of being posted again.
+
+    Parameters:
+        jobs (JobQueue): Durable job states.
+        queue (PendingQueue): Queue fed by the folder watcher.
+        preprocessor (ImagePreprocessor): Bakes the images.
+        fed (set): Paths handed out in this run; a path removed from it is handed out again.
+        watch (bool): Yield PostPipeline.IDLE instead of stopping when there is nothing to post.
+        batch_size (int): Images preprocessed together.
+        ledger (ImageLedger, optional): Posted images of the account.
+    """
+    while True:
+        paths = [job["path"] for job in jobs.active() if job["path"] not in fed][:batch_size]
+        while not paths:
+            popped = queue.pop_many(batch_size)
+            if not popped:
+                break
+            paths = [path for path in popped
+                     if path not in fed and jobs.enqueue(path)["state"] in JobQueue.ACTIVE]
+        if not paths:
+            if not watch:
+                return
+            yield PostPipeline.IDLE
+            continue
+
+        baked = set(preprocessor.preprocess(paths))
+        for path in paths:
+            fed.add(path)
+            record = preprocessor.get(path)
+            if path not in baked or record is None:
+                jobs.fail(path, "Preprocessing failed", max_attempts=JOB_MAX_ATTEMPTS)
+                continue
+            if ledger is not None and record["sha256"] and ledger.get_by_sha256(record["sha256"]):
+                print(f"Image '{os.path.basename(path)}' is in the ledger already, not posting it again")
+                jobs.advance(path, "done", sha256=record["sha256"])
+                continue
+            jobs.advance(path, "preprocessed", sha256=record["sha256"], baked=record["baked"],
+                         raw_location=record["location"])
+            yield path
+
+
+def run_poster(poster, iman, scheduler, folder_path, sleep=time.sleep, watch=False, state_dir=None, executor=None,
+               preprocessor=None, load=None, settle_time=5):
+    """
+    Post every pending image of a folder according to the schedule and the budgets.
+
+    Pending images are kept in a persistent queue next to the ledger, oldest first. Every
+    post is a job in a SQLite store next to it (see JobQueue): after a crash the stage
+    results are reused, and a post interrupted during the upload is never uploaded again.
+
+    Parameters:
+        poster (Poster): Logged-in poster.
+        iman (ImageManager): Ledger of posted images for this account.
+        scheduler (Scheduler): Time slots and budgets for this account.
+        folder_path (str): Image folder.
+        sleep (callable): Sleep function, e.g. to let a runner interrupt the waits.
+        watch (bool): Keep running and post images added to the folder later.
+        state_dir (str, optional): Directory of the job store and the pending queue, defaults to the folder.
+        executor (ProcessPoolExecutor, optional): Process pool shared by several accounts for indexing
+            and preprocessing; each run starts its own otherwise.
+        preprocessor (ImagePreprocessor, optional): Replaces the metadata index and the baked image cache,
+            e.g. a stand-in that hands the paths on unchanged for a dry run.
+        load (callable, optional): Opens the post of a path, defaults to load_job_post().
+        settle_time (float): Seconds a new file must be unchanged before it is queued (see FolderWatcher).
+    """
+    # Count posts made earlier (e.g. before a restart) against the slot and day budgets
+    for entry in iman.ledger.entries():
+        if entry.get("posted_at"):
+            scheduler.record_post(datetime.fromisoformat(entry["posted_at"]))
+    if scheduler.next_post_time() is None:
+        print("No posting time slots configured")
+        return
+
+    # Post jobs; uploads interrupted by a crash are failed for the operator, never repeated
+    ledger_name = os.path.splitext(os.path.basename(iman.ledger.ledger_file))[0]
+    state_dir = state_dir or folder_path
+    jobs = JobQueue(os.path.join(state_dir, f".{ledger_name}.jobs.sqlite"))
+    interrupted = jobs.recover()
+    if interrupted:
+        print(f"{interrupted} uploads were interrupted; check the account and requeue them with utils.job_queue")
+
+    # Pending images, oldest first; the queue survives restarts and is fed by the watcher
+    queue = PendingQueue(os.path.join(state_dir, f".{ledger_name}.pending.jsonl"))
+    baked_dir = os.path.join(os.path.abspath(PREPROCESS_CACHE_DIR), "")  # Never post the baked copies
+    watcher = FolderWatcher(folder_path, queue,
+                            accept=lambda path: (not os.path.abspath(path).startswith(baked_dir)
+                                                 and jobs.state(path) is None and not iman.is_image_in_log(path)),
+                            recursive=WATCH_RECURSIVE, poll_interval=WATCH_POLL_INTERVAL, settle_time=settle_time)
+    if watch:
+        watcher.start()
+    else:
+        watcher.scan(wait=True)  # Files still being copied are waited for, not skipped
+
+    # Prepare the next posts (resize, location, tags, caption) while waiting for the schedule
+    pipeline = PostPipeline(poster, prefetch=PIPELINE_PREFETCH, stage_limits=PIPELINE_STAGE_LIMITS,
+                            on_stage=functools.partial(record_job_stage, jobs))
+
+    index = None
+    if preprocessor is None:
+        # Header metadata (GPS, orientation, capture time) of the whole folder, re-read only for changed files
+        index = MetadataIndex(os.path.join(state_dir, ".metadata.sqlite"), workers=PREPROCESS_WORKERS,
+                              executor=executor)
+        print(f"Metadata index: {index.update(folder_path, recursive=WATCH_RECURSIVE)}")
+
+        # Bake queued images into upload-ready JPEGs using all cores, a batch at a time
+        preprocessor = ImagePreprocessor(PREPROCESS_CACHE_DIR, fingerprints=iman.fingerprints,
+                                         workers=PREPROCESS_WORKERS, metadata_index=index, executor=executor)
+    fed = set()
+    backlog = job_images(jobs, queue, preprocessor, fed, watch, batch_size=PREPROCESS_BATCH_SIZE, ledger=iman.ledger)
+    load = load or functools.partial(load_job_post, jobs=jobs, preprocessor=preprocessor)
+
+    # Images are labelled in batches while outside the schedule (only useful with the label cache)
+    prelabel = isinstance(poster.google_image_analyzer, CachedImageAnalyzer)
+    labelled = set()
+
+    pending = len(queue) + len(jobs.active())
+    print(f"Backlog: {pending} images, projected to be posted by {scheduler.projected_drain_time(pending)}")
+
+    try:
+        for file_path, pic in pipeline.run(backlog, load, idle=lambda: sleep(WATCH_IDLE_SLEEP)):
+            if pic is None:
+                if not jobs.fail(file_path, "Preparation failed", max_attempts=JOB_MAX_ATTEMPTS):
+                    fed.discard(file_path)  # Try again later in this run
+                continue
+
+            # Wait until within schedule and within the slot and day budgets
+            waited = False
+            unlabelled = None
+            while not scheduler.can_post():
+                waited = True
+                if prelabel:
+                    if unlabelled is None:
+                        # One ordered snapshot of the queue per wait, the batches are sliced from it
+                        unlabelled = (path for path in queue.peek(len(queue)) if path not in labelled)
+                    batch = list(itertools.islice(unlabelled, GoogleVisionImageAnalyzer.BATCH_SIZE))
+                    if batch:
+                        labelled.update(batch)
+                        prelabel_images(poster.google_image_analyzer, preprocessor.preprocess(batch), preprocessor)
+                        continue
+                wait = scheduler.time_until_next_post()
+                metrics.count("schedule_wait_seconds_total", wait)
+                print(f"Waiting {wait:.0f} seconds for the next available schedule...")
+                sleep(wait)  # Sleep exactly until the next slot opens
+
+            # The saved session normally survives the wait; it is checked, not replaced
+            if waited and poster.ensure_session() == 0:
+                raise RuntimeError("Instagram session lost and login failed")
+
+            jobs.advance(file_path, "uploading")
+            status = poster.upload_post(pic)
+            if status:
+                posted_at = scheduler.clock()
+                iman.add_image_to_log(file_path, {"posted_at": posted_at.isoformat(timespec="seconds")})
+                jobs.advance(file_path, "done")
+                scheduler.record_post(posted_at)
+            else:
+                # The upload may have gone through anyway; leave it to the operator
+                jobs.fail(file_path, "Upload failed")
+
+
+            # Wait for a randomized delay before posting the next image, unless the budget
+            # is used up and the wait above sleeps until the next slot anyway
+            if scheduler.can_post():
+                delay = scheduler.get_random_delay()
+                print(f"Waiting for {delay} seconds before the next post...\n\n")
+                sleep(delay)
+    finally:
+        pipeline.close()
+        watcher.stop()
+        queue.close()
+        jobs.close()
+        if index is not None:
+            index.close()
 
 
 # Example usage:
@@ -129,52 +646,24 @@ if __name__ == "__main__":
     # Random delay range between posts in seconds
     delay_range = INSTAGRAM_POST_DELAY_RANGE
 
-    poster = Poster(USERNAME, PASSWORD)
+    configure_metrics()
+    poster = Poster(USERNAME, PASSWORD, session_file=os.path.join(INSTAGRAM_SESSION_DIR, f"{USERNAME}.json"))
     login_status=poster.login()
     if login_status == 0:
         print("Login failed")
         exit()
 
-    iman = ImageManager(FOLDER_PATH)
-    scheduler = Scheduler(schedule_config=schedule_config, delay_range=delay_range)
-
-    i = 0
-    for filename in os.listdir(FOLDER_PATH):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
-            file_path = os.path.join(FOLDER_PATH, filename)
-
-            if iman.is_image_in_log(filename):
-                print(f"File {filename} already posted")
-                continue
-
-            # Wait until within schedule
-            while not scheduler.is_within_schedule():
-               #if login_status == 1:
-                    #login_status = poster.logoff()
-                print("Waiting for the next available schedule...")
-                time.sleep(300)  # Check every minute
-
-
-            #if login_status == 0:
-            #    login_status = poster.login()
-            #    print("Log in...")
-            #else:
-            pic = Post(file_path)
-            pic.resize_to_square()
-
-            if i<INSTAGRAM_POST_LIMIT_PER_SLOT:
-                status = poster.post_post(pic)
-                if status:
-                    iman.add_image_to_log(filename)
-                    i = i + 1
-
-
-            #print(f"login status {login_status}")
-            # Wait for a randomized delay before posting the next image
-            delay = scheduler.get_random_delay()
-            print(f"Waiting for {delay} seconds before the next post...\n\n")
-            time.sleep(delay)
+    iman = ImageManager(FOLDER_PATH, use_perceptual_hash=IMAGE_DEDUP_PERCEPTUAL_HASH)
+    scheduler = Scheduler(schedule_config=schedule_config, delay_range=delay_range,
+                          limit_per_slot=INSTAGRAM_POST_LIMIT_PER_SLOT, limit_per_day=INSTAGRAM_POST_LIMIT_PER_DAY)
 
+    run_poster(poster, iman, scheduler, FOLDER_PATH, watch=INSTAGRAM_WATCH_FOLDER)
 
+    print(f"Location cache: {poster.location_cache.stats()}")
+    print_client_stats("Google_vision", poster.google_image_analyzer)
+    print_client_stats("ChatGPT", poster.openai_chat)
+    print_metrics_summary()
+    close_client(poster.google_image_analyzer)
+    close_client(poster.openai_chat)
 
     print("Posts created")
@@ -0,0 +1,137 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from insta_auto_poster import *
+
+
+class RunnerStopped(Exception):
+    """Raised inside an account thread to unwind it when the runner stops."""
+
+
+class AccountRunner:
+    """
+    Runs several Instagram accounts concurrently in one process.
+
+    Every account gets its own thread, Instagram session, schedule and ledger. The image
+    analyzer, chat client, geocoder, location cache and the process pool for indexing and
+    preprocessing are created once and shared. A failing account is restarted with
+    exponential backoff without affecting the others.
+    """
+
+    def __init__(self, accounts, max_restarts=ACCOUNT_MAX_RESTARTS, restart_backoff=ACCOUNT_RESTART_BACKOFF):
+        """
+        Parameters:
+            accounts (list): Account dicts, see INSTAGRAM_ACCOUNTS in the configuration.
+            max_restarts (int): Restarts of a failed account before it is given up.
+            restart_backoff (tuple): Min and max seconds between restarts.
+        """
+        self.accounts = accounts
+        self.max_restarts = max_restarts
+        self.restart_backoff = restart_backoff
+        self.status = {account["username"]: "pending" for account in accounts}
+        self.executor = None
+        self._stop = threading.Event()
+
+        self.image_analyzer = create_shared_image_analyzer()
+        print("Image analyzer loaded!")
+        self.chat_client = create_shared_chat_client()
+        print("Text annotator loaded!")
+        self.geocoder = create_shared_geocoder()
+        self.location_cache = create_shared_location_cache()
+
+    def run(self):
+        """
+        Run all accounts and wait until they are done or stop() is called.
+        """
+        # One pool for all accounts, instead of one per account with a worker per core each
+        self.executor = ProcessPoolExecutor(max_workers=PREPROCESS_WORKERS)
+        threads = [threading.Thread(target=self._run_account, args=(account,), name=account["username"], daemon=True)
+                   for account in self.accounts]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stop(self):
+        """
+        Ask every account to stop at its next wait.
+        """
+        self._stop.set()
+
+    def _sleep(self, seconds):
+        if self._stop.wait(seconds):
+            raise RunnerStopped()
+
+    def _run_account(self, account):
+        username = account["username"]
+        attempt = 0
+        while not self._stop.is_set():
+            try:
+                self.status[username] = "running"
+                self._post_account(account)
+                self.status[username] = "done"
+                return
+            except RunnerStopped:
+                break
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_restarts:
+                    print(f"[{username}] Giving up after {attempt} failures: {e}")
+                    self.status[username] = "failed"
+                    return
+                delay = min(self.restart_backoff[1], self.restart_backoff[0] * 2 ** (attempt - 1))
+                print(f"[{username}] Error: {e}. Restarting in {delay} seconds...")
+                self.status[username] = "backoff"
+                try:
+                    self._sleep(delay)
+                except RunnerStopped:
+                    break
+        self.status[username] = "stopped"
+
+    def _post_account(self, account):
+        username = account["username"]
+        folder_path = account.get("image_folder", INSTAGRAM_IMAGE_FOLDER)
+
+        poster = Poster(username, account["password"],
+                        image_analyzer=self.image_analyzer,
+                        chat_client=self.chat_client,
+                        geocoder=self.geocoder,
+                        location_cache=self.location_cache,
+                        default_location=account.get("default_location", INSTAGRAM_DEFAULT_LOCATION),
+                        session_file=os.path.join(INSTAGRAM_SESSION_DIR, f"{username}.json"))
+        if poster.login() == 0:
+            raise RuntimeError("Login failed")
+
+        iman = ImageManager(folder_path, use_perceptual_hash=IMAGE_DEDUP_PERCEPTUAL_HASH,
+                            ledger_name=account.get("ledger_name", "log.jsonl"))
+        scheduler = Scheduler(schedule_config=account.get("time_slots", INSTAGRAM_POST_TIME_SLOTS),
+                              delay_range=account.get("delay_range", INSTAGRAM_POST_DELAY_RANGE),
+                              limit_per_slot=account.get("limit_per_slot", INSTAGRAM_POST_LIMIT_PER_SLOT),
+                              limit_per_day=account.get("limit_per_day", INSTAGRAM_POST_LIMIT_PER_DAY))
+        try:
+            run_poster(poster, iman, scheduler, folder_path, sleep=self._sleep,
+                       watch=account.get("watch_folder", INSTAGRAM_WATCH_FOLDER), executor=self.executor)
+        finally:
+            iman.close()
+
+
+if __name__ == "__main__":
+    configure_metrics()
+    runner = AccountRunner(INSTAGRAM_ACCOUNTS)
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        print("Stopping...")
+        runner.stop()
+
+    print(f"Accounts: {runner.status}")
+    print(f"Location cache: {runner.location_cache.stats()}")
+    print_client_stats("Google_vision", runner.image_analyzer)
+    print_client_stats("ChatGPT", runner.chat_client)
+    print_metrics_summary()
+    close_client(runner.image_analyzer)
+    close_client(runner.chat_client)
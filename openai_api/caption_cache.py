@@ -0,0 +1,186 @@
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from openai_api.openai_chatgpt import BaseChatClient, add_usage
+from utils.metrics import metrics
+
+
+def normalize_prompt(prompt):
+    """
+    Normalize a prompt for cache lookups: case and whitespace don't change the answer.
+    """
+    return " ".join(str(prompt).casefold().split())
+
+
+class CachedChatClient(BaseChatClient):
+    """
+    Disk-backed answer cache around any BaseChatClient.
+
+    Answers are stored in SQLite keyed by the normalized prompt plus the model, role,
+    temperature and max_tokens settings. Up to `variants` different answers are collected
+    per key and then served at random, so a series of similar photos doesn't get the same
+    caption every time. Token usage and latency of every stored answer are recorded, which
+    shows what the cache saves.
+    """
+
+    EVICT_EVERY = 100  # Inserts between LRU eviction passes
+
+    def __init__(self, client, cache_path, settings=None, variants=1, max_entries=50000, clock=time.time):
+        """
+        Parameters:
+            client (BaseChatClient): Client that is called on a cache miss.
+            cache_path (str): Path to the SQLite database.
+            settings (dict, optional): Settings that change the answer (model, role, temperature,
+                max_tokens); read from the client if omitted.
+            variants (int): Different answers to collect per prompt before reusing them.
+            max_entries (int): Max cached prompts, least recently used ones are evicted.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.client = client
+        self.cache_path = cache_path
+        self.variants = max(1, variants)
+        self.max_entries = max_entries
+        self.clock = clock
+        self.settings = settings if settings is not None else self._client_settings(client)
+        self.hits = 0
+        self.misses = 0
+        self.tokens_spent = 0
+        self.tokens_saved = 0
+        self.latency_spent = 0.0
+        self.latency_saved = 0.0
+        self._inserts = 0
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(cache_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT NOT NULL, answer TEXT NOT NULL, tokens INTEGER NOT NULL, latency REAL NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_key ON answers (key)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed)")
+
+    def send_message(self, prompt):
+        return self.chat(prompt)
+
+    def chat(self, message, usage=None):
+        """Return a cached answer, or ask the wrapped client while the variant pool isn't full."""
+        key = self._key(message)
+        answer = self._get(key)
+        if answer is not None:
+            return answer
+
+        call_usage = {}
+        start = time.perf_counter()
+        answer = self.client.chat(message, call_usage)
+        latency = time.perf_counter() - start
+        self._put(key, answer, self._tokens(call_usage), latency)
+        add_usage(usage, call_usage.get("prompt_tokens", 0), call_usage.get("completion_tokens", 0))
+        return answer
+
+    def chat_batch(self, messages, usage=None):
+        """Return cached answers, sending only the misses to the wrapped client in one batch."""
+        messages = list(messages)
+        keys = [self._key(message) for message in messages]
+        answers = [self._get(key) for key in keys]
+        missing = [index for index, answer in enumerate(answers) if answer is None]
+        if not missing:
+            return answers
+
+        call_usage = {}
+        start = time.perf_counter()
+        fresh = self.client.chat_batch([messages[index] for index in missing], call_usage)
+        latency = (time.perf_counter() - start) / len(missing)
+        tokens = self._tokens(call_usage) / len(missing)
+        for index, answer in zip(missing, fresh):
+            self._put(keys[index], answer, tokens, latency)
+            answers[index] = answer
+        add_usage(usage, call_usage.get("prompt_tokens", 0), call_usage.get("completion_tokens", 0))
+        return answers
+
+    def stats(self):
+        """
+        Return hit/miss counters with the tokens and seconds spent on misses and saved by hits.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "tokens_spent": round(self.tokens_spent),
+            "tokens_saved": self.tokens_saved,
+            "latency_spent": round(self.latency_spent, 3),
+            "latency_saved": round(self.latency_saved, 3),
+        }
+
+    def close(self):
+        self._db.close()
+
+    @staticmethod
+    def _client_settings(client):
+        # Look through wrappers (e.g. BatchingChatClient) for the configured client
+        while not hasattr(client, "model") and hasattr(client, "client"):
+            client = client.client
+        return {name: getattr(client, name, None) for name in ("model", "role", "temperature", "max_tokens")}
+
+    @staticmethod
+    def _tokens(usage):
+        return usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+
+    def _key(self, message):
+        data = json.dumps({"prompt": normalize_prompt(message), "settings": self.settings}, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _get(self, key):
+        """
+        Return a random stored answer once the variant pool is full, otherwise None (a miss).
+        """
+        now = self.clock()
+        with self._lock:
+            rows = self._db.execute("SELECT rowid, answer, tokens, latency FROM answers WHERE key = ?",
+                                    (key,)).fetchall()
+            if len(rows) < self.variants:
+                self.misses += 1
+                metrics.count("cache_requests_total", cache="captions", result="miss")
+                return None
+            rowid, answer, tokens, latency = random.choice(rows)
+            self._db.execute("UPDATE answers SET accessed = ? WHERE rowid = ?", (now, rowid))
+            self.hits += 1
+            metrics.count("cache_requests_total", cache="captions", result="hit")
+            self.tokens_saved += tokens
+            self.latency_saved += latency
+        return answer
+
+    def _put(self, key, answer, tokens, latency):
+        if not answer:
+            return
+        now = self.clock()
+        with self._lock:
+            self.tokens_spent += tokens
+            self.latency_spent += latency
+            exists = self._db.execute("SELECT 1 FROM answers WHERE key = ? AND answer = ?", (key, answer)).fetchone()
+            if exists:
+                return
+            self._db.execute(
+                "INSERT INTO answers (key, answer, tokens, latency, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, answer, round(tokens), latency, now, now),
+            )
+            self._inserts += 1
+            if self._inserts % self.EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        """
+        Keep only the max_entries most recently used prompts.
+        """
+        if self.max_entries:
+            self._db.execute(
+                "DELETE FROM answers WHERE key IN ("
+                "SELECT key FROM answers GROUP BY key ORDER BY MAX(accessed) DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
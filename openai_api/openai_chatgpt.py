@@ -1,23 +1,49 @@
+import json
+import threading
+from concurrent.futures import Future
 import openai
 from openai import OpenAI
 import openai
+from utils.metrics import metrics
+from utils.resilience import ResilientCaller
+
+def add_usage(usage, prompt_tokens, completion_tokens):
+    """
+    Add token counts to a per-call usage dict (the `usage` argument of chat() and chat_batch()).
+    """
+    if usage is not None:
+        usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + prompt_tokens
+        usage["completion_tokens"] = usage.get("completion_tokens", 0) + completion_tokens
+
 
 class BaseChatClient:
-    """Abstract base class for a ChatGPT client."""
+    """
+    Abstract base class for a ChatGPT client.
+
+    chat() and chat_batch() take an optional `usage` dict; the tokens of the requests made
+    for that call are added to it (see add_usage), so concurrent callers each see their own cost.
+    """
 
     def send_message(self, prompt):
         raise NotImplementedError("This method should be overridden in a subclass.")
 
-    def chat(self, message):
+    def chat(self, message, usage=None):
         raise NotImplementedError("This method should be overridden in a subclass.")
 
+    def chat_batch(self, messages, usage=None):
+        """Answer several independent messages, one answer per message."""
+        return [self.chat(message, usage) for message in messages]
+
 
 class OpenAIChatClient(BaseChatClient):
     """Implementation of ChatGPT client using OpenAI API."""
 
-    def __init__(self, api_key, openai_api_settings="Default"):
+    def __init__(self, api_key, openai_api_settings="Default", timeout=None, max_retries=2):
         openai.api_key = api_key
-        self.client = OpenAI(api_key=api_key)
+        if timeout is not None:
+            self.client = OpenAI(api_key=api_key, timeout=timeout, max_retries=max_retries)
+        else:
+            self.client = OpenAI(api_key=api_key, max_retries=max_retries)
 
         configuration=openai_api_settings
         if configuration=="Default":
@@ -35,31 +61,234 @@ class OpenAIChatClient(BaseChatClient):
         self.max_tokens = configuration["max_tokens"]  # Adjust the response length
         self.temperature = configuration["temperature"]  # Adjust creativity (0.0-1.0)
         self.n = configuration["n"]  # Number of responses
+        self.usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}  # Totals of all requests
+        self._usage_lock = threading.Lock()
 
-    def send_message(self, prompt):
-        """Send a message to ChatGPT and return the response."""
-        try:
-            # Create a request to the OpenAI API
+    @metrics.timed("chat_request_seconds", call="single")
+    def send_message(self, prompt, usage=None):
+        """
+        Send a message to ChatGPT and return the response.
+
+        Raises the API error (or ValueError for an empty answer) instead of returning it as text,
+        so an error message can never end up as a caption.
+        """
+        # Create a request to the OpenAI API
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self.role},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=self.max_tokens,  # Adjust the response length
+            temperature=self.temperature,  # Adjust creativity (0.0-1.0)
+            n=self.n  # Number of responses
+        )
+        self._record_usage(response, usage)
+        if not response.choices or not response.choices[0].message or not response.choices[0].message.content:
+            raise ValueError("ChatGPT returned an empty answer")
+        # Extract and return the response text
+        return response.choices[0].message.content
+
+    def chat(self, message, usage=None):
+        """Interact with ChatGPT for a conversation."""
+        return self.send_message(message, usage)
+
+    def chat_batch(self, messages, usage=None):
+        """
+        Answer several independent messages with one request.
+
+        The model is asked for a JSON object with one answer per message. If the reply
+        can't be parsed into exactly len(messages) strings, every message is sent on its own.
+        A failed request raises like send_message().
+        """
+        messages = list(messages)
+        if len(messages) <= 1:
+            return [self.chat(message, usage) for message in messages]
+
+        # Request errors (rate limit, timeout, outage) propagate to the retry and circuit
+        # breaker layers; sending every message on its own would only multiply the traffic
+        with metrics.timer("chat_request_seconds", call="batch"):
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": self.role},
-                    {"role": "user", "content": prompt}
+                    {"role": "user", "content": self._batch_prompt(messages)}
                 ],
-                max_tokens=self.max_tokens,  # Adjust the response length
-                temperature=self.temperature,  # Adjust creativity (0.0-1.0)
-                n=self.n  # Number of responses
+                max_tokens=self.max_tokens * len(messages) + 20,
+                temperature=self.temperature,
+                n=1
             )
-            if response.choices and response.choices[0].message:
-                assistant_answer = response.choices[0].message.content
-            # Extract and return the response text
-            return assistant_answer
+        self._record_usage(response, usage)
+        reply = response.choices[0].message if response.choices else None
+        answers = self._parse_batch_answers(reply.content if reply else None, len(messages))
+
+        if answers is None:
+            print(f"ChatGPT batch answer not usable, sending {len(messages)} messages one by one")
+            metrics.count("chat_batch_fallbacks_total")
+            return [self.send_message(message, usage) for message in messages]
+        return answers
+
+    def _record_usage(self, response, usage=None):
+        """
+        Add the token usage reported with a response to the totals and to the usage of the call.
+        """
+        reported = getattr(response, "usage", None)
+        prompt_tokens = getattr(reported, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(reported, "completion_tokens", 0) or 0
+        with self._usage_lock:
+            self.usage["requests"] += 1
+            self.usage["prompt_tokens"] += prompt_tokens
+            self.usage["completion_tokens"] += completion_tokens
+            # Hedged attempts of one call may report at the same time
+            add_usage(usage, prompt_tokens, completion_tokens)
+        metrics.count("chat_tokens_total", prompt_tokens, kind="prompt")
+        metrics.count("chat_tokens_total", completion_tokens, kind="completion")
+
+    @staticmethod
+    def _batch_prompt(messages):
+        numbered = "\n\n".join(f"{index}. {message}" for index, message in enumerate(messages, 1))
+        return (f"Answer each of the {len(messages)} numbered requests below independently. "
+                f'Reply only with a JSON object {{"answers": [...]}} holding exactly {len(messages)} strings, '
+                f"one per request, in the same order.\n\n{numbered}")
+
+    @staticmethod
+    def _parse_batch_answers(text, count):
+        """
+        Extract the answers list from a batch reply; None if it doesn't match the request.
+        """
+        if not text:
+            return None
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end < start:
+            return None
+        try:
+            data = json.loads(text[start:end + 1])
+        except ValueError:
+            return None
+        answers = data.get("answers") if isinstance(data, dict) else None
+        if not isinstance(answers, list) or len(answers) != count:
+            return None
+        if not all(isinstance(answer, str) and answer.strip() for answer in answers):
+            return None
+        return answers
+
+
+class BatchingChatClient(BaseChatClient):
+    """
+    Coalesces chat() calls made at about the same time (e.g. by the preparation pipeline
+    threads) into one chat_batch() request of the wrapped client.
+    """
+
+    def __init__(self, client, max_batch=8, window=0.5):
+        """
+        Parameters:
+        client (BaseChatClient): Client that answers the batches.
+        max_batch (int): Max messages per request.
+        window (float): Seconds to wait for more messages before sending a partial batch.
+        """
+        self.client = client
+        self.max_batch = max_batch
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = []
+        self._timer = None
+
+    def send_message(self, prompt):
+        return self.chat(prompt)
+
+    def chat(self, message, usage=None):
+        future = Future()
+        with self._lock:
+            self._pending.append((message, future, usage))
+            batch = self._take() if len(self._pending) >= self.max_batch else None
+            if batch is None and self._timer is None:
+                self._timer = threading.Timer(self.window, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._send(batch)
+        return future.result()
+
+    def chat_batch(self, messages, usage=None):
+        return self.client.chat_batch(messages, usage)
+
+    def _flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def _take(self):
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _send(self, batch):
+        batch_usage = {}
+        try:
+            answers = self.client.chat_batch([message for message, _, _ in batch], batch_usage)
         except Exception as e:
-            return f"Error: {str(e)}"
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        # Every caller is charged an equal share of the batch request
+        for _, _, usage in batch:
+            add_usage(usage, batch_usage.get("prompt_tokens", 0) / len(batch),
+                      batch_usage.get("completion_tokens", 0) / len(batch))
+        for (_, future, _), answer in zip(batch, answers):
+            future.set_result(answer)
+        # A short answer list must not leave callers waiting forever in chat()
+        for _, future, _ in batch[len(answers):]:
+            future.set_exception(ValueError(f"Chat batch returned {len(answers)} answers for {len(batch)} messages"))
 
-    def chat(self, message):
-        """Interact with ChatGPT for a conversation."""
-        return self.send_message(message)
+
+class ResilientChatClient(BaseChatClient):
+    """
+    Wraps a chat client with timeouts, retries, hedging and a circuit breaker (see ResilientCaller).
+
+    When a call still fails, or the circuit is open, the answer comes from the fallback
+    client (EmptyChatClient by default), so the post goes out without a caption instead of
+    blocking the slot.
+    """
+
+    def __init__(self, client, fallback=None, **settings):
+        """
+        Parameters:
+        client (BaseChatClient): Client to protect.
+        fallback (BaseChatClient, optional): Answers when the client fails, defaults to EmptyChatClient.
+        settings: ResilientCaller settings (timeout, deadline, retries, backoff, hedge_after, ...).
+        """
+        self.client = client
+        self.fallback = fallback or EmptyChatClient()
+        self.caller = ResilientCaller("ChatGPT", **settings)
+
+    def send_message(self, prompt):
+        return self.chat(prompt)
+
+    def chat(self, message, usage=None):
+        try:
+            return self.caller.call(self.client.chat, message, usage)
+        except Exception as e:
+            self.caller.count("fallbacks")
+            print(f"ChatGPT unavailable, using fallback: {e}")
+            return self.fallback.chat(message, usage)
+
+    def chat_batch(self, messages, usage=None):
+        messages = list(messages)
+        try:
+            return self.caller.call(self.client.chat_batch, messages, usage)
+        except Exception as e:
+            self.caller.count("fallbacks", len(messages))
+            print(f"ChatGPT unavailable, using fallback: {e}")
+            return self.fallback.chat_batch(messages, usage)
+
+    def stats(self):
+        return self.caller.stats()
+
+    def close(self):
+        self.caller.close()
 
 
 class EmptyChatClient(BaseChatClient):
@@ -69,29 +298,55 @@ class EmptyChatClient(BaseChatClient):
         """Empty implementation that does nothing."""
         return ""
 
-    def chat(self, message):
+    def chat(self, message, usage=None):
         """Empty implementation that does nothing."""
         return self.send_message(message)
 
+    def chat_batch(self, messages, usage=None):
+        """Empty implementation that does nothing."""
+        return ["" for _ in messages]
+
 
 # Factory function to choose the client
-def create_chat_client(use_openai, api_key=None, openai_api_settings="Default"):
+def create_chat_client(use_openai, api_key=None, openai_api_settings="Default", batch_size=1, batch_window=0.5,
+                       cache_path=None, cache_variants=1, cache_max_entries=50000, resilience=None):
     """
     Factory to create either an OpenAIChatClient or EmptyChatClient.
 
     Parameters:
     use_openai (bool): Whether to use the OpenAI client or the empty client.
     api_key (str): API key for OpenAI (required if use_openai is True).
-    model (str): Model name (default is "gpt-4").
+    openai_api_settings (dict): Model, role and sampling settings, or "Default".
+    batch_size (int): Coalesce up to this many concurrent chat() calls into one request (1 disables it).
+    batch_window (float): Seconds to wait for more calls before sending a partial batch.
+    cache_path (str, optional): SQLite answer cache shared between runs and accounts (None disables it).
+    cache_variants (int): Different answers collected per prompt before cached ones are reused.
+    cache_max_entries (int): Max cached prompts, least recently used ones are evicted.
+    resilience (dict, optional): ResilientCaller settings; requests get timeouts, retries and a
+        circuit breaker that falls back to EmptyChatClient (None disables it).
 
     Returns:
-    BaseChatClient: An instance of OpenAIChatClient or EmptyChatClient.
+    BaseChatClient: An instance of OpenAIChatClient or EmptyChatClient, wrapped in the
+    resilience, batching and caching layers when enabled.
     """
     if use_openai:
         print("ChatGPT in use")
         if not api_key:
             raise ValueError("API key is required when use_openai is True.")
-        return OpenAIChatClient(api_key=api_key, openai_api_settings=openai_api_settings)
+        if resilience:
+            # Retries are left to the resilience layer
+            client = OpenAIChatClient(api_key=api_key, openai_api_settings=openai_api_settings,
+                                      timeout=resilience.get("timeout"), max_retries=0)
+            client = ResilientChatClient(client, **resilience)
+        else:
+            client = OpenAIChatClient(api_key=api_key, openai_api_settings=openai_api_settings)
+        if batch_size > 1:
+            client = BatchingChatClient(client, max_batch=batch_size, window=batch_window)
+        if cache_path:
+            from openai_api.caption_cache import CachedChatClient
+            client = CachedChatClient(client, cache_path, variants=cache_variants, max_entries=cache_max_entries)
+            print(f"ChatGPT answer cache: {cache_path}")
+        return client
     else:
         print("ChatGPT not in use")
         return EmptyChatClient()
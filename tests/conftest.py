@@ -0,0 +1,12 @@
+import importlib
+import os
+import sys
+
+# The modules are imported from the repository root, as the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Without a local configuration.py the modules that import it run on the template
+try:
+    importlib.import_module("configuration")
+except ImportError:
+    sys.modules["configuration"] = importlib.import_module("configuration_empty")
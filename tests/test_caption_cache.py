@@ -0,0 +1,51 @@
+import json
+import threading
+from types import SimpleNamespace
+
+from openai_api.caption_cache import CachedChatClient
+from openai_api.openai_chatgpt import BatchingChatClient, OpenAIChatClient
+
+PROMPT_TOKENS = 100
+COMPLETION_TOKENS = 8
+
+
+class StubCompletions:
+    """
+    Answers batch prompts with numbered captions; every request reports the same token usage.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, max_tokens=100, temperature=0.7, n=1):
+        with self._lock:
+            self.requests += 1
+        count = int(messages[-1]["content"].split()[4])
+        content = json.dumps({"answers": [f"Caption {index}" for index in range(count)]})
+        usage = SimpleNamespace(prompt_tokens=PROMPT_TOKENS, completion_tokens=COMPLETION_TOKENS)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+def test_concurrent_misses_are_charged_only_their_share_of_the_tokens(tmp_path):
+    chat_client = OpenAIChatClient("test-key")
+    completions = StubCompletions()
+    chat_client.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    cache = CachedChatClient(BatchingChatClient(chat_client, max_batch=4, window=10),
+                             str(tmp_path / "captions.sqlite"))
+
+    threads = [threading.Thread(target=cache.chat, args=(f"Caption for photo {index}",)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert completions.requests == 1
+    assert chat_client.usage["prompt_tokens"] + chat_client.usage["completion_tokens"] == 108
+    assert cache.stats()["tokens_spent"] == 108
+
+    usage = {}
+    cache.chat("Caption for photo 0", usage)
+    assert usage == {}  # Served from the cache
+    assert cache.stats()["tokens_saved"] == 27
+    cache.close()
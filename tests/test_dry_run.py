@@ -0,0 +1,53 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from dry_run import main, simulate
+
+
+def test_simulate_replays_the_schedule_without_decoding_or_caching(tmp_path):
+    folder = tmp_path / "images"
+    folder.mkdir()
+    # Not decodable: the dry run must not open the pixels
+    for age, name in enumerate(["c.jpg", "b.jpg", "a.jpg"], 1):
+        image = folder / name
+        image.write_bytes(name.encode())
+        os.utime(image, (time.time() - 60 * age, time.time() - 60 * age))
+
+    report = simulate(str(folder), [("09:00", "10:00")], (600, 600), limit_per_slot=2,
+                      start=datetime(2024, 6, 1, 8, 0))
+
+    assert [(post["image"], post["time"]) for post in report["posts"]] == [
+        ("a.jpg", "2024-06-01T09:00:00"),
+        ("b.jpg", "2024-06-01T09:10:00"),
+        ("c.jpg", "2024-06-02T09:00:00"),
+    ]
+    assert report["posts"][0]["offset_ms"] == 3600 * 1000
+    assert [(slot["posts"], slot["capacity"]) for slot in report["slots"]] == [(2, 2), (1, 2)]
+    assert report["unused"] == 1
+    assert sorted(os.listdir(folder)) == ["a.jpg", "b.jpg", "c.jpg"]
+
+
+def test_simulate_doesnt_wait_for_just_written_files(tmp_path):
+    folder = tmp_path / "images"
+    folder.mkdir()
+    for name in ("a.jpg", "b.jpg"):
+        (folder / name).write_bytes(name.encode())
+
+    started = time.monotonic()
+    report = simulate(str(folder), [("09:00", "10:00")], (600, 600), start=datetime(2024, 6, 1, 8, 0))
+    assert time.monotonic() - started < 3
+    assert report["used"] == 2
+
+
+def test_an_explicit_zero_limit_is_kept(tmp_path, capsys):
+    folder = tmp_path / "images"
+    folder.mkdir()
+    (folder / "a.jpg").write_bytes(b"a")
+
+    assert main(["--folder", str(folder), "--slots", "09:00-10:00", "--limit-per-slot", "0",
+                 "--start", "2024-06-01 08:00", "--json"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["used"] == 0
+    assert report["capacity"] == 0
@@ -0,0 +1,95 @@
+import io
+import struct
+
+import pytest
+from PIL import Image
+
+from utils.exif import (GPS_LATITUDE, GPS_LATITUDE_REF, GPS_LONGITUDE, GPS_LONGITUDE_REF, TAG_GPS_IFD, TAG_MAKE,
+                        TAG_ORIENTATION, read_exif)
+
+ASCII, SHORT, LONG, RATIONAL = 2, 3, 4, 5
+
+
+def ifd_bytes(entries, start, endian):
+    """
+    One IFD at offset `start` of the TIFF data; values over 4 bytes follow the IFD.
+    """
+    size = 2 + 12 * len(entries) + 4
+    out, data = struct.pack(endian + "H", len(entries)), b""
+    for tag, field_type, count, payload in entries:
+        if len(payload) <= 4:
+            out += struct.pack(endian + "HHI", tag, field_type, count) + payload.ljust(4, b"\x00")
+        else:
+            out += struct.pack(endian + "HHII", tag, field_type, count, start + size + len(data))
+            data += payload
+    return out + struct.pack(endian + "I", 0) + data
+
+
+def rational(endian, *values):
+    return b"".join(struct.pack(endian + "II", int(value * 100), 100) for value in values)
+
+
+def tiff_bytes(endian, gps=True):
+    order = b"II" if endian == "<" else b"MM"
+    ifd0 = [(TAG_MAKE, ASCII, 6, b"Canon\x00"), (TAG_ORIENTATION, SHORT, 1, struct.pack(endian + "H", 6))]
+    if gps:
+        # The GPS IFD follows IFD0, whose size doesn't depend on the pointer value
+        gps_offset = 8 + len(ifd_bytes(ifd0 + [(TAG_GPS_IFD, LONG, 1, b"\x00" * 4)], 8, endian))
+        ifd0.append((TAG_GPS_IFD, LONG, 1, struct.pack(endian + "I", gps_offset)))
+    tiff = order + struct.pack(endian + "HI", 42, 8) + ifd_bytes(ifd0, 8, endian)
+    if gps:
+        tiff += ifd_bytes([
+            (GPS_LATITUDE_REF, ASCII, 2, b"N\x00"),
+            (GPS_LATITUDE, RATIONAL, 3, rational(endian, 41, 30, 0)),
+            (GPS_LONGITUDE_REF, ASCII, 2, b"W\x00"),
+            (GPS_LONGITUDE, RATIONAL, 3, rational(endian, 44, 15, 0)),
+        ], len(tiff), endian)
+    return tiff
+
+
+def jpeg_bytes(tiff, width=640, height=480):
+    app1 = b"Exif\x00\x00" + tiff
+    sof = struct.pack(">BHHB", 8, height, width, 3) + b"\x01\x11\x00\x02\x11\x00\x03\x11\x00"
+    return (b"\xff\xd8" + b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1
+            + b"\xff\xc0" + struct.pack(">H", len(sof) + 2) + sof + b"\xff\xda\x00\x02")
+
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+def test_reads_little_and_big_endian_headers(endian):
+    meta = read_exif(io.BytesIO(jpeg_bytes(tiff_bytes(endian))))
+    assert (meta["width"], meta["height"]) == (640, 480)
+    assert (meta["make"], meta["orientation"]) == ("Canon", 6)
+    assert meta["gps"] == pytest.approx((41.5, -44.25))
+
+
+def test_missing_gps_is_none():
+    meta = read_exif(io.BytesIO(jpeg_bytes(tiff_bytes("<", gps=False))))
+    assert meta["gps"] is None
+    assert meta["orientation"] == 6
+
+
+def test_truncated_app1_segment_leaves_the_rest_unknown():
+    data = jpeg_bytes(tiff_bytes(">"))
+    meta = read_exif(io.BytesIO(data[:60]))
+    assert meta["gps"] is None
+    assert meta["width"] is None
+
+
+def test_other_formats_fall_back_to_pillow(tmp_path):
+    exif = Image.Exif()
+    exif[TAG_ORIENTATION] = 3
+    exif[TAG_MAKE] = "Nikon"
+    path = tmp_path / "image.png"
+    Image.new("RGB", (32, 16)).save(path, exif=exif)
+
+    meta = read_exif(str(path))
+    assert (meta["width"], meta["height"]) == (32, 16)
+    assert (meta["make"], meta["orientation"], meta["gps"]) == ("Nikon", 3, None)
+
+
+def test_reads_a_jpeg_written_by_pillow(tmp_path):
+    path = tmp_path / "image.jpg"
+    Image.new("RGB", (40, 30)).save(path, exif=b"Exif\x00\x00" + tiff_bytes("<"))
+    meta = read_exif(str(path))
+    assert (meta["width"], meta["height"], meta["orientation"]) == (40, 30, 6)
+    assert meta["gps"] == pytest.approx((41.5, -44.25))
@@ -0,0 +1,69 @@
+import os
+import random
+
+from PIL import Image
+
+from utils import fingerprint
+from utils.fingerprint import BKTree, FingerprintCache, hamming_distance, perceptual_hash
+
+
+def test_bk_tree_search_matches_brute_force():
+    rng = random.Random(1)
+    hashes = [rng.getrandbits(64) for _ in range(300)]
+    # Clusters of near-duplicates, and exact duplicates with different values
+    hashes += [value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for value in hashes[:100]]
+    hashes += hashes[:20]
+    tree = BKTree()
+    for index, value in enumerate(hashes):
+        tree.add(value, index)
+    assert len(tree) == len(hashes)
+
+    for query in hashes[:50] + [rng.getrandbits(64) for _ in range(20)]:
+        for radius in (0, 2, 6, 12):
+            expected = sorted((hamming_distance(query, value), index) for index, value in enumerate(hashes)
+                              if hamming_distance(query, value) <= radius)
+            assert sorted(tree.search(query, radius)) == expected
+
+
+def test_perceptual_hash_survives_resizing_and_recompression(tmp_path):
+    image = Image.effect_mandelbrot((320, 240), (-2.2, -1.2, 1.0, 1.2), 64).convert("RGB")
+    image.save(tmp_path / "original.jpg", quality=95)
+    image.resize((160, 120)).save(tmp_path / "small.jpg", quality=60)
+    image.transpose(Image.FLIP_LEFT_RIGHT).save(tmp_path / "mirrored.jpg", quality=95)
+
+    original = perceptual_hash(str(tmp_path / "original.jpg"))
+    assert original == perceptual_hash(image)
+    assert hamming_distance(original, perceptual_hash(str(tmp_path / "small.jpg"))) <= 6
+    assert hamming_distance(original, perceptual_hash(str(tmp_path / "mirrored.jpg"))) > 6
+
+
+def test_fingerprint_cache_rehashes_only_changed_files(tmp_path, monkeypatch):
+    hashed = []
+    real_sha256 = fingerprint.file_sha256
+    monkeypatch.setattr(fingerprint, "file_sha256", lambda path: hashed.append(path) or real_sha256(path))
+    image = tmp_path / "a.jpg"
+    image.write_bytes(b"first")
+    cache_file = str(tmp_path / "fingerprints.jsonl")
+
+    cache = FingerprintCache(cache_file)
+    first = cache.fingerprint(str(image))["sha256"]
+    assert cache.fingerprint(str(image))["sha256"] == first
+    assert len(hashed) == 1
+
+    # Same size, new mtime
+    image.write_bytes(b"other")
+    os.utime(image, ns=(os.stat(image).st_atime_ns, os.stat(image).st_mtime_ns + 10 ** 9))
+    second = cache.fingerprint(str(image))["sha256"]
+    assert second != first and len(hashed) == 2
+
+    # New size
+    image.write_bytes(b"longer content")
+    assert cache.fingerprint(str(image))["sha256"] not in (first, second)
+    assert len(hashed) == 3
+    cache.close()
+
+    # The records survive a restart
+    reopened = FingerprintCache(cache_file)
+    reopened.fingerprint(str(image))
+    assert len(hashed) == 3
+    reopened.close()
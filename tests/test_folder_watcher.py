@@ -0,0 +1,21 @@
+import os
+import time
+
+from utils.folder_watcher import FolderWatcher, PendingQueue
+
+
+def test_scan_without_watching_waits_for_files_that_are_still_changing(tmp_path):
+    folder = tmp_path / "images"
+    folder.mkdir()
+    settled = folder / "old.jpg"
+    settled.write_bytes(b"jpeg")
+    os.utime(settled, (time.time() - 60, time.time() - 60))
+    (folder / "new.jpg").write_bytes(b"jpeg")
+
+    queue = PendingQueue(str(tmp_path / "pending.jsonl"))
+    watcher = FolderWatcher(str(folder), queue, settle_time=0.3, use_watchdog=False)
+    assert watcher.scan() == 1
+    assert watcher.scan(wait=True) == 1
+    queue.close()
+
+    assert sorted(os.path.basename(path) for path in queue.peek(10)) == ["new.jpg", "old.jpg"]
@@ -0,0 +1,16 @@
+import pytest
+
+from utils.utils import haversine, haversine_many, nearest_k
+
+
+def test_scalar_haversine_matches_the_vectorized_one():
+    lats, lons = [41.7151, -33.8688, 0.0, 89.9], [44.8271, 151.2093, -179.99, 10.0]
+    expected = haversine_many(41.6938, 44.8015, lats, lons)
+    assert [haversine(41.6938, 44.8015, lat, lon) for lat, lon in zip(lats, lons)] == pytest.approx(expected)
+    assert haversine(0.0, 179.99, 0.0, -179.99) == pytest.approx(2.224, abs=1e-3)
+
+
+def test_nearest_k_sorts_by_distance():
+    indices, distances = nearest_k(0.0, 0.0, [0.0, 0.0, 0.0], [3.0, 1.0, 2.0], k=2)
+    assert indices.tolist() == [1, 2]
+    assert distances[0] < distances[1]
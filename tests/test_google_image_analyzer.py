@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import pytest
+
+from google_api.google_image_analyzer import GoogleVisionImageAnalyzer
+
+
+def response(labels=(), error=""):
+    return SimpleNamespace(error=SimpleNamespace(message=error),
+                           label_annotations=[SimpleNamespace(description=label) for label in labels])
+
+
+class StubVisionClient:
+    """
+    Answers every image with its own content as the label; `errors` maps content to an error message.
+    """
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.batches = []
+
+    def batch_annotate_images(self, requests, timeout=None):
+        self.batches.append(len(requests))
+        contents = [request.image.content.decode() for request in requests]
+        return SimpleNamespace(responses=[response([content], self.errors.get(content, ""))
+                                          for content in contents])
+
+
+def test_analyze_batch_splits_requests_at_batch_size():
+    client = StubVisionClient()
+    analyzer = GoogleVisionImageAnalyzer(None, client=client)
+    images = [f"image-{index}".encode() for index in range(2 * GoogleVisionImageAnalyzer.BATCH_SIZE + 3)]
+
+    labels = analyzer.analyze_batch(images)
+
+    assert client.batches == [GoogleVisionImageAnalyzer.BATCH_SIZE, GoogleVisionImageAnalyzer.BATCH_SIZE, 3]
+    assert labels == [[image.decode()] for image in images]
+
+
+def test_analyze_batch_gives_a_failed_image_no_labels():
+    client = StubVisionClient(errors={"image-1": "Bad image data"})
+    analyzer = GoogleVisionImageAnalyzer(None, client=client)
+
+    assert analyzer.analyze_batch([b"image-0", b"image-1", b"image-2"]) == [["image-0"], [], ["image-2"]]
+    assert client.batches == [3]
+
+
+def test_analyze_batch_raises_on_missing_responses():
+    class ShortClient(StubVisionClient):
+        def batch_annotate_images(self, requests, timeout=None):
+            batch = super().batch_annotate_images(requests, timeout)
+            return SimpleNamespace(responses=batch.responses[:-1])
+
+    analyzer = GoogleVisionImageAnalyzer(None, client=ShortClient())
+    with pytest.raises(ValueError, match="2 responses for 3 images"):
+        analyzer.analyze_batch([b"image-0", b"image-1", b"image-2"])
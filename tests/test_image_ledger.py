@@ -0,0 +1,49 @@
+import json
+
+from utils.image_ledger import ImageLedger
+
+
+def write_ledger(path, text):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+
+
+def record(name):
+    return json.dumps({"image_name": name}) + "\n"
+
+
+def test_malformed_lines_in_the_middle_are_skipped_not_truncated(tmp_path):
+    path = tmp_path / "log.jsonl"
+    text = record("a") + "\n" + "{not json\n" + "[1, 2]\n" + record("b") + record("c")
+    write_ledger(path, text)
+
+    ledger = ImageLedger(str(path))
+    ledger.close()
+
+    assert [entry["image_name"] for entry in ledger.entries()] == ["a", "b", "c"]
+    assert path.read_text(encoding="utf-8") == text
+
+
+def test_torn_last_line_is_truncated(tmp_path):
+    path = tmp_path / "log.jsonl"
+    write_ledger(path, record("a") + "\n" + record("b") + '{"image_name": "c", "sha')
+
+    ledger = ImageLedger(str(path))
+    ledger.append({"image_name": "d"})
+    ledger.close()
+
+    assert [entry["image_name"] for entry in ledger.entries()] == ["a", "b", "d"]
+    assert path.read_text(encoding="utf-8") == record("a") + "\n" + record("b") + record("d")
+
+
+def test_complete_last_record_without_newline_is_kept(tmp_path):
+    path = tmp_path / "log.jsonl"
+    write_ledger(path, record("a") + record("b").rstrip("\n"))
+
+    ledger = ImageLedger(str(path))
+    ledger.append({"image_name": "c"})
+    ledger.close()
+
+    reopened = ImageLedger(str(path))
+    reopened.close()
+    assert reopened.entries() == [{"image_name": "a"}, {"image_name": "b"}, {"image_name": "c"}]
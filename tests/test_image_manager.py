@@ -0,0 +1,41 @@
+import json
+
+from utils.image_manager import ImageManager
+
+
+def make_folder(tmp_path, entries, files):
+    folder = tmp_path / "images"
+    folder.mkdir()
+    (folder / "log.jsonl").write_text("".join(json.dumps(entry) + "\n" for entry in entries))
+    for name, content in files.items():
+        (folder / name).write_bytes(content)
+    return folder
+
+
+def test_legacy_entries_without_hash_match_by_name(tmp_path):
+    folder = make_folder(tmp_path, [{"image_name": "old.jpg"}], {"old.jpg": b"edited since", "new.jpg": b"new"})
+    iman = ImageManager(str(folder))
+    try:
+        assert iman.is_image_in_log(str(folder / "old.jpg"))
+        assert iman.is_image_in_log("old.jpg")
+        assert not iman.is_image_in_log(str(folder / "new.jpg"))
+        assert not iman.is_image_in_log("missing.jpg")
+    finally:
+        iman.close()
+
+
+def test_posted_content_is_found_under_another_name(tmp_path):
+    folder = make_folder(tmp_path, [], {"a.jpg": b"photo", "copy of a.jpg": b"photo", "b.jpg": b"other"})
+    iman = ImageManager(str(folder))
+    try:
+        iman.add_image_to_log(str(folder / "a.jpg"), {"posted_at": "2024-06-01T09:00:00"})
+        assert iman.is_image_in_log(str(folder / "copy of a.jpg"))
+        assert not iman.is_image_in_log(str(folder / "b.jpg"))
+    finally:
+        iman.close()
+
+    reopened = ImageManager(str(folder))
+    try:
+        assert reopened.is_image_in_log(str(folder / "copy of a.jpg"))
+    finally:
+        reopened.close()
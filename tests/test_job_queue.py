@@ -0,0 +1,140 @@
+from collections import namedtuple
+
+from insta_auto_poster import job_images, record_job_stage
+from utils.folder_watcher import PendingQueue
+from utils.image_ledger import ImageLedger
+from utils.job_queue import JobQueue
+
+Location = namedtuple("Location", ["name", "external_id", "lat", "lng"])
+
+
+class StubPreprocessor:
+    def __init__(self, hashes):
+        self.hashes = hashes
+
+    def preprocess(self, source_paths):
+        return list(source_paths)
+
+    def get(self, source_path):
+        return {"sha256": self.hashes[source_path], "baked": source_path, "location": None}
+
+
+class StubPost:
+    def __init__(self, location=None, labels=None, description=""):
+        self.location = location
+        self.labels = labels
+        self.description = description
+
+
+def test_requeue_skips_jobs_in_the_ledger_unless_forced(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite"))
+    ledger = ImageLedger(str(tmp_path / "log.jsonl"))
+    ledger.append({"image_name": "posted.jpg", "sha256": "aaa"})
+    for path, sha256 in (("posted.jpg", "aaa"), ("new.jpg", "bbb")):
+        jobs.enqueue(path)
+        jobs.advance(path, "uploading", sha256=sha256)
+    assert jobs.recover() == 2
+
+    assert jobs.requeue(ledger=ledger) == 1
+    assert (jobs.state("posted.jpg"), jobs.state("new.jpg")) == ("failed", "queued")
+    assert jobs.requeue(ledger=ledger, force=True) == 1
+    assert jobs.state("posted.jpg") == "queued"
+    jobs.close()
+    ledger.close()
+
+
+def test_job_images_marks_jobs_in_the_ledger_done(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite"))
+    queue = PendingQueue(str(tmp_path / "pending.jsonl"))
+    ledger = ImageLedger(str(tmp_path / "log.jsonl"))
+    ledger.append({"image_name": "posted.jpg", "sha256": "aaa"})
+    jobs.enqueue("posted.jpg")
+    jobs.enqueue("new.jpg")
+
+    preprocessor = StubPreprocessor({"posted.jpg": "aaa", "new.jpg": "bbb"})
+    assert list(job_images(jobs, queue, preprocessor, set(), ledger=ledger)) == ["new.jpg"]
+    assert (jobs.state("posted.jpg"), jobs.state("new.jpg")) == ("done", "preprocessed")
+    jobs.close()
+    queue.close()
+    ledger.close()
+
+
+def test_record_job_stage_skips_fallback_answers(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite"))
+    jobs.enqueue("a.jpg")
+
+    fallback = StubPost(location=Location("Unknown", "0", None, None), labels=[], description="")
+    for stage in ("location", "vision", "caption"):
+        record_job_stage(jobs, "a.jpg", stage, fallback)
+    job = jobs.get("a.jpg")
+    assert (job["state"], job["location"], job["labels"], job["caption"]) == ("queued", None, None, None)
+
+    found = StubPost(location=Location("Old Town", "42", 41.7, 44.8), labels=["sky"], description="Hi")
+    for stage in ("location", "vision", "caption"):
+        record_job_stage(jobs, "a.jpg", stage, found)
+    job = jobs.get("a.jpg")
+    assert job["state"] == "captioned"
+    assert (job["location"]["name"], job["labels"], job["caption"]) == ("Old Town", ["sky"], "Hi")
+    jobs.close()
+
+
+def test_advance_never_moves_a_job_back(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite"))
+    jobs.enqueue("a.jpg")
+    jobs.advance("a.jpg", "captioned", caption="Hi")
+    jobs.advance("a.jpg", "labelled", labels=["sky"])
+    job = jobs.get("a.jpg")
+    assert (job["state"], job["labels"], job["caption"]) == ("captioned", ["sky"], "Hi")
+
+    jobs.advance("a.jpg", None, location={"name": "Old Town"})
+    assert jobs.get("a.jpg")["state"] == "captioned"
+    assert jobs.enqueue("a.jpg")["state"] == "captioned"
+    jobs.close()
+
+
+def test_fail_retries_until_max_attempts(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite"))
+    jobs.enqueue("a.jpg")
+    jobs.advance("a.jpg", "preprocessed")
+    assert not jobs.fail("a.jpg", "timeout", max_attempts=3)
+    assert not jobs.fail("a.jpg", "timeout", max_attempts=3)
+    job = jobs.get("a.jpg")
+    assert (job["state"], job["attempts"], job["error"]) == ("preprocessed", 2, "timeout")
+    assert jobs.fail("a.jpg", "timeout", max_attempts=3)
+    assert jobs.state("a.jpg") == "failed"
+    assert not jobs.fail("missing.jpg", "timeout")
+    jobs.close()
+
+
+def test_recover_fails_interrupted_uploads_only(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite")
+    jobs = JobQueue(db_path)
+    for path, state in (("a.jpg", "uploading"), ("b.jpg", "captioned"), ("c.jpg", "done")):
+        jobs.enqueue(path)
+        jobs.advance(path, state)
+    jobs.close()
+
+    # After a crash
+    jobs = JobQueue(db_path)
+    assert jobs.recover() == 1
+    assert [jobs.state(path) for path in ("a.jpg", "b.jpg", "c.jpg")] == ["failed", "captioned", "done"]
+    assert [job["path"] for job in jobs.active()] == ["b.jpg"]
+    jobs.close()
+
+
+def test_requeue_keeps_stage_results_unless_reset(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite"))
+    for path in ("a.jpg", "b.jpg"):
+        jobs.enqueue(path)
+        jobs.advance(path, "captioned", sha256="x" + path, labels=["sky"], caption="Hi")
+        jobs.fail(path, "Upload failed")
+    a_id, b_id = jobs.get("a.jpg")["id"], jobs.get("b.jpg")["id"]
+
+    assert jobs.requeue([a_id]) == 1
+    job = jobs.get("a.jpg")
+    assert (job["state"], job["attempts"], job["error"], job["caption"]) == ("queued", 0, None, "Hi")
+
+    assert jobs.requeue([b_id], reset=True) == 1
+    job = jobs.get("b.jpg")
+    assert (job["state"], job["sha256"], job["labels"], job["caption"]) == ("queued", None, None, None)
+    jobs.close()
@@ -0,0 +1,79 @@
+from google_api.google_image_analyzer import BaseImageAnalyzer
+from google_api.label_cache import CachedImageAnalyzer
+
+
+class StubAnalyzer(BaseImageAnalyzer):
+    """
+    Labels every image with its content; images in `empty` get no labels.
+    """
+
+    def __init__(self, empty=()):
+        self.empty = set(empty)
+        self.calls = []
+
+    def analyze_image(self, image):
+        self.calls.append(image)
+        return [] if image in self.empty else [image.decode()]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(tmp_path, analyzer, clock, **settings):
+    return CachedImageAnalyzer(analyzer, str(tmp_path / "labels.sqlite"), clock=clock, **settings)
+
+
+def cached_keys(cache):
+    return cache._db.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+
+
+def test_labels_expire_after_the_ttl(tmp_path):
+    analyzer, clock = StubAnalyzer(), FakeClock()
+    cache = make_cache(tmp_path, analyzer, clock, ttl=60)
+    assert cache.analyze_image(b"sky") == ["sky"]
+    clock.now += 59
+    assert cache.analyze_image(b"sky") == ["sky"]
+    assert len(analyzer.calls) == 1
+
+    clock.now += 2
+    assert cache.analyze_image(b"sky") == ["sky"]
+    assert len(analyzer.calls) == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+    cache.close()
+
+
+def test_least_recently_used_labels_are_evicted_every_100_inserts(tmp_path):
+    analyzer, clock = StubAnalyzer(), FakeClock()
+    cache = make_cache(tmp_path, analyzer, clock, max_entries=50)
+    for index in range(CachedImageAnalyzer.EVICT_EVERY - 1):
+        clock.now += 1
+        cache.analyze_image(f"image-{index}".encode())
+    # Not evicted before the 100th insert; image-0 is used again, so it is one of the most recent
+    assert cached_keys(cache) == CachedImageAnalyzer.EVICT_EVERY - 1
+    clock.now += 1
+    cache.analyze_image(b"image-0")
+
+    clock.now += 1
+    cache.analyze_image(b"image-last")
+    assert cached_keys(cache) == 50
+    calls = len(analyzer.calls)
+    cache.analyze_image(b"image-0")
+    cache.analyze_image(b"image-last")
+    assert len(analyzer.calls) == calls
+    cache.analyze_image(b"image-1")
+    assert len(analyzer.calls) == calls + 1
+    cache.close()
+
+
+def test_empty_labels_are_not_cached(tmp_path):
+    analyzer, clock = StubAnalyzer(empty={b"blank"}), FakeClock()
+    cache = make_cache(tmp_path, analyzer, clock)
+    assert cache.analyze_batch([b"blank", b"sky"]) == [[], ["sky"]]
+    assert cache.analyze_batch([b"blank", b"sky"]) == [[], ["sky"]]
+    assert analyzer.calls == [b"blank", b"sky", b"blank"]
+    cache.close()
@@ -0,0 +1,26 @@
+from utils.metadata_index import MetadataIndex
+
+
+def make_index(tmp_path, points):
+    index = MetadataIndex(str(tmp_path / "index.sqlite"))
+    rows = [(name, 1, 0.0, 1, 1, 1, lat, lng, None, None, None) for name, (lat, lng) in points.items()]
+    index._db.executemany(f"INSERT INTO images VALUES ({','.join('?' * len(MetadataIndex.COLUMNS))})", rows)
+    return index
+
+
+def test_near_wraps_around_the_antimeridian(tmp_path):
+    index = make_index(tmp_path, {"fiji_east": (-17.0, 179.95), "fiji_west": (-17.0, -179.95),
+                                  "greenwich": (-17.0, 0.0)})
+    try:
+        assert [path for path, _ in index.near(-17.0, 179.99, 50)] == ["fiji_east", "fiji_west"]
+        assert [path for path, _ in index.near(-17.0, -179.99, 50)] == ["fiji_west", "fiji_east"]
+    finally:
+        index.close()
+
+
+def test_near_a_pole_searches_every_longitude(tmp_path):
+    index = make_index(tmp_path, {"a": (89.95, 10.0), "b": (89.95, -170.0)})
+    try:
+        assert sorted(path for path, _ in index.near(89.99, 0.0, 20)) == ["a", "b"]
+    finally:
+        index.close()
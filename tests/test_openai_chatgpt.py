@@ -0,0 +1,71 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from openai_api.openai_chatgpt import BaseChatClient, BatchingChatClient, OpenAIChatClient
+
+
+class ShortBatchClient(BaseChatClient):
+    """
+    Answers only the first message of every batch.
+    """
+
+    def chat_batch(self, messages, usage=None):
+        return [f"answer to {messages[0]}"]
+
+
+def test_batching_client_fails_messages_without_an_answer():
+    client = BatchingChatClient(ShortBatchClient(), max_batch=2, window=10)
+    results = {}
+
+    def ask(message):
+        try:
+            results[message] = client.chat(message)
+        except ValueError as e:
+            results[message] = e
+
+    threads = [threading.Thread(target=ask, args=(message,)) for message in ("first", "second")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert not any(thread.is_alive() for thread in threads)
+    answers = sorted(results.values(), key=lambda value: isinstance(value, ValueError))
+    assert isinstance(answers[0], str) and answers[0].startswith("answer to ")
+    assert isinstance(answers[1], ValueError)
+
+
+class StubCompletions:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))],
+                               usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5))
+
+
+def make_client(replies):
+    client = OpenAIChatClient("test-key")
+    completions = StubCompletions(replies)
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return client, completions
+
+
+def test_chat_batch_sends_messages_one_by_one_only_for_an_unusable_answer():
+    client, completions = make_client(['{"answers": ["one"]}', "first", "second"])
+    assert client.chat_batch(["a", "b"]) == ["first", "second"]
+    assert completions.calls == 3
+
+
+def test_chat_batch_raises_request_errors_without_fanning_out():
+    client, completions = make_client([TimeoutError("timed out"), "first", "second"])
+    with pytest.raises(TimeoutError):
+        client.chat_batch(["a", "b"])
+    assert completions.calls == 1
@@ -0,0 +1,43 @@
+import threading
+
+from utils.pipeline import PostPipeline
+
+
+class StubPoster:
+    """
+    The location search is still running when the image analyzer fails.
+    """
+
+    def __init__(self):
+        self.location_started = threading.Event()
+        self.release_location = threading.Event()
+        self.events = []
+
+    def encode_post_image(self, post):
+        pass
+
+    def locate_post(self, post):
+        self.location_started.set()
+        self.release_location.wait(5)
+        self.events.append("location done")
+
+    def label_post(self, post):
+        self.location_started.wait(5)
+        threading.Timer(0.2, self.release_location.set).start()
+        raise ValueError("vision down")
+
+    def caption_post(self, post, picture_tags):
+        self.events.append("caption")
+
+    def cleanup_post(self, post):
+        self.events.append("cleanup")
+
+
+def test_failed_post_waits_for_its_location_search_before_it_is_dropped():
+    poster = StubPoster()
+    pipeline = PostPipeline(poster, prefetch=1)
+    try:
+        assert list(pipeline.run(["a.jpg"], lambda item: object())) == [("a.jpg", None)]
+        assert poster.events == ["location done", "cleanup"]
+    finally:
+        pipeline.close()
@@ -0,0 +1,43 @@
+import threading
+
+from PIL import Image
+
+from utils.preprocessor import ImagePreprocessor
+
+
+def test_preprocessors_sharing_a_manifest_never_interleave_lines(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    preprocessors = [ImagePreprocessor(cache_dir) for _ in range(2)]
+
+    def append(preprocessor, prefix):
+        with open(preprocessor.manifest_file, "a", encoding="utf-8") as manifest:
+            for index in range(200):
+                sha256 = f"{prefix}{index:04d}"
+                preprocessor._write_manifest(manifest, {"sha256": sha256, "source": "x" * 3000,
+                                                        "baked": preprocessor.baked_path(sha256), "location": None})
+
+    threads = [threading.Thread(target=append, args=(preprocessor, prefix))
+               for preprocessor, prefix in zip(preprocessors, "ab")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(ImagePreprocessor(cache_dir)._manifest) == 400
+
+
+def test_preprocess_bakes_once_and_reuses_the_manifest(tmp_path):
+    source = tmp_path / "photo.jpg"
+    Image.new("RGB", (300, 200), "red").save(source)
+    cache_dir = str(tmp_path / "cache")
+
+    preprocessor = ImagePreprocessor(cache_dir, size=64, workers=1)
+    assert preprocessor.preprocess([str(source)]) == [str(source)]
+    record = preprocessor.get(str(source))
+    with Image.open(record["baked"]) as baked:
+        assert baked.size == (64, 64)
+
+    reopened = ImagePreprocessor(cache_dir, size=64, workers=1, fingerprints=preprocessor.fingerprints)
+    reopened._pool = None  # A cached image must not be baked again
+    assert reopened.preprocess([str(source)]) == [str(source)]
+    assert reopened.get(str(source))["baked"] == record["baked"]
@@ -0,0 +1,139 @@
+import threading
+
+import pytest
+
+from utils import resilience
+from utils.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def fail(message="down"):
+    raise ConnectionError(message)
+
+
+def make_caller(clock, **settings):
+    settings.setdefault("retries", 0)
+    return ResilientCaller("test", sleep=clock.sleep, clock=clock, **settings)
+
+
+def test_breaker_opens_half_opens_and_closes():
+    clock = FakeClock()
+    caller = make_caller(clock, failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            caller.call(fail)
+    assert caller.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        caller.call(lambda: "ok")
+
+    # One trial call after the timeout; a failed trial opens the circuit again
+    clock.now += 60
+    with pytest.raises(ConnectionError):
+        caller.call(fail)
+    assert caller.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        caller.call(lambda: "ok")
+
+    clock.now += 60
+    assert caller.call(lambda: "ok") == "ok"
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+    assert caller.stats()["circuit_opens"] == 2
+    assert caller.stats()["short_circuits"] == 2
+    caller.close()
+
+
+def test_half_open_breaker_lets_one_trial_call_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    assert breaker.record_failure()
+    assert not breaker.allow()
+    clock.now += 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+
+def test_retry_succeeds_after_a_failed_attempt(monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    clock = FakeClock()
+    caller = make_caller(clock, retries=2, backoff=1.0)
+    answers = iter([ConnectionError("reset"), "ok"])
+
+    def flaky():
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert caller.call(flaky) == "ok"
+    assert clock.now == 1.0
+    stats = caller.stats()
+    assert (stats["errors"], stats["retries"], stats["successes"]) == (1, 1, 1)
+    caller.close()
+
+
+def test_no_retry_is_started_past_the_deadline(monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    clock = FakeClock()
+    caller = make_caller(clock, retries=5, backoff=4.0, deadline=10)
+    calls = []
+
+    def failing():
+        calls.append(clock.now)
+        fail()
+
+    with pytest.raises(ConnectionError):
+        caller.call(failing)
+    # Attempt at 0, backoff 4, attempt at 4; the next backoff of 8 would end past the deadline
+    assert calls == [0.0, 4.0]
+    assert caller.stats()["retries"] == 1
+    caller.close()
+
+
+def test_hedged_request_wins_over_a_slow_one():
+    clock = FakeClock()
+    caller = make_caller(clock, timeout=5, hedge_after=0.05)
+    release = threading.Event()
+    calls = []
+
+    def request():
+        calls.append(None)
+        if len(calls) == 1:
+            release.wait(5)
+            return "slow"
+        return "fast"
+
+    try:
+        assert caller.call(request) == "fast"
+    finally:
+        release.set()
+    stats = caller.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+    caller.close()
+
+
+def test_failed_request_is_not_hedged():
+    clock = FakeClock()
+    caller = make_caller(clock, timeout=5, hedge_after=1)
+    calls = []
+
+    def failing():
+        calls.append(None)
+        fail()
+
+    with pytest.raises(ConnectionError):
+        caller.call(failing)
+    assert len(calls) == 1
+    assert caller.stats()["hedges"] == 0
+    caller.close()
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from utils.scheduler import Scheduler, VirtualClock
+
+
+def at(hour, minute=0, day=1):
+    return datetime(2024, 6, day, hour, minute)
+
+
+def test_slot_crossing_midnight():
+    clock = VirtualClock(at(23, 0))
+    scheduler = Scheduler([("23:30", "00:30")], clock=clock.now)
+
+    assert not scheduler.is_within_schedule()
+    assert scheduler.time_until_next_slot() == 1800
+    clock.sleep(scheduler.time_until_next_slot())
+    assert clock.now() == at(23, 30)
+    assert scheduler.current_slot() == (at(23, 30), at(0, 30, day=2))
+
+    clock.sleep(45 * 60)
+    assert scheduler.is_within_schedule()
+    assert scheduler.current_slot() == (at(23, 30), at(0, 30, day=2))
+
+    clock.sleep(30 * 60)
+    assert scheduler.next_slot_start() == at(23, 30, day=2)
+
+
+def test_overlapping_slots_are_merged():
+    clock = VirtualClock(at(11, 30))
+    scheduler = Scheduler([("10:00", "12:00"), ("09:00", "11:00"), ("15:00", "16:00")], clock=clock.now)
+
+    assert scheduler.current_slot() == (at(9), at(12))
+    assert scheduler.next_slot_start(at(12, 30)) == at(15)
+    assert scheduler.next_slot_start(at(16, 30)) == at(9, day=2)
+    assert scheduler.slots_between(at(8), at(17)) == [(at(9), at(12)), (at(15), at(16))]
+
+
+def test_limit_per_slot_moves_to_the_next_slot():
+    clock = VirtualClock(at(9))
+    scheduler = Scheduler([("09:00", "10:00"), ("18:00", "19:00")], clock=clock.now, limit_per_slot=2)
+
+    scheduler.record_post()
+    clock.sleep(600)
+    assert scheduler.can_post()
+    scheduler.record_post()
+
+    assert scheduler.posts_in_slot() == 2
+    assert not scheduler.can_post()
+    assert scheduler.next_post_time() == at(18)
+    assert scheduler.time_until_next_post() == timedelta(hours=8, minutes=50).total_seconds()
+
+
+def test_limit_per_day_moves_to_the_next_day():
+    clock = VirtualClock(at(9))
+    scheduler = Scheduler([("09:00", "10:00"), ("18:00", "19:00")], clock=clock.now, limit_per_day=2)
+
+    scheduler.record_post()
+    scheduler.record_post(at(9, 30))
+
+    assert scheduler.posts_today() == 2
+    assert scheduler.next_post_time(at(9, 45)) == at(9, day=2)
+    assert scheduler.plan(3, now=at(9, 45), delay=60) == [at(9, day=2), at(9, 1, day=2), at(9, day=3)]
+
+
+def test_limit_per_day_in_a_slot_crossing_midnight():
+    clock = VirtualClock(at(23, 10))
+    scheduler = Scheduler([("23:00", "01:00")], clock=clock.now, limit_per_day=1)
+
+    scheduler.record_post()
+
+    assert not scheduler.can_post()
+    assert scheduler.next_post_time() == at(0, 0, day=2)
@@ -0,0 +1,193 @@
+import os
+import struct
+from PIL import Image
+
+# IFD0 tags
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+# Exif IFD tags
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_PIXEL_X = 0xA002
+TAG_PIXEL_Y = 0xA003
+# GPS IFD tags
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
+# TIFF field type -> size of one value in bytes
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+# JPEG start-of-frame markers, they hold the image dimensions
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def gps_to_lat_lng(gps):
+    """
+    Convert a GPS IFD (tag -> value, degrees / minutes / seconds) to decimal (lat, lng).
+
+    Returns:
+        tuple: (lat, lng), or None if the coordinates are missing.
+    """
+    try:
+        lat = _degrees(gps[GPS_LATITUDE])
+        lng = _degrees(gps[GPS_LONGITUDE])
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    if gps.get(GPS_LATITUDE_REF) in ("S", b"S"):
+        lat = -lat
+    if gps.get(GPS_LONGITUDE_REF) in ("W", b"W"):
+        lng = -lng
+    return lat, lng
+
+
+def read_exif(source):
+    """
+    Read the metadata of an image from its header, without decoding any pixels.
+
+    JPEGs are parsed directly: the markers are walked up to the first frame header and only
+    the EXIF segment is read, a few KB of the file. Other formats go through Pillow, which
+    also reads just the header when no pixels are accessed.
+
+    Parameters:
+        source (str or file): Image path or binary file object.
+
+    Returns:
+        dict: width, height, orientation, gps ((lat, lng) or None), taken (EXIF
+        "YYYY:MM:DD HH:MM:SS" or None), make, model; missing values are None.
+    """
+    meta = {"width": None, "height": None, "orientation": None, "gps": None,
+            "taken": None, "make": None, "model": None}
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            return _read(file, meta)
+    source.seek(0)
+    try:
+        return _read(source, meta)
+    finally:
+        source.seek(0)
+
+
+def _read(file, meta):
+    if file.read(2) != b"\xff\xd8":
+        file.seek(0)
+        return _read_with_pillow(file, meta)
+    try:
+        _read_jpeg(file, meta)
+    except (struct.error, IndexError, ValueError, UnicodeDecodeError):
+        pass  # A damaged header leaves the rest of the fields unknown
+    return meta
+
+
+def _read_jpeg(file, meta):
+    exif_seen = False
+    while True:
+        byte = file.read(1)
+        if not byte:
+            return
+        if byte != b"\xff":
+            continue
+        marker = file.read(1)
+        while marker == b"\xff":  # Fill bytes
+            marker = file.read(1)
+        if not marker:
+            return
+        marker = marker[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue  # Markers without a segment
+        if marker in (0xD9, 0xDA):
+            return  # End of image or start of the compressed data
+
+        length = struct.unpack(">H", file.read(2))[0]
+        if marker == 0xE1 and not exif_seen:
+            segment = file.read(length - 2)
+            if segment.startswith(b"Exif\x00\x00"):  # Other APP1 segments hold XMP
+                exif_seen = True
+                _read_tiff(segment[6:], meta)
+        elif marker in _SOF_MARKERS:
+            height, width = struct.unpack(">HH", file.read(5)[1:5])
+            meta["width"], meta["height"] = width, height
+            return
+        else:
+            file.seek(length - 2, os.SEEK_CUR)
+
+
+def _read_tiff(tiff, meta):
+    if tiff[:2] == b"II":
+        endian = "<"
+    elif tiff[:2] == b"MM":
+        endian = ">"
+    else:
+        return
+    ifd0 = _read_ifd(tiff, struct.unpack(endian + "I", tiff[4:8])[0], endian)
+    meta["make"] = ifd0.get(TAG_MAKE)
+    meta["model"] = ifd0.get(TAG_MODEL)
+    meta["orientation"] = ifd0.get(TAG_ORIENTATION)
+    meta["taken"] = ifd0.get(TAG_DATETIME)
+
+    if TAG_EXIF_IFD in ifd0:
+        exif_ifd = _read_ifd(tiff, ifd0[TAG_EXIF_IFD], endian)
+        meta["taken"] = exif_ifd.get(TAG_DATETIME_ORIGINAL) or meta["taken"]
+        meta["width"] = exif_ifd.get(TAG_PIXEL_X)
+        meta["height"] = exif_ifd.get(TAG_PIXEL_Y)
+    if TAG_GPS_IFD in ifd0:
+        meta["gps"] = gps_to_lat_lng(_read_ifd(tiff, ifd0[TAG_GPS_IFD], endian))
+
+
+def _read_ifd(tiff, offset, endian):
+    """
+    Read the entries of one IFD as tag -> value (a single value or a tuple; text as str).
+    """
+    entries = {}
+    count = struct.unpack_from(endian + "H", tiff, offset)[0]
+    for index in range(count):
+        tag, field_type, values = struct.unpack_from(endian + "HHI", tiff, offset + 2 + index * 12)
+        size = _TYPE_SIZES.get(field_type)
+        if size is None:
+            continue
+        position = offset + 2 + index * 12 + 8
+        if size * values > 4:
+            position = struct.unpack_from(endian + "I", tiff, position)[0]
+        data = tiff[position:position + size * values]
+        if len(data) < size * values:
+            continue
+
+        if field_type == 2:
+            value = data.split(b"\x00", 1)[0].decode("ascii", "replace").strip() or None
+        elif field_type in (1, 7):
+            value = data
+        elif field_type in (5, 10):
+            code = "I" if field_type == 5 else "i"
+            numbers = struct.unpack(f"{endian}{2 * values}{code}", data)
+            value = tuple(numerator / denominator if denominator else 0.0
+                          for numerator, denominator in zip(numbers[::2], numbers[1::2]))
+        else:
+            code = {3: "H", 4: "I", 9: "i"}[field_type]
+            value = struct.unpack(f"{endian}{values}{code}", data)
+            value = value[0] if values == 1 else value
+        entries[tag] = value
+    return entries
+
+
+def _read_with_pillow(file, meta):
+    try:
+        with Image.open(file) as img:
+            meta["width"], meta["height"] = img.size
+            exif = img.getexif()
+            meta["orientation"] = exif.get(TAG_ORIENTATION)
+            meta["make"] = exif.get(TAG_MAKE)
+            meta["model"] = exif.get(TAG_MODEL)
+            meta["taken"] = exif.get_ifd(TAG_EXIF_IFD).get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME)
+            gps = exif.get_ifd(TAG_GPS_IFD)
+            meta["gps"] = gps_to_lat_lng(gps) if gps else None
+    except Exception as e:
+        print(f"Error reading image metadata: {e}")
+    return meta
+
+
+def _degrees(value):
+    degrees, minutes, seconds = (float(part) for part in value)
+    return degrees + minutes / 60.0 + seconds / 3600.0
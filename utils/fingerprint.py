@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import threading
+from PIL import Image
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    Calculate the SHA-256 of a file without loading it into memory.
+
+    Parameters:
+        path (str): Path to the file.
+        chunk_size (int): Read block size in bytes.
+
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def perceptual_hash(image_input, hash_size=8):
+    """
+    Calculate a difference hash (dHash) of an image.
+
+    Visually similar images (re-exported, recompressed, resized) get hashes with a small
+    Hamming distance.
+
+    Parameters:
+        image_input (str or PIL.Image): Path to the image or already loaded PIL image.
+        hash_size (int): Hash side, the result has hash_size * hash_size bits.
+
+    Returns:
+        int: The hash as an integer.
+    """
+    if isinstance(image_input, str):
+        with Image.open(image_input) as img:
+            # Let the JPEG decoder skip most of the pixels, a tiny thumbnail is enough
+            img.draft("L", (hash_size * 8, hash_size * 8))
+            small = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    else:
+        small = image_input.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(hash1, hash2):
+    """
+    Number of differing bits between two integer hashes.
+    """
+    return bin(hash1 ^ hash2).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance.
+
+    Lookups of all hashes within a small distance visit only a fraction of the tree,
+    so near-duplicate search stays fast for large libraries.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, values, {distance: child}]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, hash_value, value):
+        """
+        Insert a hash with an attached value.
+        """
+        self._size += 1
+        if self._root is None:
+            self._root = [hash_value, [value], {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, [value], {}]
+                return
+            node = child
+
+    def search(self, hash_value, max_distance):
+        """
+        Find every stored value whose hash is within max_distance.
+
+        Returns:
+            list: (distance, value) tuples sorted by distance.
+        """
+        results = []
+        if self._root is None:
+            return results
+
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, value) for value in node[1])
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for d, child in node[2].items() if low <= d <= high)
+
+        results.sort(key=lambda item: item[0])
+        return results
+
+
+class FingerprintCache:
+    """
+    Persistent cache of file fingerprints keyed by (path, size, mtime).
+
+    Unchanged files are never re-hashed. Records are appended as JSON lines; the last
+    record for a path wins and the file is compacted on load when it gets too stale.
+    """
+
+    def __init__(self, cache_file):
+        """
+        Parameters:
+            cache_file (str): Path to the cache file (JSON lines).
+        """
+        self.cache_file = cache_file
+        self._records = {}
+        self._lock = threading.Lock()  # The folder watcher fingerprints from its own thread
+        stale = self._load()
+        if stale > max(1000, len(self._records)):
+            self._compact()
+        self._file = open(self.cache_file, 'a', encoding='utf-8')
+
+    def fingerprint(self, path, image=None, perceptual=False):
+        """
+        Return the fingerprint of a file, computing only what is missing.
+
+        Parameters:
+            path (str): Path to the image file.
+            image (PIL.Image, optional): Already decoded image, used for the perceptual hash.
+            perceptual (bool): Whether the perceptual hash is needed.
+
+        Returns:
+            dict: {"sha256": str, "phash": int or None}
+        """
+        abs_path = os.path.abspath(path)
+        stat = os.stat(abs_path)
+        record = self._records.get(abs_path)
+        if record is None or record["size"] != stat.st_size or record["mtime_ns"] != stat.st_mtime_ns:
+            record = {"path": abs_path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                      "sha256": file_sha256(abs_path), "phash": None}
+            changed = True
+        else:
+            changed = False
+
+        if perceptual and record["phash"] is None:
+            record = dict(record, phash=perceptual_hash(image if image is not None else abs_path))
+            changed = True
+
+        if changed:
+            with self._lock:
+                self._records[abs_path] = record
+                self._file.write(json.dumps(record) + "\n")
+                self._file.flush()
+
+        return {"sha256": record["sha256"], "phash": record["phash"]}
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def _load(self):
+        stale = 0
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        stale += 1
+                        continue
+                    if record.get("path") in self._records:
+                        stale += 1
+                    self._records[record.get("path")] = record
+        except FileNotFoundError:
+            pass
+        return stale
+
+    def _compact(self):
+        temp_file = self.cache_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            for record in self._records.values():
+                file.write(json.dumps(record) + "\n")
+        os.replace(temp_file, self.cache_file)
@@ -0,0 +1,372 @@
+import heapq
+import json
+import os
+import threading
+import time
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Optional: the watcher falls back to polling
+    FileSystemEventHandler = object
+    Observer = None
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+
+def is_image_file(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def scan_images(folder_path, recursive=True, start_after=None):
+    """
+    Yield (path, stat) for every image below a folder.
+
+    The folder is walked with os.scandir in name order, holding only the listings of the
+    folders on the current path, so a huge folder is never listed up front and a scan can
+    be resumed after `start_after`. Hidden files and folders (e.g. the ledger) are skipped.
+
+    Parameters:
+        folder_path (str): Image folder.
+        recursive (bool): Also scan subfolders.
+        start_after (str, optional): Path relative to folder_path; images up to and including it are skipped.
+    """
+    cursor = tuple(start_after.replace("\\", "/").split("/")) if start_after else None
+    stack = [(_sorted_entries(folder_path), ())]
+    while stack:
+        entries, parts = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+            continue
+        if entry.name.startswith("."):
+            continue
+
+        entry_parts = parts + (entry.name,)
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                # Skip folders that lie entirely before the cursor
+                if recursive and (cursor is None or entry_parts >= cursor[:len(entry_parts)]):
+                    stack.append((_sorted_entries(entry.path), entry_parts))
+                continue
+            if not entry.is_file() or not is_image_file(entry.name):
+                continue
+            if cursor is not None and entry_parts <= cursor:
+                continue
+            yield entry.path, entry.stat()
+        except OSError:
+            continue
+
+
+def _sorted_entries(directory):
+    try:
+        with os.scandir(directory) as scanner:
+            return iter(sorted(scanner, key=lambda entry: entry.name))
+    except OSError as e:
+        print(f"Error while scanning {directory}: {e}")
+        return iter(())
+
+
+class PendingQueue:
+    """
+    Persistent priority queue of images waiting to be posted, oldest first.
+
+    Changes are appended to a JSON lines journal, so queued images and the scan cursor
+    survive a restart. The journal is compacted on load when most of it is stale.
+    """
+
+    def __init__(self, queue_file):
+        """
+        Parameters:
+            queue_file (str): Journal file of the queue.
+        """
+        self.queue_file = queue_file
+        self.cursor = None  # Last image of an unfinished scan, see FolderWatcher.scan()
+        self._priorities = {}
+        self._heap = []
+        self._taken = set()  # Popped in this process; not queued again until restart
+        self._lock = threading.Condition()
+
+        lines = self._load()
+        if lines > 2 * len(self._priorities) + 100:
+            self._compact()
+        self._file = open(self.queue_file, 'a', encoding='utf-8')
+
+    def __len__(self):
+        return len(self._priorities)
+
+    def __contains__(self, path):
+        return path in self._priorities
+
+    def push(self, path, priority):
+        """
+        Queue an image (e.g. by modification time).
+
+        Returns:
+            bool: False if it is already queued or was taken by this process.
+        """
+        with self._lock:
+            if path in self._priorities or path in self._taken:
+                return False
+            self._priorities[path] = priority
+            heapq.heappush(self._heap, (priority, path))
+            self._write({"path": path, "priority": priority})
+            self._lock.notify_all()
+            return True
+
+    def pop_many(self, count):
+        """
+        Take up to `count` images with the lowest priority.
+        """
+        paths = []
+        with self._lock:
+            while self._heap and len(paths) < count:
+                priority, path = heapq.heappop(self._heap)
+                if self._priorities.get(path) != priority:
+                    continue  # Stale heap entry
+                del self._priorities[path]
+                self._taken.add(path)
+                paths.append(path)
+            if paths:
+                for path in paths:
+                    self._write({"path": path, "removed": True})
+        return paths
+
+    def peek(self, count):
+        """
+        Return up to `count` queued images in priority order without taking them.
+        """
+        with self._lock:
+            return [path for path, _ in heapq.nsmallest(count, self._priorities.items(), key=lambda item: (item[1], item[0]))]
+
+    def set_cursor(self, cursor):
+        with self._lock:
+            if cursor != self.cursor:
+                self.cursor = cursor
+                self._write({"cursor": cursor})
+
+    def wait(self, timeout):
+        """
+        Block until the queue is not empty or the timeout expires.
+
+        Returns:
+            bool: True if images are queued.
+        """
+        with self._lock:
+            return self._lock.wait_for(lambda: self._priorities, timeout)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def _load(self):
+        lines = 0
+        try:
+            with open(self.queue_file, 'r', encoding='utf-8') as file:
+                for line in file:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line
+                    if "cursor" in record:
+                        self.cursor = record["cursor"]
+                    elif record.get("removed"):
+                        self._priorities.pop(record["path"], None)
+                    else:
+                        self._priorities[record["path"]] = record["priority"]
+        except FileNotFoundError:
+            pass
+        self._heap = [(priority, path) for path, priority in self._priorities.items()]
+        heapq.heapify(self._heap)
+        return lines
+
+    def _compact(self):
+        temp_file = self.queue_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            for priority, path in sorted(self._heap):
+                file.write(json.dumps({"path": path, "priority": priority}) + "\n")
+            file.write(json.dumps({"cursor": self.cursor}) + "\n")
+        os.replace(temp_file, self.queue_file)
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notice(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.notice(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.notice(event.dest_path)
+
+
+class FolderWatcher:
+    """
+    Feeds new images of a folder into a PendingQueue.
+
+    Uses watchdog (inotify, FSEvents, ...) when it is installed and falls back to
+    rescanning the folder every poll_interval seconds. Files are queued only once they
+    haven't changed for settle_time seconds, so half-copied photos are never posted.
+    """
+
+    def __init__(self, folder_path, queue, accept=None, recursive=True, poll_interval=60, settle_time=5,
+                 use_watchdog=True):
+        """
+        Parameters:
+            folder_path (str): Image folder.
+            queue (PendingQueue): Queue to feed.
+            accept (callable, optional): Called with a path, returns False for images to skip (e.g. posted ones).
+            recursive (bool): Also watch subfolders.
+            poll_interval (float): Seconds between rescans without watchdog.
+            settle_time (float): Seconds a file must be unchanged before it is queued.
+            use_watchdog (bool): Use watchdog if it is installed.
+        """
+        self.folder_path = folder_path
+        self.queue = queue
+        self.accept = accept
+        self.recursive = recursive
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.use_watchdog = use_watchdog and Observer is not None
+        self._recent = {}  # Path -> time of the last change seen, until it settles
+        self._rejected = {}  # Path -> mtime when accept() turned it down
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._observer = None
+
+    def scan(self, wait=False):
+        """
+        Queue every settled image of the folder that isn't queued yet.
+
+        The scan position is saved in the queue, so an interrupted scan of a huge folder
+        continues where it stopped. Images changed less than settle_time ago are queued
+        by the watch loop once they settle, or before returning with `wait`.
+
+        Parameters:
+            wait (bool): Wait for the images that are still changing, for a single scan without watching.
+
+        Returns:
+            int: Number of images queued.
+        """
+        queued = 0
+        now = time.time()
+        for count, (path, stat) in enumerate(scan_images(self.folder_path, self.recursive, self.queue.cursor), 1):
+            if now - stat.st_mtime < self.settle_time:
+                self.notice(path, stat.st_mtime)
+            elif self._offer(path, stat.st_mtime):
+                queued += 1
+            if count % 500 == 0:
+                self.queue.set_cursor(os.path.relpath(path, self.folder_path))
+            if self._stop.is_set():
+                return queued
+        self.queue.set_cursor(None)
+        if wait:
+            queued += self.wait_settled()
+        return queued
+
+    def wait_settled(self):
+        """
+        Block until every noticed file has settled (or stop() is called) and queue them.
+
+        Returns:
+            int: Number of images queued.
+        """
+        queued = 0
+        while not self._stop.is_set():
+            queued += self._queue_settled()
+            with self._lock:
+                if not self._recent:
+                    break
+                wait = min(self._recent.values()) + self.settle_time - time.time()
+            self._stop.wait(max(0.1, wait))
+        return queued
+
+    def notice(self, path, changed_at=None):
+        """
+        Remember a created or changed file; it is queued once it settles.
+
+        Parameters:
+            path (str): Image path.
+            changed_at (float, optional): Time of the change, defaults to now.
+        """
+        if is_image_file(path) and not os.path.basename(path).startswith("."):
+            with self._lock:
+                self._recent[path] = changed_at or time.time()
+
+    def start(self):
+        """
+        Scan the folder once and keep watching it in the background.
+        """
+        if self.use_watchdog:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), self.folder_path, recursive=self.recursive)
+            self._observer.start()
+            print(f"Watching {self.folder_path} for new images")
+        else:
+            print(f"Polling {self.folder_path} for new images every {self.poll_interval} seconds")
+
+        queued = self.scan()
+        print(f"Found {queued} new images, {len(self.queue)} queued")
+        self._thread = threading.Thread(target=self._watch, name="folder-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _watch(self):
+        last_scan = time.monotonic()
+        while not self._stop.wait(min(1.0, self.settle_time or 1.0)):
+            self._queue_settled()
+            if not self.use_watchdog and time.monotonic() - last_scan >= self.poll_interval:
+                self.scan()
+                last_scan = time.monotonic()
+
+    def _queue_settled(self):
+        queued = 0
+        now = time.time()
+        with self._lock:
+            paths = [path for path, seen in self._recent.items() if now - seen >= self.settle_time]
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                with self._lock:
+                    self._recent.pop(path, None)
+                continue
+            with self._lock:
+                if now - stat.st_mtime < self.settle_time:
+                    self._recent[path] = stat.st_mtime  # Still being written
+                    continue
+                self._recent.pop(path, None)
+            if self._offer(path, stat.st_mtime):
+                queued += 1
+        return queued
+
+    def _offer(self, path, mtime):
+        if path in self.queue or self._rejected.get(path) == mtime:
+            return False
+        try:
+            if self.accept is not None and not self.accept(path):
+                self._rejected[path] = mtime
+                return False
+        except Exception as e:
+            print(f"Error while checking {path}: {e}")
+            return False
+        return self.queue.push(path, mtime)
@@ -0,0 +1,146 @@
+import bisect
+import csv
+import json
+import os
+import threading
+import time
+from array import array
+import requests
+from requests.adapters import HTTPAdapter
+from utils.utils import get_coordinates_from_name
+
+
+class Gazetteer:
+    """
+    Offline place-name index loaded from a GeoNames dump or a simple CSV.
+
+    Names are kept in one sorted list with the coordinates and populations in parallel
+    arrays of doubles, so even the 12M-row allCountries dump stays compact and a lookup
+    is a binary search.
+    """
+
+    def __init__(self, path, min_population=0):
+        """
+        Parameters:
+            path (str): GeoNames tab-separated file (e.g. cities15000.txt) or a CSV with
+                name,lat,lon[,population] columns.
+            min_population (int): Skip GeoNames places with fewer inhabitants.
+        """
+        rows = []
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            if path.endswith(".csv"):
+                for row in csv.reader(file):
+                    if not row or row[0].startswith("#") or row[0] == "name":
+                        continue
+                    population = float(row[3]) if len(row) > 3 and row[3] else 0.0
+                    rows.append((row[0], float(row[1]), float(row[2]), population))
+            else:
+                for line in file:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) < 15:
+                        continue
+                    population = float(fields[14] or 0)
+                    if population < min_population:
+                        continue
+                    lat, lon = float(fields[4]), float(fields[5])
+                    names = {fields[1], fields[2]}
+                    names.update(name for name in fields[3].split(",") if name)
+                    rows.extend((name, lat, lon, population) for name in names)
+
+        rows = [(self.normalize(name), lat, lon, population) for name, lat, lon, population in rows]
+        rows.sort(key=lambda row: row[0])
+        self._names = [row[0] for row in rows]
+        self._lats = array('d', (row[1] for row in rows))
+        self._lons = array('d', (row[2] for row in rows))
+        self._populations = array('d', (row[3] for row in rows))
+
+    def __len__(self):
+        return len(self._names)
+
+    @staticmethod
+    def normalize(name):
+        return " ".join(name.casefold().split())
+
+    def lookup(self, name):
+        """
+        Return (lat, lon) of the most populated place with this name, or None.
+        """
+        key = self.normalize(name)
+        start = bisect.bisect_left(self._names, key)
+        end = bisect.bisect_right(self._names, key, lo=start)
+        if start == end:
+            return None
+        best = max(range(start, end), key=lambda index: self._populations[index])
+        return self._lats[best], self._lons[best]
+
+
+class Geocoder:
+    """
+    Place name -> coordinates with an offline gazetteer, a persistent cache and a pooled
+    HTTP session for Nominatim.
+
+    Lookups go gazetteer -> cache -> Nominatim, so the default city never needs the network
+    after the first run.
+    """
+
+    def __init__(self, cache_file=None, ttl=90 * 24 * 3600, gazetteer_file=None, timeout=10, clock=time.time):
+        """
+        Parameters:
+            cache_file (str, optional): JSON file for cached results.
+            ttl (float): Seconds before a cached result is looked up again.
+            gazetteer_file (str, optional): Offline gazetteer, see Gazetteer.
+            timeout (float): Nominatim request timeout in seconds.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.timeout = timeout
+        self.clock = clock
+        self.gazetteer = Gazetteer(gazetteer_file) if gazetteer_file else None
+        self._lock = threading.Lock()
+        self._cache = self._load_cache()
+
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=2))
+
+    def get_coordinates(self, location_name):
+        """
+        Return (lat, lon) for a place name, or (None, None) if it can't be found.
+        """
+        if self.gazetteer:
+            coordinates = self.gazetteer.lookup(location_name)
+            if coordinates:
+                return coordinates
+
+        key = Gazetteer.normalize(location_name)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and (self.ttl is None or cached["time"] >= self.clock() - self.ttl):
+            return cached["lat"], cached["lon"]
+
+        lat, lon = get_coordinates_from_name(location_name, session=self.session, timeout=self.timeout)
+        if lat is None:
+            # Serve a stale answer rather than none at all
+            return (cached["lat"], cached["lon"]) if cached else (None, None)
+
+        with self._lock:
+            self._cache[key] = {"lat": lat, "lon": lon, "time": self.clock()}
+            self._save_cache()
+        return lat, lon
+
+    def _load_cache(self):
+        if not self.cache_file:
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        temp_file = self.cache_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump(self._cache, file)
+        os.replace(temp_file, self.cache_file)
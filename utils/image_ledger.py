@@ -0,0 +1,183 @@
+import json
+import os
+
+
+class ImageLedger:
+    """
+    Append-only record of posted images with an in-memory index.
+
+    Every record is stored as a single JSON line, so posting an image costs one
+    append (flushed and fsync'ed) instead of rewriting the whole log. On start
+    the file is read once into dictionaries keyed by image name and by content
+    hash, which makes membership checks O(1).
+    """
+
+    def __init__(self, ledger_file, legacy_log_file=None):
+        """
+        Open (or create) the ledger.
+
+        Parameters:
+            ledger_file (str): Path to the append-only ledger (JSON lines).
+            legacy_log_file (str, optional): Path to an old-style log.json. It is imported
+                once when the ledger file does not exist yet.
+        """
+        self.ledger_file = ledger_file
+        self._entries = []
+        self._by_name = {}
+        self._by_sha256 = {}
+
+        if not os.path.exists(self.ledger_file):
+            legacy_entries = self._read_legacy_log(legacy_log_file) if legacy_log_file else []
+            self._create(legacy_entries)
+        else:
+            self._load()
+
+        self._file = open(self.ledger_file, 'a', encoding='utf-8')
+
+    def __contains__(self, image_name):
+        return image_name in self._by_name
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_by_name(self, image_name):
+        """
+        Return the stored records for an image name (several folders may share a name).
+        """
+        return list(self._by_name.get(image_name, ()))
+
+    def get_by_sha256(self, sha256):
+        """
+        Return the stored record for a content hash, or None.
+        """
+        return self._by_sha256.get(sha256)
+
+    def entries(self):
+        """
+        Return all records in insertion order.
+        """
+        return list(self._entries)
+
+    def append(self, entry):
+        """
+        Persist a new record with a single durable append.
+
+        Records with a "sha256" are unique by content, records without it by name.
+
+        Parameters:
+            entry (dict): Record to store, must contain "image_name".
+
+        Returns:
+            bool: False if the image was already in the ledger, True otherwise.
+        """
+        if self._is_duplicate(entry):
+            return False
+
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._index(entry)
+        return True
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def _is_duplicate(self, entry):
+        if entry.get("sha256"):
+            return entry["sha256"] in self._by_sha256
+        return entry["image_name"] in self._by_name
+
+    def _index(self, entry):
+        self._entries.append(entry)
+        self._by_name.setdefault(entry["image_name"], []).append(entry)
+        if entry.get("sha256"):
+            self._by_sha256[entry["sha256"]] = entry
+
+    def _load(self):
+        """
+        Read the ledger into memory.
+
+        Blank and malformed lines are skipped with a warning and left in the file. Only a
+        torn last line (crash during append: no trailing newline, not a complete record) is
+        cut off; a complete last record without its newline is kept and the newline added.
+        """
+        valid_size = 0
+        torn = False
+        missing_newline = False
+        with open(self.ledger_file, 'rb') as file:
+            for number, line in enumerate(file, 1):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if not line.endswith(b"\n"):  # Only the last line
+                    if not isinstance(entry, dict):
+                        torn = True
+                        break
+                    missing_newline = True
+                valid_size += len(line)
+                if not isinstance(entry, dict):
+                    print(f"Ledger {self.ledger_file}: skipping unreadable line {number}")
+                elif entry.get("image_name") and not self._is_duplicate(entry):
+                    self._index(entry)
+
+        if torn:
+            print(f"Ledger {self.ledger_file}: dropping incomplete record at byte {valid_size}")
+            with open(self.ledger_file, 'r+b') as file:
+                file.truncate(valid_size)
+                file.flush()
+                os.fsync(file.fileno())
+        elif missing_newline:
+            with open(self.ledger_file, 'ab') as file:
+                file.write(b"\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+    def _create(self, entries):
+        """
+        Write the initial ledger atomically (temp file + rename).
+        """
+        temp_file = self.ledger_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            for entry in entries:
+                if self._is_duplicate(entry):
+                    continue
+                self._index(entry)
+                file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.ledger_file)
+        _fsync_dir(os.path.dirname(os.path.abspath(self.ledger_file)))
+
+        if entries:
+            print(f"Ledger {self.ledger_file}: imported {len(self._entries)} records from the legacy log")
+
+    @staticmethod
+    def _read_legacy_log(log_file):
+        """
+        Read an old-style log.json (a JSON list of {"image_name": ...} objects).
+        """
+        try:
+            with open(log_file, 'r') as file:
+                data = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+        return [entry for entry in data if isinstance(entry, dict) and entry.get("image_name")]
+
+
+def _fsync_dir(path):
+    """
+    Make a rename durable. Not supported on every platform, so failures are ignored.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -1,73 +1,111 @@
-import json
 import os
+from utils.image_ledger import ImageLedger
+from utils.fingerprint import FingerprintCache, BKTree
+from utils.metrics import metrics
 
 class ImageManager:
     """
     A class to manage image-related operations, including resizing and tracking image metadata.
+
+    Images are identified by content: the SHA-256 of the file catches renamed and copied
+    photos, and the optional perceptual hash catches re-exported or recompressed ones.
     """
 
-    def __init__(self, folder_path):
+    def __init__(self, folder_path, use_perceptual_hash=False, max_hash_distance=6, ledger_name="log.jsonl",
+                 fingerprints=None):
         """
-        Initialize the ImageManager with a log file.
+        Initialize the ImageManager with a posted-image ledger.
+
+        The ledger lives next to the images as log.jsonl. An existing log.json from
+        older versions is imported on first start.
 
         Parameters:
-            folder_path (str): Path to the log file.
+            folder_path (str): Path to the image folder.
+            use_perceptual_hash (bool): Also reject near-duplicates by perceptual hash.
+            max_hash_distance (int): Max Hamming distance (of 64 bits) to treat two images as the same.
+            ledger_name (str): Ledger file name, e.g. one per account when accounts share a folder.
+            fingerprints (FingerprintCache, optional): Fingerprint cache to use instead of the one in the folder.
         """
-        self.log_file = folder_path + "//log.json"
-
-        # Initialize the log file if it doesn't exist
-        try:
-            with open(self.log_file, 'r') as file:
-                json.load(file)
-        except (FileNotFoundError, json.JSONDecodeError):
-            with open(self.log_file, 'w') as file:
-                json.dump([], file)
-
-    def add_image_to_log(self, image_path, additional_info=None):
+        self.log_file = os.path.join(folder_path, "log.json")
+        self.ledger = ImageLedger(os.path.join(folder_path, ledger_name), legacy_log_file=self.log_file)
+        self.fingerprints = fingerprints or FingerprintCache(os.path.join(folder_path, ".fingerprints.jsonl"))
+        self.use_perceptual_hash = use_perceptual_hash
+        self.max_hash_distance = max_hash_distance
+
+        self._phash_index = BKTree()
+        for entry in self.ledger.entries():
+            if entry.get("phash") is not None:
+                self._phash_index.add(entry["phash"], entry["image_name"])
+
+    @metrics.timed("image_manager_seconds", op="add")
+    def add_image_to_log(self, image_path, additional_info=None, image=None):
         """
         Add an image and its additional information to the log file.
 
         Parameters:
             image_path (str): Path to the image file.
             additional_info (dict, optional): Additional information about the image.
+            image (PIL.Image, optional): Decoded image, saves a decode for the perceptual hash.
         """
         image_name = os.path.basename(image_path)
 
-        with open(self.log_file, 'r') as file:
-            data = json.load(file)
-
-        # Check if the image is already in the log
-        if self.is_image_in_log(image_name):
-            print(f"Image '{image_name}' is already in the log.")
-            return
-
         # Add the new image entry
         entry = {"image_name": image_name}
+        if os.path.isfile(image_path):
+            entry.update(self.fingerprints.fingerprint(image_path, image, self.use_perceptual_hash))
         if additional_info:
             entry.update(additional_info)
-        data.append(entry)
 
-        # Save the updated log
-        with open(self.log_file, 'w') as file:
-            json.dump(data, file, indent=4)
+        if not self.ledger.append(entry):
+            print(f"Image '{image_name}' is already in the log.")
+        elif entry.get("phash") is not None:
+            self._phash_index.add(entry["phash"], image_name)
 
-    def is_image_in_log(self, image_name):
+    @metrics.timed("image_manager_seconds", op="lookup")
+    def is_image_in_log(self, image_path, image=None):
         """
         Check if an image is already in the log file.
 
+        Existing files are matched by content hash (and perceptual hash if enabled).
+        Bare names, and old log entries that carry no hash, are matched by name.
+
         Parameters:
-            image_name (str): Name of the image file to check.
+            image_path (str): Path (or name) of the image file to check.
+            image (PIL.Image, optional): Decoded image, saves a decode for the perceptual hash.
 
         Returns:
             bool: True if the image is in the log, False otherwise.
         """
-        with open(self.log_file, 'r') as file:
-            data = json.load(file)
+        image_name = os.path.basename(image_path)
+        if not os.path.isfile(image_path):
+            return image_name in self.ledger
+
+        if any(not entry.get("sha256") for entry in self.ledger.get_by_name(image_name)):
+            return True
+
+        fingerprint = self.fingerprints.fingerprint(image_path, image, self.use_perceptual_hash)
+        duplicate = self.ledger.get_by_sha256(fingerprint["sha256"])
+        if duplicate:
+            if duplicate["image_name"] != image_name:
+                print(f"Image '{image_name}' has the same content as posted '{duplicate['image_name']}'")
+                metrics.count("image_duplicates_total", kind="content")
+            return True
+
+        if fingerprint["phash"] is not None:
+            matches = self._phash_index.search(fingerprint["phash"], self.max_hash_distance)
+            if matches:
+                print(f"Image '{image_name}' looks like posted '{matches[0][1]}' (distance {matches[0][0]})")
+                metrics.count("image_duplicates_total", kind="perceptual")
+                return True
+
+        return False
 
-        return any(entry.get("image_name") == image_name for entry in data)
+    def close(self):
+        self.ledger.close()
+        self.fingerprints.close()
 
 
 # Example usage
-#manager = ImageManager('images/image_log.json')
+#manager = ImageManager('images')
 #manager.add_image_to_log('D://2.dev//1.src//InstaPoster//images//20231006_115929.jpg', {"size": "1080x1080", "format": "JPEG"})
 #print(manager.is_image_in_log('20231006_115930.jpg'))  # This should now return True
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from utils.image_ledger import ImageLedger
+
+
+class JobQueue:
+    """
+    Durable state of every post, one job per image, in a SQLite (WAL) database.
+
+    A job moves queued -> preprocessed -> labelled -> captioned -> uploading -> done and
+    keeps the result of every stage (baked file, location, labels, caption), so after a
+    crash the preparation resumes where it stopped instead of calling the APIs again.
+
+    A job found in "uploading" on start may or may not have been posted. It is moved to
+    "failed" rather than uploaded again; an operator can check the account and requeue it.
+    """
+
+    STATES = ("queued", "preprocessed", "labelled", "captioned", "uploading", "done", "failed")
+    ACTIVE = ("queued", "preprocessed", "labelled", "captioned")  # Jobs that are resumed on start
+    JSON_FIELDS = ("raw_location", "location", "labels")
+    FIELDS = ("sha256", "baked") + JSON_FIELDS + ("caption",)
+
+    def __init__(self, db_path, clock=time.time):
+        """
+        Parameters:
+            db_path (str): Path to the SQLite database.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.db_path = db_path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")  # A finished state must survive a power cut
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, state TEXT NOT NULL, "
+            "sha256 TEXT, baked TEXT, raw_location TEXT, location TEXT, labels TEXT, caption TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+
+    def recover(self):
+        """
+        Fail the jobs that were interrupted during the upload.
+
+        Returns:
+            int: Number of jobs moved to "failed".
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET state = 'failed', error = ?, updated = ? WHERE state = 'uploading'",
+                ("Interrupted during upload, check the account before requeueing", self.clock()),
+            )
+        return cursor.rowcount
+
+    def enqueue(self, path):
+        """
+        Return the job of an image, creating a queued one if there is none.
+        """
+        now = self.clock()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO jobs (path, state, created, updated) VALUES (?, 'queued', ?, ?)",
+                (path, now, now),
+            )
+        return self.get(path)
+
+    def get(self, path):
+        """
+        Return the job of an image as a dict, or None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE path = ?", (path,)).fetchone()
+        return self._to_dict(row)
+
+    def get_by_id(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def state(self, path):
+        """
+        Return the state of an image's job, or None if it has none.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT state FROM jobs WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def jobs(self, states=None, limit=None):
+        """
+        Return jobs (optionally only in the given states) in the order they were created.
+        """
+        query = "SELECT * FROM jobs"
+        params = []
+        if states:
+            query += f" WHERE state IN ({','.join('?' * len(states))})"
+            params.extend(states)
+        query += " ORDER BY id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def active(self, limit=None):
+        """
+        Return the jobs that still need preparing, oldest first.
+        """
+        return self.jobs(self.ACTIVE, limit)
+
+    def advance(self, path, state, **fields):
+        """
+        Store stage results and move the job forward to `state`.
+
+        A job never moves back (e.g. a late location result doesn't undo "captioned").
+
+        Parameters:
+            path (str): Image of the job.
+            state (str): New state, or None to only store the fields.
+            fields: Stage results (sha256, baked, raw_location, location, labels, caption).
+        """
+        assignments = ["updated = ?"]
+        params = [self.clock()]
+        for name, value in fields.items():
+            if name not in self.FIELDS:
+                raise ValueError(f"Unknown job field: {name}")
+            assignments.append(f"{name} = ?")
+            params.append(json.dumps(value, default=str) if name in self.JSON_FIELDS else value)
+
+        with self._lock:
+            if state is not None:
+                current = self._db.execute("SELECT state FROM jobs WHERE path = ?", (path,)).fetchone()
+                if current is None or self.STATES.index(state) > self.STATES.index(current[0]):
+                    assignments.append("state = ?")
+                    params.append(state)
+                if state == "done":
+                    assignments.append("error = NULL")
+            params.append(path)
+            self._db.execute(f"UPDATE jobs SET {', '.join(assignments)} WHERE path = ?", params)
+
+    def fail(self, path, error, max_attempts=1):
+        """
+        Record a failed attempt. The job stays where it is and is retried until it failed
+        max_attempts times, then it moves to "failed".
+
+        Returns:
+            bool: True if the job is failed for good.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT attempts FROM jobs WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                return False
+            attempts = row[0] + 1
+            failed = attempts >= max_attempts
+            if failed:
+                self._db.execute("UPDATE jobs SET state = 'failed', attempts = ?, error = ?, updated = ? WHERE path = ?",
+                                 (attempts, str(error), self.clock(), path))
+            else:
+                self._db.execute("UPDATE jobs SET attempts = ?, error = ?, updated = ? WHERE path = ?",
+                                 (attempts, str(error), self.clock(), path))
+        return failed
+
+    def requeue(self, job_ids=None, state="failed", reset=False, ledger=None, force=False):
+        """
+        Put jobs back into the queue.
+
+        Parameters:
+            job_ids (list, optional): Jobs to requeue; all jobs in `state` if omitted.
+            state (str): State of the jobs to requeue when no ids are given.
+            reset (bool): Also drop the stored stage results, so every stage runs again.
+            ledger (ImageLedger, optional): Ledger of the account; jobs whose image is in it are
+                posted already and not requeued.
+            force (bool): Requeue jobs that are in the ledger anyway.
+
+        Returns:
+            int: Number of requeued jobs.
+        """
+        assignments = "state = 'queued', attempts = 0, error = NULL, updated = ?"
+        if reset:
+            assignments += ", " + ", ".join(f"{name} = NULL" for name in self.FIELDS)
+        with self._lock:
+            if job_ids:
+                rows = self._db.execute(f"SELECT id, path, sha256 FROM jobs WHERE id IN ({','.join('?' * len(job_ids))})",
+                                        list(job_ids)).fetchall()
+            else:
+                rows = self._db.execute("SELECT id, path, sha256 FROM jobs WHERE state = ?", (state,)).fetchall()
+
+            ids = []
+            for job_id, path, sha256 in rows:
+                if ledger is not None and not force and sha256 and ledger.get_by_sha256(sha256):
+                    print(f"Job {job_id} ({path}) is in the ledger already, not requeued")
+                    continue
+                ids.append(job_id)
+            if not ids:
+                return 0
+            cursor = self._db.execute(f"UPDATE jobs SET {assignments} WHERE id IN ({','.join('?' * len(ids))})",
+                                      [self.clock(), *ids])
+        return cursor.rowcount
+
+    def counts(self):
+        """
+        Return the number of jobs per state.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def close(self):
+        self._db.close()
+
+    def _to_dict(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        for name in self.JSON_FIELDS:
+            if job[name] is not None:
+                job[name] = json.loads(job[name])
+        return job
+
+
+def default_ledger_file(db_path):
+    """
+    Ledger next to a job database: <folder>/.<ledger name>.jobs.sqlite -> <folder>/<ledger name>.jsonl
+    """
+    name = os.path.basename(db_path)
+    if name.startswith("."):
+        name = name[1:]
+    if name.endswith(".jobs.sqlite"):
+        name = name[:-len(".jobs.sqlite")]
+    return os.path.join(os.path.dirname(db_path), name + ".jsonl")
+
+
+def main(argv=None):
+    """
+    Operator commands: list, show and requeue jobs.
+
+    Example:
+        python -m utils.job_queue images/.log.jobs.sqlite list --state failed
+        python -m utils.job_queue images/.log.jobs.sqlite requeue 12 15
+    """
+    parser = argparse.ArgumentParser(description="Inspect and requeue posting jobs.")
+    parser.add_argument("db_path", help="Job database, <image folder>/.<ledger name>.jobs.sqlite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="List jobs")
+    list_parser.add_argument("--state", choices=JobQueue.STATES, action="append", help="Only jobs in this state")
+    list_parser.add_argument("--limit", type=int)
+
+    show_parser = commands.add_parser("show", help="Show every stored field of a job")
+    show_parser.add_argument("job_id", type=int)
+
+    requeue_parser = commands.add_parser("requeue", help="Requeue jobs (all failed ones without ids)")
+    requeue_parser.add_argument("job_ids", type=int, nargs="*")
+    requeue_parser.add_argument("--state", choices=JobQueue.STATES, default="failed",
+                                help="Requeue all jobs in this state when no ids are given")
+    requeue_parser.add_argument("--reset", action="store_true", help="Run every stage again")
+    requeue_parser.add_argument("--ledger", help="Ledger of the account, defaults to the one next to the database")
+    requeue_parser.add_argument("--force", action="store_true", help="Also requeue images that are in the ledger")
+
+    commands.add_parser("stats", help="Number of jobs per state")
+
+    args = parser.parse_args(argv)
+    jobs = JobQueue(args.db_path)
+    try:
+        if args.command == "list":
+            for job in jobs.jobs(args.state, args.limit):
+                error = f"  {job['error']}" if job["error"] else ""
+                print(f"{job['id']:>6}  {job['state']:<12} {job['attempts']}  {job['path']}{error}")
+        elif args.command == "show":
+            job = jobs.get_by_id(args.job_id)
+            if job is None:
+                print(f"No job {args.job_id}")
+                return 1
+            print(json.dumps(job, indent=2, default=str))
+        elif args.command == "requeue":
+            ledger = ImageLedger(args.ledger or default_ledger_file(args.db_path))
+            try:
+                print(f"Requeued {jobs.requeue(args.job_ids, args.state, args.reset, ledger, args.force)} jobs")
+            finally:
+                ledger.close()
+        elif args.command == "stats":
+            print(jobs.counts())
+    finally:
+        jobs.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
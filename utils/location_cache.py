@@ -0,0 +1,127 @@
+import json
+import math
+import threading
+from utils.metrics import metrics
+from utils.utils import nearest_k
+
+KM_PER_DEGREE = 111.32
+
+
+class LocationCache:
+    """
+    Persistent cache of Instagram venues with a spatial grid index.
+
+    Venues returned by location_search are stored in buckets of roughly radius_km x radius_km,
+    so a lookup only checks the venues of the neighbouring cells. When a known venue is within
+    radius_km of a photo, the location search API call can be skipped.
+    """
+
+    def __init__(self, cache_file=None, radius_km=1.0):
+        """
+        Parameters:
+            cache_file (str, optional): JSON lines file for the venues.
+            radius_km (float): Max distance at which a cached venue is used.
+        """
+        self.cache_file = cache_file
+        self.radius_km = radius_km
+        self.cell_deg = max(radius_km / KM_PER_DEGREE, 1e-4)
+        self.hits = 0
+        self.misses = 0
+        self._venues = {}
+        self._grid = {}
+        self._lock = threading.Lock()
+
+        if cache_file:
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as file:
+                    for line in file:
+                        try:
+                            self._index(json.loads(line))
+                        except (ValueError, KeyError, TypeError):
+                            continue
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return len(self._venues)
+
+    def nearest(self, lat, lng, radius_km=None):
+        """
+        Return the closest cached venue within the radius, or None.
+
+        Parameters:
+            lat, lng (float): Point to search around.
+            radius_km (float, optional): Overrides the default radius (must not exceed it).
+
+        Returns:
+            dict or None: The stored venue fields.
+        """
+        radius_km = min(radius_km or self.radius_km, self.radius_km)
+        with self._lock:
+            candidates = self._candidates(lat, lng)
+        best = None
+        if candidates:
+            indices, distances = nearest_k(lat, lng, [venue["lat"] for venue in candidates],
+                                           [venue["lng"] for venue in candidates])
+            if distances[0] <= radius_km:
+                best = candidates[indices[0]]
+
+        with self._lock:
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.count("cache_requests_total", cache="locations", result="miss" if best is None else "hit")
+        return best
+
+    def add_many(self, venues):
+        """
+        Store venues (dicts with at least external_id, name, lat and lng).
+        """
+        new = []
+        with self._lock:
+            for venue in venues:
+                if venue.get("lat") is None or venue.get("lng") is None or not venue.get("external_id"):
+                    continue
+                if self._index(venue):
+                    new.append(venue)
+
+            if new and self.cache_file:
+                with open(self.cache_file, 'a', encoding='utf-8') as file:
+                    for venue in new:
+                        file.write(json.dumps(venue, default=str) + "\n")
+        return len(new)
+
+    def stats(self):
+        """
+        Return hit/miss counters and the number of cached venues.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "venues": len(self._venues),
+        }
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def _index(self, venue):
+        key = str(venue["external_id"])
+        if key in self._venues:
+            return False
+        self._venues[key] = venue
+        self._grid.setdefault(self._cell(venue["lat"], venue["lng"]), []).append(venue)
+        return True
+
+    def _candidates(self, lat, lng):
+        row, col = self._cell(lat, lng)
+        # A degree of longitude shrinks with latitude, so more columns are needed off the equator
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        col_span = min(math.ceil(1 / cos_lat), 100)
+        candidates = []
+        for d_row in (-1, 0, 1):
+            for d_col in range(-col_span, col_span + 1):
+                candidates.extend(self._grid.get((row + d_row, col + d_col), ()))
+        return candidates
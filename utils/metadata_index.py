@@ -0,0 +1,285 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from utils.exif import read_exif
+from utils.folder_watcher import scan_images
+from utils.utils import haversine_many
+
+INDEX_FILE = ".metadata.sqlite"  # Default index location inside the image folder
+
+
+def read_metadata(path):
+    """
+    Header metadata of one image, see read_exif(). Runs in a worker process.
+    """
+    try:
+        return read_exif(path)
+    except OSError as e:
+        print(f"Error while reading {path}: {e}")
+        return None
+
+
+def exif_timestamp(text):
+    """
+    EXIF "YYYY:MM:DD HH:MM:SS" as a timestamp (local time), None if missing or malformed.
+    """
+    try:
+        return datetime.strptime(text[:19], "%Y:%m:%d %H:%M:%S").timestamp()
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+class MetadataIndex:
+    """
+    Table of the header metadata (GPS, orientation, capture time, dimensions, camera) of every
+    image in a library, in SQLite.
+
+    update() walks the folder once and reads the EXIF header of new and changed files only
+    (by size and mtime), in a process pool when there are many, so Post and the resize path
+    never parse EXIF at posting time. Location and capture-time queries run on the indexed
+    columns: near() for "taken within 5 km of X", oldest() for "oldest unposted first".
+    """
+
+    PARALLEL_MIN = 64  # Changed files before the headers are read in a process pool
+    COLUMNS = ("path", "size", "mtime", "width", "height", "orientation", "lat", "lng", "taken", "make", "model")
+
+    def __init__(self, db_path, workers=None, executor=None):
+        """
+        Parameters:
+            db_path (str): Path to the SQLite database.
+            workers (int, optional): Worker processes for update(), defaults to the number of cores.
+            executor (ProcessPoolExecutor, optional): Pool shared with other accounts (`workers` is ignored then).
+        """
+        self.db_path = db_path
+        self.workers = workers
+        self.executor = executor
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, width INTEGER, height INTEGER, "
+            "orientation INTEGER NOT NULL, lat REAL, lng REAL, taken REAL, make TEXT, model TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS images_lat ON images (lat)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS images_time ON images (COALESCE(taken, mtime))")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def update(self, folder_path, recursive=True):
+        """
+        Bring the index of a folder up to date: add new images, re-read changed ones and
+        drop the ones that are gone.
+
+        Returns:
+            dict: Number of scanned, updated and removed images.
+        """
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in self._db.execute("SELECT path, size, mtime FROM images")}
+
+        seen = set()
+        changed = []
+        for path, stat in scan_images(folder_path, recursive):
+            path = os.path.abspath(path)
+            seen.add(path)
+            if known.get(path) != (stat.st_size, stat.st_mtime):
+                changed.append((path, stat))
+
+        if len(changed) >= self.PARALLEL_MIN:
+            print(f"Indexing the metadata of {len(changed)} images...")
+            pool = (contextlib.nullcontext(self.executor) if self.executor is not None
+                    else ProcessPoolExecutor(max_workers=self.workers))
+            with pool as executor:
+                metadata = list(executor.map(read_metadata, [path for path, _ in changed], chunksize=32))
+        else:
+            metadata = [read_metadata(path) for path, _ in changed]
+        rows = [self._row(path, stat, meta) for (path, stat), meta in zip(changed, metadata) if meta is not None]
+
+        prefix = os.path.join(os.path.abspath(folder_path), "")
+        removed = [(path,) for path in known if path.startswith(prefix) and path not in seen]
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(f"INSERT OR REPLACE INTO images VALUES ({','.join('?' * len(self.COLUMNS))})", rows)
+            self._db.executemany("DELETE FROM images WHERE path = ?", removed)
+            self._db.execute("COMMIT")
+        return {"scanned": len(seen), "updated": len(rows), "removed": len(removed)}
+
+    def get(self, path):
+        """
+        Return the metadata of an image, reading its header first if it is new or changed.
+
+        Returns:
+            dict: size, mtime, width, height, orientation, gps ((lat, lng) or None), taken
+            (timestamp or None), make, model; None if the file can't be read.
+        """
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT * FROM images WHERE path = ?", (path,)).fetchone()
+        if row is None or (row["size"], row["mtime"]) != (stat.st_size, stat.st_mtime):
+            meta = read_metadata(path)
+            if meta is None:
+                return None
+            values = self._row(path, stat, meta)
+            with self._lock:
+                self._db.execute(f"INSERT OR REPLACE INTO images VALUES ({','.join('?' * len(self.COLUMNS))})",
+                                 values)
+            row = dict(zip(self.COLUMNS, values))
+        return self._to_dict(row)
+
+    def near(self, lat, lng, radius_km, limit=None):
+        """
+        Images taken within radius_km of a point, closest first.
+
+        Returns:
+            list: (path, distance in km) tuples.
+        """
+        # Bounding box on the indexed columns, then the exact distance
+        lat_delta = radius_km / 111.2
+        lng_delta = radius_km / (111.2 * max(math.cos(math.radians(lat)), 1e-6))
+        if lng_delta >= 180 or abs(lat) + lat_delta >= 90:
+            lng_ranges = [(-180, 180)]  # Around a pole or the whole world
+        elif lng - lng_delta < -180:
+            lng_ranges = [(lng - lng_delta + 360, 180), (-180, lng + lng_delta)]
+        elif lng + lng_delta > 180:
+            lng_ranges = [(lng - lng_delta, 180), (-180, lng + lng_delta - 360)]
+        else:
+            lng_ranges = [(lng - lng_delta, lng + lng_delta)]
+        params = [lat - lat_delta, lat + lat_delta]
+        for bounds in lng_ranges:
+            params.extend(bounds)
+        lng_filter = " OR ".join(["lng BETWEEN ? AND ?"] * len(lng_ranges))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT path, lat, lng FROM images WHERE lat BETWEEN ? AND ? AND ({lng_filter})", params,
+            ).fetchall()
+        if not rows:
+            return []
+        distances = haversine_many(lat, lng, [row[1] for row in rows], [row[2] for row in rows])
+        matches = sorted((float(distance), row[0]) for row, distance in zip(rows, distances) if distance <= radius_km)
+        return [(path, distance) for distance, path in matches[:limit]]
+
+    def oldest(self, limit=None, exclude=None, folder_path=None):
+        """
+        Images by capture time (file mtime when the EXIF has none), oldest first.
+
+        Parameters:
+            limit (int, optional): Max images.
+            exclude (callable, optional): Skips images for which it returns True, e.g. ImageManager.is_image_in_log.
+            folder_path (str, optional): Only images below this folder.
+
+        Returns:
+            list: Paths.
+        """
+        query = "SELECT path FROM images"
+        params = []
+        if folder_path:
+            query += " WHERE path LIKE ? ESCAPE '\\'"
+            prefix = os.path.join(os.path.abspath(folder_path), "")
+            params.append(prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        query += " ORDER BY COALESCE(taken, mtime), path"
+        with self._lock:
+            paths = [row[0] for row in self._db.execute(query, params).fetchall()]
+
+        result = []
+        for path in paths:
+            if exclude is not None and exclude(path):
+                continue
+            result.append(path)
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    def close(self):
+        self._db.close()
+
+    @staticmethod
+    def _row(path, stat, meta):
+        gps = meta["gps"] or (None, None)
+        return (path, stat.st_size, stat.st_mtime, meta["width"], meta["height"], meta["orientation"] or 1,
+                gps[0], gps[1], exif_timestamp(meta["taken"]), meta["make"], meta["model"])
+
+    @staticmethod
+    def _to_dict(row):
+        record = dict(row)
+        lat, lng = record.pop("lat"), record.pop("lng")
+        record["gps"] = (lat, lng) if lat is not None and lng is not None else None
+        return record
+
+
+def main(argv=None):
+    """
+    Build and query the metadata index of an image folder.
+
+    Example:
+        python -m utils.metadata_index images update
+        python -m utils.metadata_index images near 41.7151 44.8271 --km 5
+        python -m utils.metadata_index images oldest --unposted --limit 20
+    """
+    parser = argparse.ArgumentParser(description="Metadata index of an image folder.")
+    parser.add_argument("folder", help="Image folder")
+    parser.add_argument("--db", help=f"Index database, defaults to <folder>/{INDEX_FILE}")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    update_parser = commands.add_parser("update", help="Index new and changed images")
+    update_parser.add_argument("--no-recursive", action="store_true", help="Skip subfolders")
+
+    near_parser = commands.add_parser("near", help="Images taken within a distance of a point")
+    near_parser.add_argument("lat", type=float)
+    near_parser.add_argument("lng", type=float)
+    near_parser.add_argument("--km", type=float, default=5.0)
+    near_parser.add_argument("--limit", type=int)
+
+    oldest_parser = commands.add_parser("oldest", help="Images by capture time, oldest first")
+    oldest_parser.add_argument("--unposted", action="store_true", help="Skip images in the ledger")
+    oldest_parser.add_argument("--ledger", default="log.jsonl", help="Ledger name for --unposted")
+    oldest_parser.add_argument("--limit", type=int)
+
+    show_parser = commands.add_parser("show", help="Show the metadata of an image")
+    show_parser.add_argument("path")
+
+    args = parser.parse_args(argv)
+    index = MetadataIndex(args.db or os.path.join(args.folder, INDEX_FILE))
+    try:
+        if args.command == "update":
+            print(index.update(args.folder, recursive=not args.no_recursive))
+        elif args.command == "near":
+            for path, distance in index.near(args.lat, args.lng, args.km, args.limit):
+                print(f"{distance:8.3f} km  {path}")
+        elif args.command == "oldest":
+            iman = None
+            if args.unposted:
+                from utils.image_manager import ImageManager
+                iman = ImageManager(args.folder, ledger_name=args.ledger)
+            try:
+                for path in index.oldest(args.limit, iman.is_image_in_log if iman else None, args.folder):
+                    print(path)
+            finally:
+                if iman:
+                    iman.close()
+        elif args.command == "show":
+            record = index.get(args.path)
+            if record is None:
+                print(f"Can't read {args.path}")
+                return 1
+            print(json.dumps(record, indent=2))
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,280 @@
+import bisect
+import functools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _NullTimer:
+    """Shared no-op timer handed out while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = self.labels if exc_type is None else dict(self.labels, error=exc_type.__name__)
+        self.registry.observe(self.name, time.perf_counter() - self.start, **labels)
+        return False
+
+
+class _Histogram:
+    """
+    Prometheus-style histogram plus a small reservoir sample for percentiles in summaries.
+    """
+
+    RESERVOIR = 1024
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.sample = []
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if len(self.sample) < self.RESERVOIR:
+            self.sample.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < self.RESERVOIR:
+                self.sample[index] = value
+
+    def percentile(self, fraction):
+        if not self.sample:
+            return None
+        ordered = sorted(self.sample)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Metrics:
+    """
+    Counters, gauges and timers for the poster.
+
+    Disabled by default: timer() then returns a shared no-op context manager and count(),
+    set() and observe() return right away, so instrumented code costs one attribute check.
+    Once enabled, the values can be scraped as Prometheus text (serve()), appended as one
+    JSON line per observation (jsonl_file) and printed as structured log lines (log).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.enabled = False
+        self.buckets = tuple(buckets)
+        self.log = False
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._jsonl = None
+        self._server = None
+
+    def configure(self, enabled=True, port=None, jsonl_file=None, log=False):
+        """
+        Turn metrics on or off and choose the outputs.
+
+        Parameters:
+            enabled (bool): Collect metrics.
+            port (int, optional): Serve Prometheus text on http://0.0.0.0:<port>/metrics.
+            jsonl_file (str, optional): Append every observation to this JSON lines file.
+            log (bool): Print every observation as a JSON log line.
+        """
+        self.enabled = enabled
+        self.log = log
+        if enabled and jsonl_file and self._jsonl is None:
+            self._jsonl = open(jsonl_file, 'a', encoding='utf-8', buffering=1)
+        if enabled and port and self._server is None:
+            self.serve(port)
+
+    def timer(self, name, **labels):
+        """
+        Context manager that records the duration of its block in seconds.
+
+        Example:
+            with metrics.timer("poster_stage_seconds", stage="upload"):
+                ...
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def timed(self, name, **labels):
+        """
+        Decorator version of timer().
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with _Timer(self, name, labels):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, self._label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._emit("counter", name, amount, labels)
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, self._label_key(labels))] = value
+        self._emit("gauge", name, value, labels)
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, self._label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(seconds)
+        self._emit("timer", name, seconds, labels)
+
+    def summary(self):
+        """
+        Return counters, gauges and count / mean / p50 / p95 / max of every timer.
+        """
+        with self._lock:
+            summary = {"counters": {self._format(key): value for key, value in self._counters.items()},
+                       "gauges": {self._format(key): value for key, value in self._gauges.items()},
+                       "timers": {}}
+            for key, histogram in self._histograms.items():
+                summary["timers"][self._format(key)] = {
+                    "count": histogram.count,
+                    "mean": round(histogram.sum / histogram.count, 4),
+                    "p50": round(histogram.percentile(0.5), 4),
+                    "p95": round(histogram.percentile(0.95), 4),
+                    "max": round(max(histogram.sample), 4),
+                }
+        return summary
+
+    def render_prometheus(self):
+        """
+        Return all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                seen = set()
+                for (name, labels), value in sorted(values.items()):
+                    if name not in seen:
+                        seen.add(name)
+                        lines.append(f"# TYPE {name} {kind}")
+                    lines.append(f"{name}{self._render_labels(labels)} {value}")
+
+            seen = set()
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    bucket_labels = labels + (("le", str(bound)),)
+                    lines.append(f"{name}_bucket{self._render_labels(bucket_labels)} {cumulative}")
+                lines.append(f"{name}_sum{self._render_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{self._render_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        """
+        Serve render_prometheus() on /metrics from a background thread.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"Metrics on http://{host}:{port}/metrics")
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+
+    def _emit(self, kind, name, value, labels):
+        if self._jsonl is None and not self.log:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "type": kind, "metric": name,
+                           "value": value, "labels": labels}, default=str)
+        if self._jsonl is not None:
+            with self._lock:
+                self._jsonl.write(line + "\n")
+        if self.log:
+            print(line)
+
+    @staticmethod
+    def _label_key(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @staticmethod
+    def _render_labels(labels):
+        if not labels:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+    @staticmethod
+    def _format(key):
+        name, labels = key
+        if not labels:
+            return name
+        return name + "{" + ",".join(f"{label}={value}" for label, value in labels) + "}"
+
+
+# Process-wide registry; instrumented modules import it, __main__ enables it from the configuration
+metrics = Metrics()
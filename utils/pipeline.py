@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from utils.metrics import metrics
+
+
+DEFAULT_STAGE_LIMITS = {
+    "load": 2,       # Decode and resize (CPU)
+    "encode": 2,     # In-memory JPEG shared by the analyzer and the uploader
+    "location": 1,   # Nominatim + Instagram location_search
+    "vision": 2,     # Image analyzer
+    "caption": 4,    # Chat client (concurrent calls can be batched into one request)
+}
+
+
+class PostPipeline:
+    """
+    Prepares the next posts in background threads while the caller waits for the schedule.
+
+    Every post goes through load -> encode -> (location || vision) -> caption. Each stage has
+    its own concurrency limit, so e.g. only one location search runs at a time no matter how
+    many posts are in flight. Prepared posts are handed out in the original order; the upload
+    itself stays with the caller, one at a time.
+    """
+
+    IDLE = object()  # Yielded by a source that has nothing right now but may have more later
+
+    def __init__(self, poster, prefetch=3, stage_limits=None, on_stage=None):
+        """
+        Parameters:
+            poster (Poster): Poster providing the stage methods.
+            prefetch (int): How many posts to keep in preparation ahead of the upload.
+            stage_limits (dict, optional): Max concurrent calls per stage, overrides DEFAULT_STAGE_LIMITS.
+            on_stage (callable, optional): Called as on_stage(item, stage, post) after the location,
+                vision and caption stages, e.g. to persist the results.
+        """
+        self.poster = poster
+        self.on_stage = on_stage
+        self.prefetch = max(1, prefetch)
+        limits = dict(DEFAULT_STAGE_LIMITS, **(stage_limits or {}))
+        self._limits = {stage: threading.BoundedSemaphore(max(1, limit)) for stage, limit in limits.items()}
+        self._executor = ThreadPoolExecutor(max_workers=self.prefetch, thread_name_prefix="post-prepare")
+        self._location_executor = ThreadPoolExecutor(max_workers=self.prefetch, thread_name_prefix="post-location")
+        self._pending = deque()
+
+    def run(self, items, load, idle=None):
+        """
+        Prepare items ahead of time and yield them in order.
+
+        Parameters:
+            items (iterable): Source items, e.g. image paths. A source that yields IDLE is
+                asked again later, so a folder watcher can feed the pipeline forever.
+            load (callable): Builds a Post from an item.
+            idle (callable, optional): Called when the source is idle and no post is in
+                preparation, defaults to a one second sleep.
+
+        Yields:
+            tuple: (item, post); post is None if the preparation failed.
+        """
+        items = iter(items)
+        exhausted = False
+
+        def fill():
+            nonlocal exhausted
+            while not exhausted and len(self._pending) < self.prefetch:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    return
+                if item is self.IDLE:
+                    return
+                self._pending.append((item, self._executor.submit(self._prepare, item, load)))
+
+        try:
+            fill()
+            while self._pending or not exhausted:
+                if not self._pending:
+                    (idle or self._idle)()
+                    fill()
+                    continue
+                item, future = self._pending.popleft()
+                # Keep the pipeline full while the caller is busy with this post
+                fill()
+                try:
+                    post = future.result()
+                except Exception as e:
+                    print(f"Error while preparing {item}: {e}")
+                    post = None
+                yield item, post
+        finally:
+            self._discard_pending()
+
+    def close(self):
+        """
+        Drop posts that were prepared but not taken and stop the worker threads.
+        """
+        self._discard_pending()
+        self._executor.shutdown(wait=True)
+        self._location_executor.shutdown(wait=True)
+
+    @staticmethod
+    def _idle():
+        time.sleep(1)
+
+    def _prepare(self, item, load):
+        post = self._run_stage("load", load, item)
+        location = None
+        try:
+            self._run_stage("encode", self.poster.encode_post_image, post)
+            location = self._location_executor.submit(self._run_stage, "location", self.poster.locate_post, post,
+                                                    item=item)
+            picture_tags = self._run_stage("vision", self.poster.label_post, post, item=item)
+            location.result()
+            self._run_stage("caption", self.poster.caption_post, post, picture_tags, item=item)
+        except Exception:
+            # A dropped post must not keep searching locations in the background
+            if location is not None and not location.cancel():
+                try:
+                    location.result()
+                except Exception:
+                    pass
+            self.poster.cleanup_post(post)
+            raise
+        return post
+
+    def _run_stage(self, stage, function, *args, item=None):
+        with metrics.timer("pipeline_stage_wait_seconds", stage=stage):
+            self._limits[stage].acquire()
+        try:
+            result = function(*args)
+        finally:
+            self._limits[stage].release()
+        if self.on_stage is not None and item is not None:
+            self.on_stage(item, stage, args[0])
+        return result
+
+    def _discard_pending(self):
+        while self._pending:
+            _, future = self._pending.popleft()
+            if future.cancel():
+                continue
+            try:
+                post = future.result()
+            except Exception:
+                continue
+            self.poster.cleanup_post(post)
@@ -0,0 +1,189 @@
+import contextlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+from utils.exif import read_exif
+from utils.fingerprint import FingerprintCache
+from utils.utils import resize_to_square
+
+
+_manifest_locks = {}
+_manifest_locks_guard = threading.Lock()
+
+
+def _manifest_lock(manifest_file):
+    """
+    One lock per manifest file, shared by every preprocessor (account) in the process.
+    """
+    with _manifest_locks_guard:
+        return _manifest_locks.setdefault(os.path.abspath(manifest_file), threading.Lock())
+
+
+def bake_image(source_path, output_path, size=1080, quality=90, metadata=None):
+    """
+    Normalize one image to a ready-to-upload square JPEG. Runs in a worker process.
+
+    Parameters:
+        source_path (str): Original image.
+        output_path (str): Where to write the baked JPEG.
+        size (int): Square side in pixels.
+        quality (int): JPEG quality.
+        metadata (dict, optional): Indexed metadata of the original (see MetadataIndex), saves reading its EXIF.
+
+    Returns:
+        dict or None: GPS location of the original ({"lat": ..., "lng": ...}).
+    """
+    metadata = metadata or read_exif(source_path)
+    gps = metadata["gps"]
+    location = {"lat": gps[0], "lng": gps[1]} if gps else None
+    with Image.open(source_path) as img:
+        square = resize_to_square(img, size, orientation=metadata["orientation"] or 1)
+
+    # Unique temp file: several accounts may bake the same content at the same time
+    fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(output_path))
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            square.save(temp_file, format="JPEG", quality=quality)
+        os.replace(temp_path, output_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return location
+
+
+class ImagePreprocessor:
+    """
+    Bakes pending images into a content-addressed cache of upload-ready JPEGs.
+
+    Decode, orientation fix and resize run in a process pool, so they scale with cores and
+    never block the posting loop. Baked files are named after the SHA-256 of the original,
+    which makes renamed files and reruns free. The EXIF GPS of every original is kept in
+    the manifest next to the baked files.
+    """
+
+    def __init__(self, cache_dir, fingerprints=None, size=1080, quality=90, workers=None, metadata_index=None,
+                 executor=None):
+        """
+        Parameters:
+            cache_dir (str): Directory for baked images and the manifest.
+            fingerprints (FingerprintCache, optional): Shared fingerprint cache (e.g. ImageManager.fingerprints).
+            size (int): Square side in pixels.
+            quality (int): JPEG quality of baked images.
+            workers (int, optional): Worker processes, defaults to the number of cores.
+            metadata_index (MetadataIndex, optional): GPS and orientation of the originals.
+            executor (ProcessPoolExecutor, optional): Pool shared with other accounts, used instead of
+                starting one per batch (`workers` is ignored then).
+        """
+        self.cache_dir = cache_dir
+        self.size = size
+        self.quality = quality
+        self.workers = workers
+        self.metadata_index = metadata_index
+        self.executor = executor
+        os.makedirs(cache_dir, exist_ok=True)
+        self.fingerprints = fingerprints or FingerprintCache(os.path.join(cache_dir, "fingerprints.jsonl"))
+        self.manifest_file = os.path.join(cache_dir, "manifest.jsonl")
+        self._manifest_lock = _manifest_lock(self.manifest_file)
+        self._manifest = self._load_manifest()
+        self._by_source = {}
+
+    def baked_path(self, sha256):
+        return os.path.join(self.cache_dir, f"{sha256}_{self.size}.jpg")
+
+    def get(self, source_path):
+        """
+        Return the manifest record of a preprocessed image, or None.
+
+        Returns:
+            dict: {"sha256", "source", "baked", "location"}
+        """
+        return self._by_source.get(os.path.abspath(source_path))
+
+    def preprocess(self, source_paths):
+        """
+        Bake every image that is not in the cache yet.
+
+        Parameters:
+            source_paths (list): Original image paths.
+
+        Returns:
+            list: Source paths that have a baked image, in the original order.
+        """
+        todo = {}
+        for source_path in source_paths:
+            abs_path = os.path.abspath(source_path)
+            try:
+                sha256 = self.fingerprints.fingerprint(abs_path)["sha256"]
+            except OSError as e:
+                print(f"Error while reading {source_path}: {e}")
+                continue
+
+            record = self._manifest.get(sha256)
+            if record and record["baked"] == self.baked_path(sha256) and os.path.exists(record["baked"]):
+                self._by_source[abs_path] = dict(record, source=abs_path)
+            else:
+                todo.setdefault(sha256, []).append(abs_path)
+
+        if todo:
+            queued = sum(len(paths) for paths in todo.values())
+            print(f"Preprocessing {len(todo)} images ({len(source_paths) - queued} cached)...")
+            with self._pool() as executor:
+                futures = {
+                    executor.submit(bake_image, paths[0], self.baked_path(sha256), self.size, self.quality,
+                                    self.metadata(paths[0])): sha256
+                    for sha256, paths in todo.items()
+                }
+                with open(self.manifest_file, 'a', encoding='utf-8') as manifest:
+                    for done, future in enumerate(as_completed(futures), 1):
+                        sha256 = futures[future]
+                        try:
+                            location = future.result()
+                        except Exception as e:
+                            print(f"Error while preprocessing {todo[sha256][0]}: {e}")
+                            continue
+
+                        record = {"sha256": sha256, "source": todo[sha256][0],
+                                  "baked": self.baked_path(sha256), "location": location}
+                        self._write_manifest(manifest, record)
+                        self._manifest[sha256] = record
+                        for abs_path in todo[sha256]:
+                            self._by_source[abs_path] = dict(record, source=abs_path)
+
+                        if done % 100 == 0:
+                            print(f"Preprocessed {done}/{len(todo)} images")
+
+        return [source_path for source_path in source_paths if self.get(source_path)]
+
+    def metadata(self, source_path):
+        """
+        Indexed metadata of an original, or None without an index.
+        """
+        return self.metadata_index.get(source_path) if self.metadata_index else None
+
+    def _write_manifest(self, manifest, record):
+        # Accounts append to the same manifest; a whole line is written and flushed at a time
+        with self._manifest_lock:
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+
+    def _pool(self):
+        if self.executor is not None:
+            return contextlib.nullcontext(self.executor)
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+    def _load_manifest(self):
+        manifest = {}
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    manifest[record["sha256"]] = record
+        except FileNotFoundError:
+            pass
+        return manifest
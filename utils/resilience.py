@@ -0,0 +1,232 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from utils.metrics import metrics
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while.
+
+    After failure_threshold failed calls in a row the circuit opens and every call is
+    refused for reset_timeout seconds. Then one trial call is let through (half open):
+    success closes the circuit again, failure opens it for another reset_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=300, clock=time.monotonic):
+        """
+        Parameters:
+            failure_threshold (int): Failed calls in a row that open the circuit.
+            reset_timeout (float): Seconds the circuit stays open before a trial call.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Return True if a call may go out now.
+        """
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        """
+        Count a failed call.
+
+        Returns:
+            bool: True if this failure opened the circuit.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+                self._trial = False
+                return True
+            return False
+
+
+class ResilientCaller:
+    """
+    Calls a flaky remote service with timeouts, retries, hedging and a circuit breaker.
+
+    Every attempt runs in a worker thread and is abandoned after `timeout` seconds, so a
+    hung request can't block the posting loop (the client's own timeout ends the thread
+    later). Failed attempts are retried with jittered exponential backoff while the call's
+    `deadline` allows it. With `hedge_after` set, a second identical request is sent when
+    the first one hasn't answered in that many seconds and the faster answer wins. Hedging
+    pays for the request twice, so it is opt-in.
+
+    The counters in stats() show how often each path fires.
+    """
+
+    COUNTERS = ("calls", "successes", "errors", "timeouts", "retries", "hedges", "hedge_wins",
+                "short_circuits", "circuit_opens", "fallbacks")
+
+    def __init__(self, name, timeout=30, deadline=None, retries=2, backoff=1.0, backoff_max=30,
+                 hedge_after=None, failure_threshold=5, reset_timeout=300, max_workers=8,
+                 sleep=time.sleep, clock=time.monotonic):
+        """
+        Parameters:
+            name (str): Service name for log messages.
+            timeout (float): Seconds before one attempt is abandoned (None waits forever).
+            deadline (float, optional): Seconds for the whole call including retries.
+            retries (int): Extra attempts after a failed one.
+            backoff (float): Base of the exponential backoff in seconds.
+            backoff_max (float): Max backoff between two attempts in seconds.
+            hedge_after (float, optional): Seconds before a second, hedged request is sent.
+            failure_threshold (int): Failed calls in a row that open the circuit.
+            reset_timeout (float): Seconds the circuit stays open.
+            max_workers (int): Threads for concurrent attempts.
+            sleep (callable): Sleeps for the backoff, replaceable in tests.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.name = name
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.sleep = sleep
+        self.clock = clock
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-call")
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+        metrics.count("resilience_events_total", amount, service=self.name, event=counter)
+
+    def stats(self):
+        """
+        Return the counters and the state of the circuit breaker.
+        """
+        with self._lock:
+            stats = dict(self.counters)
+        stats["circuit"] = self.breaker.state
+        return stats
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call function(*args, **kwargs) with timeouts, retries and hedging.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+            Exception: The last error (TimeoutError for a timeout) once the attempts run out.
+        """
+        self.count("calls")
+        if not self.breaker.allow():
+            self.count("short_circuits")
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        deadline_at = self.clock() + self.deadline if self.deadline else None
+        error = None
+        for attempt in range(self.retries + 1):
+            timeout = self.timeout
+            if deadline_at is not None:
+                remaining = deadline_at - self.clock()
+                if remaining <= 0:
+                    break
+                timeout = remaining if timeout is None else min(timeout, remaining)
+
+            try:
+                result = self._attempt(function, args, kwargs, timeout)
+            except Exception as e:
+                error = e
+                self.count("timeouts" if isinstance(e, TimeoutError) else "errors")
+                print(f"{self.name} request failed (attempt {attempt + 1}/{self.retries + 1}): {e!r}")
+            else:
+                self.breaker.record_success()
+                self.count("successes")
+                return result
+
+            if attempt < self.retries:
+                delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+                if deadline_at is not None and self.clock() + delay >= deadline_at:
+                    break
+                self.count("retries")
+                self.sleep(delay)
+
+        if self.breaker.record_failure():
+            self.count("circuit_opens")
+            print(f"{self.name} circuit open for {self.breaker.reset_timeout}s")
+        raise error or TimeoutError(f"{self.name} deadline exceeded")
+
+    def close(self):
+        """
+        Stop the worker threads; attempts still running are abandoned.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _attempt(self, function, args, kwargs, timeout):
+        """
+        One attempt, hedged with a second request if the first one is slow.
+        """
+        started = self.clock()
+        futures = [self._executor.submit(function, *args, **kwargs)]
+        pending = set(futures)
+        hedged = self.hedge_after is not None and (timeout is None or self.hedge_after < timeout)
+        wait_for = self.hedge_after if hedged else timeout
+        error = None
+
+        while pending:
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is not futures[0]:
+                    self.count("hedge_wins")
+                return result
+
+            if hedged and len(futures) == 1 and not done:
+                # First request slow: send the hedge. A failed one is left to the retries and their backoff
+                self.count("hedges")
+                futures.append(self._executor.submit(function, *args, **kwargs))
+                pending.add(futures[1])
+
+            if timeout is not None:
+                wait_for = timeout - (self.clock() - started)
+                if wait_for <= 0:
+                    break
+            else:
+                wait_for = None
+
+        if pending:
+            raise TimeoutError(f"{self.name} request timed out after {timeout:.1f}s")
+        raise error
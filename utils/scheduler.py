@@ -1,24 +1,76 @@
 import os
 import time
 import random
-from datetime import datetime, time as dt_time
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, time as dt_time
+from utils.metrics import metrics
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+class VirtualClock:
+    """
+    Time-warped clock for simulations: sleep() advances now() instantly.
+
+    Pass clock.now to Scheduler(clock=...) and clock.sleep to run_poster(sleep=...) to replay
+    hours of schedule in milliseconds.
+    """
+
+    def __init__(self, start=None):
+        """
+        Parameters:
+        start (datetime, optional): Initial time, defaults to the current time
+        """
+        self._now = start or datetime.now()
+        self._lock = threading.Lock()
+        self.slept = 0.0  # Total virtual seconds slept
+
+    def now(self):
+        with self._lock:
+            return self._now
+
+    def sleep(self, seconds):
+        seconds = max(0.0, seconds or 0.0)
+        with self._lock:
+            self._now += timedelta(seconds=seconds)
+            self.slept += seconds
 
 
 class Scheduler:
     """
     A class to handle posting schedules and delays.
+
+    Time slots are kept as a sorted table of merged intervals in seconds since midnight.
+    Slots that cross midnight (e.g. ("23:30", "00:30")) are split in two. Lookups are
+    binary searches, so the caller can sleep exactly until the next opening.
+
+    The Scheduler also owns the posting budget: at most limit_per_slot posts in one slot
+    and limit_per_day posts per calendar day, counted from record_post() calls.
     """
 
-    def __init__(self, schedule_config=None, delay_range=(5, 15)):
+    PLAN_MAX_STEPS = 10000  # Guard for next_post_time() when every slot is full
+
+    def __init__(self, schedule_config=None, delay_range=(5, 15), clock=datetime.now,
+                 limit_per_slot=None, limit_per_day=None):
         """
         Initialize the Scheduler with configuration and delay range.
 
         Parameters:
         schedule_config (list): A list of tuples with time ranges [(start, end), ...]
         delay_range (tuple): A tuple defining the randomized delay range in seconds (min, max)
+        clock (callable): Returns the current local datetime, replaceable in tests
+        limit_per_slot (int): Max posts within one time slot (None for no limit)
+        limit_per_day (int): Max posts per calendar day (None for no limit)
         """
         self.schedule = []
         self.delay_range = delay_range
+        self.clock = clock
+        self.limit_per_slot = limit_per_slot
+        self.limit_per_day = limit_per_day
+        self._starts = []
+        self._ends = []
+        self._posts = []  # Sorted datetimes of recorded posts
         if schedule_config:
             for start_time, end_time in schedule_config:
                 self.add_time_slot(start_time, end_time)
@@ -32,17 +84,206 @@ class Scheduler:
         end_time (str): End time in "HH:MM" format
         """
         self.schedule.append((self._parse_time(start_time), self._parse_time(end_time)))
+        self._build_intervals()
 
-    def is_within_schedule(self):
+    def is_within_schedule(self, now=None):
         """
         Check if the current time is within the allowed schedule.
 
+        Parameters:
+        now (datetime, optional): Time to check, defaults to the clock
+
         Returns:
         bool: True if within schedule, False otherwise
         """
-        now = datetime.now().time()
-        print(f"Time: {now} ")
-        return any(start <= now <= end for start, end in self.schedule)
+        seconds = self._seconds_of_day(now or self.clock())
+        index = bisect_right(self._starts, seconds) - 1
+        return index >= 0 and seconds <= self._ends[index]
+
+    def next_slot_start(self, now=None):
+        """
+        Get the start of the next time slot.
+
+        Parameters:
+        now (datetime, optional): Reference time, defaults to the clock
+
+        Returns:
+        datetime: `now` itself if within schedule, otherwise the next slot start; None without slots
+        """
+        now = now or self.clock()
+        if not self._starts:
+            return None
+        if self.is_within_schedule(now):
+            return now
+
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        index = bisect_right(self._starts, self._seconds_of_day(now))
+        if index < len(self._starts):
+            return midnight + timedelta(seconds=self._starts[index])
+        return midnight + timedelta(days=1, seconds=self._starts[0])
+
+    def time_until_next_slot(self, now=None):
+        """
+        Get the number of seconds until the next time slot opens.
+
+        Returns:
+        float: 0 if within schedule, None without slots
+        """
+        now = now or self.clock()
+        next_start = self.next_slot_start(now)
+        if next_start is None:
+            return None
+        return max(0.0, (next_start - now).total_seconds())
+
+    def current_slot(self, now=None):
+        """
+        Get the bounds of the time slot containing `now`.
+
+        A slot that crosses midnight is returned as one slot.
+
+        Returns:
+        tuple: (start, end) datetimes, or None if outside the schedule
+        """
+        now = now or self.clock()
+        seconds = self._seconds_of_day(now)
+        index = bisect_right(self._starts, seconds) - 1
+        if index < 0 or seconds > self._ends[index]:
+            return None
+
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = midnight + timedelta(seconds=self._starts[index])
+        end = midnight + timedelta(seconds=self._ends[index])
+        wraps = len(self._starts) > 1 and self._starts[0] == 0 and self._ends[-1] == SECONDS_PER_DAY
+        if wraps and index == 0:
+            start = midnight - timedelta(days=1) + timedelta(seconds=self._starts[-1])
+        if wraps and index == len(self._starts) - 1:
+            end = midnight + timedelta(days=1, seconds=self._ends[0])
+        return start, end
+
+    def slots_between(self, start, end):
+        """
+        Get every time slot occurrence that overlaps a period.
+
+        Parameters:
+        start (datetime): Start of the period
+        end (datetime): End of the period
+
+        Returns:
+        list: (start, end) datetimes of the slots, clipped to the period
+        """
+        slots = []
+        next_time = start
+        while next_time < end:
+            slot_start = self.next_slot_start(next_time)
+            if slot_start is None or slot_start >= end:
+                break
+            slot_start, slot_end = self.current_slot(slot_start)
+            slots.append((max(slot_start, start), min(slot_end, end)))
+            next_time = slot_end + timedelta(microseconds=1)
+        return slots
+
+    def record_post(self, when=None):
+        """
+        Count a post against the slot and day budgets.
+
+        Parameters:
+        when (datetime, optional): Time of the post, defaults to the clock
+        """
+        when = when or self.clock()
+        index = bisect_right(self._posts, when)
+        self._posts.insert(index, when)
+
+        # Nothing older than the current slot or day is ever counted again
+        horizon = when - timedelta(days=2)
+        del self._posts[:bisect_left(self._posts, horizon)]
+
+        metrics.count("scheduler_posts_total")
+        metrics.set("scheduler_posts_today", self.posts_today(when))
+        metrics.set("scheduler_posts_in_slot", self.posts_in_slot(when))
+
+    def posts_in_slot(self, now=None):
+        """
+        Number of recorded posts in the current slot (0 outside the schedule).
+        """
+        slot = self.current_slot(now)
+        return self._count_between(self._posts, *slot) if slot else 0
+
+    def posts_today(self, now=None):
+        """
+        Number of recorded posts on the calendar day of `now`.
+        """
+        midnight = (now or self.clock()).replace(hour=0, minute=0, second=0, microsecond=0)
+        return self._count_between(self._posts, midnight, midnight + timedelta(days=1))
+
+    def can_post(self, now=None):
+        """
+        Check if a post may go out now: within schedule and within the slot and day budgets.
+        """
+        now = now or self.clock()
+        return self.next_post_time(now) == now
+
+    @metrics.timed("scheduler_seconds", op="next_post_time")
+    def next_post_time(self, now=None):
+        """
+        Get the earliest time at or after `now` when a post fits the schedule and the budgets.
+
+        Returns:
+        datetime: `now` if a post may go out right away, None without slots
+        """
+        return self._next_post_time(now or self.clock(), self._posts)
+
+    def time_until_next_post(self, now=None):
+        """
+        Get the number of seconds until a post may go out.
+
+        Returns:
+        float: 0 if a post may go out now, None without slots
+        """
+        now = now or self.clock()
+        next_time = self.next_post_time(now)
+        if next_time is None:
+            return None
+        return max(0.0, (next_time - now).total_seconds())
+
+    def plan(self, backlog_size, now=None, delay=None):
+        """
+        Compute a send plan: the time of every post of a backlog.
+
+        Posts are spaced by `delay` and packed into the slots up to the budgets.
+
+        Parameters:
+        backlog_size (int): Number of posts to plan
+        now (datetime, optional): Start time, defaults to the clock
+        delay (float, optional): Seconds between posts, defaults to the middle of the delay range
+
+        Returns:
+        list: datetimes, one per post (shorter if the schedule can't fit them)
+        """
+        now = now or self.clock()
+        delay = timedelta(seconds=sum(self.delay_range) / 2 if delay is None else delay)
+        posts = list(self._posts)
+        times = []
+        next_time = now
+        for _ in range(backlog_size):
+            next_time = self._next_post_time(next_time, posts)
+            if next_time is None:
+                break
+            times.append(next_time)
+            posts.append(next_time)
+            next_time = next_time + delay
+        return times
+
+    def projected_drain_time(self, backlog_size, now=None, delay=None):
+        """
+        Get the time when the last post of a backlog would go out, see plan().
+
+        Returns:
+        datetime: Time of the last post, None if the backlog is empty or can't be scheduled
+        """
+        times = self.plan(backlog_size, now, delay)
+        if not times or len(times) < backlog_size:
+            return None
+        return times[-1]
 
     def get_random_delay(self):
         """
@@ -53,6 +294,69 @@ class Scheduler:
         """
         return random.randint(*self.delay_range)
 
+    def _next_post_time(self, now, posts):
+        """
+        Earliest time at or after `now` that is within schedule and within the budgets,
+        counting the given sorted post times.
+        """
+        next_time = now
+        for _ in range(self.PLAN_MAX_STEPS):
+            next_time = self.next_slot_start(next_time)
+            if next_time is None:
+                return None
+
+            if self.limit_per_day is not None:
+                midnight = next_time.replace(hour=0, minute=0, second=0, microsecond=0)
+                if self._count_between(posts, midnight, midnight + timedelta(days=1)) >= self.limit_per_day:
+                    next_time = midnight + timedelta(days=1)
+                    continue
+
+            if self.limit_per_slot is not None:
+                start, end = self.current_slot(next_time)
+                if self._count_between(posts, start, end) >= self.limit_per_slot:
+                    next_time = end + timedelta(microseconds=1)
+                    continue
+
+            return next_time
+        return None
+
+    @staticmethod
+    def _count_between(posts, start, end):
+        return bisect_right(posts, end) - bisect_left(posts, start)
+
+    def _build_intervals(self):
+        """
+        Rebuild the sorted, merged interval table from the configured slots.
+        """
+        intervals = []
+        for start, end in self.schedule:
+            start_seconds = self._seconds_of_day(start)
+            end_seconds = self._seconds_of_day(end)
+            if start_seconds <= end_seconds:
+                intervals.append([start_seconds, end_seconds])
+            else:
+                # Crosses midnight
+                intervals.append([start_seconds, SECONDS_PER_DAY])
+                intervals.append([0, end_seconds])
+
+        intervals.sort()
+        merged = []
+        for start_seconds, end_seconds in intervals:
+            if merged and start_seconds <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end_seconds)
+            else:
+                merged.append([start_seconds, end_seconds])
+
+        self._starts = [start_seconds for start_seconds, _ in merged]
+        self._ends = [end_seconds for _, end_seconds in merged]
+
+    @staticmethod
+    def _seconds_of_day(value):
+        """
+        Seconds since midnight of a datetime or datetime.time.
+        """
+        return value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1e6
+
     @staticmethod
     def _parse_time(time_str):
         """
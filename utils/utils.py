@@ -1,12 +1,34 @@
 from PIL import Image
-import piexif
-def resize_to_square(image_input, size=1080):
+import math
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+# EXIF orientation -> transpose that brings the image upright
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def resize_to_square(image_input, size=1080, orientation=None):
     """
     Resize an image to a square format by cropping the center.
 
+    JPEGs that are not decoded yet are decoded at a reduced scale (draft mode), the crop and
+    the resize are done by a single resize(box=...) call, and the EXIF orientation is applied
+    to the small result. A center crop commutes with rotations and flips, so the output is
+    the same as rotating the full image first.
+
     Parameters:
         image_input (str or PIL.Image): Path to the input image or already loaded PIL image.
         size (int): Desired square size (default is 1080).
+        orientation (int, optional): EXIF orientation if already known (e.g. from the metadata
+            index); read from the image otherwise.
 
     Returns:
         PIL.Image: The resized square image.
@@ -14,60 +36,81 @@ def resize_to_square(image_input, size=1080):
     """
     if isinstance(image_input, str):
         try:
-            img = Image.open(image_input).convert("RGB")
+            img = Image.open(image_input)
         except FileNotFoundError:
             raise ValueError(f"Image not found at {image_input}")
         except Exception as e:
             raise ValueError(f"Error opening image at {image_input}: {e}")
     elif isinstance(image_input, Image.Image):
-        img = image_input.convert("RGB")
+        img = image_input
     else:
         raise TypeError("image_input must be a string (path) or a PIL.Image object.")
 
-    # Extract EXIF data using piexif
-    exif_dict = piexif.load(img.info['exif']) if 'exif' in img.info else {}
-    orientation_tag = piexif.ImageIFD.Orientation
-    if orientation_tag in exif_dict.get('0th', {}):
-        orientation = exif_dict['0th'][orientation_tag]
-        if orientation == 3:
-            img = img.rotate(180, expand=True)
-        elif orientation == 6:
-            img = img.rotate(270, expand=True)
-        elif orientation == 8:
-            img = img.rotate(90, expand=True)
+    if orientation is None:
+        orientation = img.getexif().get(EXIF_ORIENTATION_TAG)
 
+    # Let the JPEG decoder skip pixels: it scales by 1/2, 1/4 or 1/8 while keeping
+    # the shorter side at least `size`
     width, height = img.size
+    scale = size / min(width, height)
+    if scale < 1:
+        img.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGB")
 
     # Calculate cropping box
-    if width != height:
-        smaller_side = min(width, height)
-        left = (width - smaller_side) / 2
-        top = (height - smaller_side) / 2
-        right = (width + smaller_side) / 2
-        bottom = (height + smaller_side) / 2
-        img = img.crop((left, top, right, bottom))
+    width, height = img.size
+    smaller_side = min(width, height)
+    left = (width - smaller_side) / 2
+    top = (height - smaller_side) / 2
+    box = (left, top, left + smaller_side, top + smaller_side)
 
-    # Resize to the desired square size
-    img = img.resize((size, size), Image.BICUBIC)
+    # Crop and resize in one pass; reducing_gap lets Pillow shrink by whole factors first
+    img = img.resize((size, size), Image.BICUBIC, box=box, reducing_gap=3.0)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    if orientation in ORIENTATION_TRANSPOSE:
+        img = img.transpose(ORIENTATION_TRANSPOSE[orientation])
 
     return img
 
 
 
+import os
+import tempfile
+
+
+def fast_temp_dir():
+    """
+    Directory for short-lived files: /dev/shm (tmpfs) when available, the system temp dir otherwise.
+    """
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
 import requests
 
-def get_coordinates_from_name(location_name):
+def get_coordinates_from_name(location_name, session=None, timeout=10):
     """
     Use a geocoding API to get the latitude and longitude of a location by name.
     Here, we use OpenStreetMap's Nominatim API.
+
+    Parameters:
+    location_name - Place name to search
+    session - Optional requests.Session to reuse connections
+    timeout - Request timeout in seconds
     """
     print(f"Search coordinates for name: {location_name}")
     HEADERS = {
         'User-Agent': 'Mozilla/5.0 (iPad; CPU OS 12_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148'
     }
-    url = f"https://nominatim.openstreetmap.org/search?q={location_name}&format=json"
+    url = "https://nominatim.openstreetmap.org/search"
+    params = {"q": location_name, "format": "json", "limit": 1}
     try:
-        response = requests.get(url, headers=HEADERS)
+        response = (session or requests).get(url, params=params, headers=HEADERS, timeout=timeout)
         if response.status_code == 200:
             results = response.json()
             if results:
@@ -83,6 +126,7 @@ def get_coordinates_from_name(location_name):
 
 import math
 import random
+import numpy as np
 
 
 def randomize_coordinates(lat, lon, range_km):
@@ -125,6 +169,50 @@ def randomize_coordinates(lat, lon, range_km):
     return new_lat, new_lon
 
 
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_many(lat1, lon1, lat2, lon2):
+    """
+    Vectorized great-circle distance. Arguments are scalars or array-likes and broadcast
+    against each other, e.g. one point against arrays of candidates.
+    Parameters:
+    lat1, lon1 - Latitude and Longitude of point(s) 1 in decimal degrees
+    lat2, lon2 - Latitude and Longitude of point(s) 2 in decimal degrees
+    Returns:
+    numpy.ndarray of distances in kilometers
+    """
+    lat1 = np.radians(np.asarray(lat1, dtype=np.float64))
+    lon1 = np.radians(np.asarray(lon1, dtype=np.float64))
+    lat2 = np.radians(np.asarray(lat2, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lon2, dtype=np.float64))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_k(lat, lon, lats, lons, k=1):
+    """
+    Find the k points closest to (lat, lon).
+    Parameters:
+    lat, lon - The query point in decimal degrees
+    lats, lons - Array-likes with the candidate points
+    k - Number of neighbours
+    Returns:
+    (indices, distances) numpy arrays sorted by distance, at most k long
+    """
+    distances = haversine_many(lat, lon, lats, lons)
+    if distances.size == 0:
+        return np.empty(0, dtype=np.intp), distances
+    k = min(k, distances.size)
+    if k < distances.size:
+        indices = np.argpartition(distances, k - 1)[:k]
+    else:
+        indices = np.arange(distances.size)
+    indices = indices[np.argsort(distances[indices])]
+    return indices, distances[indices]
+
+
 def haversine(lat1, lon1, lat2, lon2):
     """
     Calculate the great-circle distance between two points on the Earth.
@@ -134,13 +222,11 @@ def haversine(lat1, lon1, lat2, lon2):
     Returns:
     Distance in kilometers
     """
-    R = 6371  # Radius of the Earth in km
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (math.sin(dlat / 2) ** 2 +
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+    # Plain math for one pair: numpy costs more than the formula itself here, see haversine_many
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, max(0.0, a))))
 
 
 def remove_first_and_last_from_str(input_string):